@@ -9,6 +9,9 @@ SQL_DB = os.getenv("ZP_SQL_DB")
 SQL_USER = os.getenv("ZP_SQL_USER")
 SQL_PASS = os.getenv("ZP_SQL_PASS")
 SQL_DRIVER = os.getenv("ZP_SQL_DRIVER")
+# Consulta barata que devuelve un sello de versión de los datos
+# (p.ej. SELECT MAX(UPDDATTIM_0) FROM ZTPROVEART); vacío = sin sello
+DATA_VERSION_SQL = os.getenv("ZP_DATA_VERSION_SQL", "").strip()
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 EXPORT_DIR = Path(os.getenv("ZPROVEART_EXPORT_DIR", "exports"))
\ No newline at end of file
@@ -0,0 +1,226 @@
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from functools import lru_cache
+
+logger = logging.getLogger("zproveart.sql")
+
+# Umbral para loguear una consulta como lenta (execute + fetch)
+SLOW_QUERY_MS = float(os.getenv("ZPROVEART_SLOW_QUERY_MS", "500"))
+# Ventana de la tabla top-N: se guardan la ventana actual y la anterior
+STATS_WINDOW_S = int(os.getenv("ZPROVEART_QUERY_STATS_WINDOW_S", "3600"))
+MAX_FINGERPRINTS = 500
+
+_RE_COMMENT = re.compile(r"--[^\n]*|/\*.*?\*/", re.S)
+_RE_STRING = re.compile(r"N?'(?:[^']|'')*'")
+_RE_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_RE_IN_LIST = re.compile(r"\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)", re.I)
+_RE_SPACES = re.compile(r"\s+")
+
+
+def normalize_sql(sql: str) -> str:
+    """
+    Forma canónica de la sentencia: sin comentarios ni literales y con las
+    listas IN (?, ?, ...) colapsadas, para que "familias 02,12,31" y
+    "familia 05" den la misma huella.
+    """
+    s = _RE_COMMENT.sub(" ", sql)
+    s = _RE_STRING.sub("?", s)
+    s = _RE_NUMBER.sub("?", s)
+    s = _RE_SPACES.sub(" ", s).strip()
+    s = _RE_IN_LIST.sub("IN (?...)", s)
+    return s
+
+
+@lru_cache(maxsize=512)
+def fingerprint(sql: str) -> tuple[str, str]:
+    # Las sentencias se repiten (mismas formas de filtro): se normaliza una vez
+    norm = normalize_sql(sql)
+    return hashlib.sha1(norm.encode("utf-8")).hexdigest()[:12], norm
+
+
+def summarize_params(params, max_items: int = 8, max_len: int = 40) -> str:
+    if not params:
+        return "[]"
+    params = list(params)
+    shown = []
+    for p in params[:max_items]:
+        r = repr(p)
+        shown.append(r if len(r) <= max_len else r[: max_len - 3] + "...")
+    more = f", ... +{len(params) - max_items}" if len(params) > max_items else ""
+    return f"[{', '.join(shown)}{more}] ({len(params)} params)"
+
+
+class _Window:
+    def __init__(self, started: float):
+        self.started = started
+        self.stats: dict[str, dict] = {}
+
+
+_lock = threading.Lock()
+_current = _Window(time.time())
+_previous: _Window | None = None
+
+
+def _rotate(now: float) -> None:
+    # Se llama con _lock tomado
+    global _current, _previous
+    if now - _current.started >= STATS_WINDOW_S:
+        _previous = _current
+        _current = _Window(now)
+
+
+def record_query(
+    sql: str,
+    params,
+    caller: str,
+    exec_ms: float,
+    fetch_ms: float,
+    rows: int,
+) -> None:
+    fp, norm = fingerprint(sql)
+    total_ms = exec_ms + fetch_ms
+    now = time.time()
+
+    with _lock:
+        _rotate(now)
+        st = _current.stats.get(fp)
+        if st is None:
+            if len(_current.stats) >= MAX_FINGERPRINTS:
+                # tabla llena: se descarta la huella con menos tiempo acumulado
+                victim = min(_current.stats, key=lambda k: _current.stats[k]["total_ms"])
+                del _current.stats[victim]
+            st = _current.stats[fp] = {
+                "fingerprint": fp,
+                "sql": norm,
+                "calls": 0,
+                "total_ms": 0.0,
+                "exec_ms": 0.0,
+                "fetch_ms": 0.0,
+                "max_ms": 0.0,
+                "rows": 0,
+                "slow": 0,
+                "callers": {},
+                "max_params": "",
+            }
+        st["calls"] += 1
+        st["total_ms"] += total_ms
+        st["exec_ms"] += exec_ms
+        st["fetch_ms"] += fetch_ms
+        st["rows"] += rows
+        st["callers"][caller] = st["callers"].get(caller, 0) + 1
+        if total_ms >= st["max_ms"]:
+            st["max_ms"] = total_ms
+            st["max_params"] = summarize_params(params)
+        if total_ms >= SLOW_QUERY_MS:
+            st["slow"] += 1
+
+    if total_ms >= SLOW_QUERY_MS:
+        logger.warning(
+            "Consulta lenta %s en %s: %.0f ms (execute %.0f ms, fetch %.0f ms), %d filas, params=%s | %s",
+            fp, caller, total_ms, exec_ms, fetch_ms, rows, summarize_params(params), norm[:300],
+        )
+
+
+def top_queries(n: int = 20, order_by: str = "total_ms") -> list[dict]:
+    """Top-N huellas (ventana actual + anterior) ordenadas por `order_by`."""
+    with _lock:
+        _rotate(time.time())
+        windows = [w for w in (_previous, _current) if w is not None]
+        merged: dict[str, dict] = {}
+        for w in windows:
+            for fp, st in w.stats.items():
+                m = merged.get(fp)
+                if m is None:
+                    merged[fp] = {**st, "callers": dict(st["callers"])}
+                    continue
+                for k in ("calls", "total_ms", "exec_ms", "fetch_ms", "rows", "slow"):
+                    m[k] += st[k]
+                if st["max_ms"] >= m["max_ms"]:
+                    m["max_ms"] = st["max_ms"]
+                    m["max_params"] = st["max_params"]
+                for c, k in st["callers"].items():
+                    m["callers"][c] = m["callers"].get(c, 0) + k
+
+    out = sorted(merged.values(), key=lambda st: st.get(order_by, 0), reverse=True)[: max(1, n)]
+    for st in out:
+        st["avg_ms"] = st["total_ms"] / st["calls"] if st["calls"] else 0.0
+        for k in ("total_ms", "exec_ms", "fetch_ms", "max_ms", "avg_ms"):
+            st[k] = round(st[k], 1)
+    return out
+
+
+def reset() -> None:
+    global _current, _previous
+    with _lock:
+        _current = _Window(time.time())
+        _previous = None
+
+
+class TracedCursor:
+    """
+    Envuelve un cursor de pyodbc: mide execute y fetch por separado y, al
+    terminar de leer el resultado (o en el siguiente execute / close),
+    registra la consulta en la tabla top-N y en el log si es lenta.
+    """
+
+    def __init__(self, cursor):
+        self._cur = cursor
+        self._pending: list | None = None  # [sql, params, caller, exec_ms, fetch_ms, rows]
+
+    def __getattr__(self, name):
+        return getattr(self._cur, name)
+
+    def _finish(self) -> None:
+        if self._pending is not None:
+            sql, params, caller, exec_ms, fetch_ms, rows = self._pending
+            self._pending = None
+            record_query(sql, params, caller, exec_ms, fetch_ms, rows)
+
+    def execute(self, sql: str, *params):
+        self._finish()
+        caller = sys._getframe(1).f_code.co_name
+        flat = params[0] if len(params) == 1 and isinstance(params[0], (list, tuple)) else params
+        t0 = time.perf_counter()
+        try:
+            self._cur.execute(sql, *params)
+        except Exception:
+            record_query(sql, flat, caller, (time.perf_counter() - t0) * 1000.0, 0.0, 0)
+            raise
+        self._pending = [sql, flat, caller, (time.perf_counter() - t0) * 1000.0, 0.0, 0]
+        return self
+
+    def _fetched(self, t0: float, n: int, done: bool) -> None:
+        if self._pending is not None:
+            self._pending[4] += (time.perf_counter() - t0) * 1000.0
+            self._pending[5] += n
+            if done:
+                self._finish()
+
+    def fetchone(self):
+        t0 = time.perf_counter()
+        row = self._cur.fetchone()
+        self._fetched(t0, 0 if row is None else 1, done=True)
+        return row
+
+    def fetchall(self):
+        t0 = time.perf_counter()
+        rows = self._cur.fetchall()
+        self._fetched(t0, len(rows), done=True)
+        return rows
+
+    def fetchmany(self, size: int = 1):
+        t0 = time.perf_counter()
+        rows = self._cur.fetchmany(size)
+        self._fetched(t0, len(rows), done=len(rows) < size)
+        return rows
+
+    def close(self) -> None:
+        self._finish()
+        self._cur.close()
@@ -1,9 +1,9 @@
 from __future__ import annotations
 
-import time
+import hashlib
 from datetime import date
 import pyodbc
-from typing import Optional
+from typing import Iterator, Optional
 
 pyodbc.pooling = True
 
@@ -13,7 +13,11 @@ from app.config import (
     SQL_USER,
     SQL_PASS,
     SQL_DRIVER,
+    DATA_VERSION_SQL,
 )
+from app.db.query_log import TracedCursor
+from app.services.timing import span, timed
+from app.services.ttl_cache import TTLCache
 
 def _sanitize_years(years: list[int] | None) -> list[int]:
     """
@@ -61,9 +65,14 @@ def get_connection():
     return pyodbc.connect(conn_str, timeout=10, autocommit=True)
 
 
+def _cursor(conn) -> TracedCursor:
+    # Todas las consultas pasan por aquí: tiempos, huella y log de lentas
+    return TracedCursor(conn.cursor())
+
+
 def test_connection():
     with get_connection() as conn:
-        cursor = conn.cursor()
+        cursor = _cursor(conn)
         cursor.execute("SELECT 1")
         return cursor.fetchone()[0]
 
@@ -145,6 +154,7 @@ def _add_subfams_by_fam_filter(
     return sql, params
 
 
+@timed("db.count_products")
 def count_products(
     families: list[str] | None = None,
     subfams_by_fam: dict[str, list[str]] | None = None,
@@ -208,11 +218,12 @@ def count_products(
         params.append(date_to)
 
     with get_connection() as conn:
-        cur = conn.cursor()
+        cur = _cursor(conn)
         cur.execute(sql, params)
         return int(cur.fetchone()[0])
 
 
+@timed("db.get_products")
 def get_products(
     page: int,
     page_size: int,
@@ -396,12 +407,13 @@ def get_products(
     params.extend(years)
 
     with get_connection() as conn:
-        cur = conn.cursor()
+        cur = _cursor(conn)
         cur.execute(sql, params)
         cols = [c[0] for c in cur.description]
         return [dict(zip(cols, row)) for row in cur.fetchall()]
 
 
+@timed("db.get_sales_12m")
 def get_sales_12m(itmrefs: list[str]) -> list[dict]:
     if not itmrefs:
         return []
@@ -429,13 +441,14 @@ def get_sales_12m(itmrefs: list[str]) -> list[dict]:
     """
 
     with get_connection() as conn:
-        cur = conn.cursor()
+        cur = _cursor(conn)
         cur.execute(sql, itmrefs)
         cols = [c[0] for c in cur.description]
         return [dict(zip(cols, row)) for row in cur.fetchall()]
 
 
 # BLOQUE DE OBTENER FAMILIAS CON CACHÉ
+@timed("db.get_fams_distinct")
 def _get_fams_distinct() -> list[dict]:
     sql = """
     SELECT COD_FAM_0, DES_FAM_0
@@ -449,30 +462,24 @@ def _get_fams_distinct() -> list[dict]:
         COD_FAM_0;
     """
     with get_connection() as conn:
-        cur = conn.cursor()
+        cur = _cursor(conn)
         cur.execute(sql)
         cols = [c[0] for c in cur.description]
         return [dict(zip(cols, row)) for row in cur.fetchall()]
 
 
-_FAMS_CACHE = {"ts": 0.0, "data": []}
 _FAMS_TTL = 60 * 10  # 10 minutos en caché
+_FAMS_CACHE = TTLCache("fams", ttl=_FAMS_TTL, maxsize=1)
 
 
 def get_fams_cached() -> list[dict]:
-    now = time.time()
-    if _FAMS_CACHE["data"] and (now - _FAMS_CACHE["ts"]) < _FAMS_TTL:
-        return _FAMS_CACHE["data"]
-
-    data = _get_fams_distinct()
-    _FAMS_CACHE["data"] = data
-    _FAMS_CACHE["ts"] = now
-    return data
+    return _FAMS_CACHE.get("all", _get_fams_distinct)
 
 
-def _get_subfams_by_fam(cod_fam: str) -> list[dict]:
+@timed("db.get_subfams_all")
+def _get_subfams_all() -> dict[str, list[dict]]:
     """
-    Devuelve subfamilias de una familia con su descripción.
+    Carga de una vez el mapa familia -> subfamilias (con descripción).
     La descripción SIEMPRE cuelga de IDENT1_0 = '21' en ATABDIV.
     """
     IDENT1_FIXED = "21"
@@ -480,13 +487,16 @@ def _get_subfams_by_fam(cod_fam: str) -> list[dict]:
     sql = """
     ;WITH sub AS (
         SELECT DISTINCT
+            LTRIM(RTRIM(ZTP.TSICOD_0_0)) AS COD_FAM,
             RIGHT('0000' + LTRIM(RTRIM(ZTP.TSICOD_1_0)), 4) AS COD_SUBFAM
         FROM ZTPROVEART AS ZTP
-        WHERE ZTP.TSICOD_0_0 = ?
+        WHERE ZTP.TSICOD_0_0 IS NOT NULL
+          AND LTRIM(RTRIM(ZTP.TSICOD_0_0)) <> ''
           AND ZTP.TSICOD_1_0 IS NOT NULL
           AND LTRIM(RTRIM(ZTP.TSICOD_1_0)) <> ''
     )
     SELECT
+        sub.COD_FAM,
         sub.COD_SUBFAM,
         ATX.TEXTE_0 AS DES_SUBFAM
     FROM sub
@@ -497,23 +507,30 @@ def _get_subfams_by_fam(cod_fam: str) -> list[dict]:
      AND ATX.IDENT1_0 = ?
      AND ATX.IDENT2_0 = sub.COD_SUBFAM
     ORDER BY
+        sub.COD_FAM,
         CASE WHEN TRY_CONVERT(INT, sub.COD_SUBFAM) IS NULL THEN 1 ELSE 0 END,
         TRY_CONVERT(INT, sub.COD_SUBFAM),
         sub.COD_SUBFAM;
     """
 
+    out: dict[str, list[dict]] = {}
     with get_connection() as conn:
-        cur = conn.cursor()
-        # cod_fam → filtra ZTPROVEART
-        # IDENT1_FIXED → ATABDIV 
-        cur.execute(sql, [cod_fam, IDENT1_FIXED])
-        cols = [c[0] for c in cur.description]
-        return [dict(zip(cols, row)) for row in cur.fetchall()]
-
+        cur = _cursor(conn)
+        # IDENT1_FIXED → ATABDIV
+        cur.execute(sql, [IDENT1_FIXED])
+        for cod_fam, cod_subfam, des_subfam in cur.fetchall():
+            out.setdefault(cod_fam, []).append(
+                {"COD_SUBFAM": cod_subfam, "DES_SUBFAM": des_subfam}
+            )
+    return out
 
 
-_SUBFAMS_CACHE: dict[str, dict] = {}
 _SUBFAMS_TTL = 60 * 10
+_SUBFAMS_CACHE = TTLCache("subfams", ttl=_SUBFAMS_TTL, maxsize=1)
+
+
+def get_subfams_map_cached() -> dict[str, list[dict]]:
+    return _SUBFAMS_CACHE.get("all", _get_subfams_all)
 
 
 def get_subfams_cached(cod_fam: str) -> list[dict]:
@@ -521,41 +538,57 @@ def get_subfams_cached(cod_fam: str) -> list[dict]:
     if not cod_fam:
         return []
 
-    now = time.time()
-    entry = _SUBFAMS_CACHE.get(cod_fam)
-    if entry and entry["data"] and (now - entry["ts"]) < _SUBFAMS_TTL:
-        return entry["data"]
+    return get_subfams_map_cached().get(cod_fam, [])
 
-    data = _get_subfams_by_fam(cod_fam)
-    _SUBFAMS_CACHE[cod_fam] = {"ts": now, "data": data}
-    return data
 
+def get_subfams_batch_cached(cod_fams: list[str]) -> dict[str, list[dict]]:
+    """Subfamilias de varias familias en una sola llamada (mismo orden de entrada)."""
+    submap = get_subfams_map_cached()
+    return {fam: submap.get(fam, []) for fam in _sanitize_list(cod_fams)}
 
-def get_eta_rows(itmrefs: list[str]) -> list[dict]:
+
+@timed("db.get_eta_rows")
+def get_eta_rows(itmrefs: list[str], max_per_item: int = 3) -> list[dict]:
+    """
+    Fechas previstas: solo las `max_per_item` primeras de cada artículo,
+    con CNT_0 = total de fechas del artículo (para el "+N más…").
+    """
     if not itmrefs:
         return []
 
     placeholders = ",".join("?" for _ in itmrefs)
 
     sql = f"""
+    ;WITH eta AS (
+        SELECT
+            ITMREF_0,
+            FECHA_0,
+            QTY_0,
+            VCR_0,
+            ROW_NUMBER() OVER (PARTITION BY ITMREF_0 ORDER BY FECHA_0 ASC) AS RN_0,
+            COUNT(*) OVER (PARTITION BY ITMREF_0) AS CNT_0
+        FROM ZPROART3
+        WHERE ITMREF_0 IN ({placeholders})
+          AND FECHA_0 IS NOT NULL
+    )
     SELECT
         ITMREF_0,
         FECHA_0,
         QTY_0,
-        VCR_0
-    FROM ZPROART3
-    WHERE ITMREF_0 IN ({placeholders})
-      AND FECHA_0 IS NOT NULL
+        VCR_0,
+        CNT_0
+    FROM eta
+    WHERE RN_0 <= ?
     ORDER BY ITMREF_0, FECHA_0 ASC;
     """
 
     with get_connection() as conn:
-        cur = conn.cursor()
-        cur.execute(sql, itmrefs)
+        cur = _cursor(conn)
+        cur.execute(sql, [*itmrefs, max(1, int(max_per_item))])
         cols = [c[0] for c in cur.description]
         return [dict(zip(cols, row)) for row in cur.fetchall()]
 
-def get_products_all(
+def _build_products_all_sql(
     families: Optional[list[str]] = None,
     subfams_by_fam: dict[str, list[str]] | None = None,
     date_from: Optional[date] = None,
@@ -568,11 +601,10 @@ def get_products_all(
     art_to: Optional[str] = None,
     years: list[int] | None = None,
     max_rows: int = 5000,  # safety (ajusta)
-) -> list[dict]:
+) -> tuple[str, list]:
     """
-    Listado SIN paginación desde ZTPROVEART (para PDF).
-    max_rows es un cinturón de seguridad.
-    ZTCOMVEN se une SUMADO por ITMREF_0 para evitar duplicados cuando usamos varios años.
+    SQL + params del listado SIN paginación (compartido por get_products_all
+    e iter_products_all).
     """
 
     fams = _sanitize_list(families)
@@ -729,12 +761,97 @@ def get_products_all(
 
     params.extend(years)
 
+    return sql, params
+
+
+@timed("db.get_products_all")
+def get_products_all(
+    families: Optional[list[str]] = None,
+    subfams_by_fam: dict[str, list[str]] | None = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    supp_from: Optional[str] = None,
+    supp_to: Optional[str] = None,
+    comp_from: Optional[str] = None,
+    comp_to: Optional[str] = None,
+    art_from: Optional[str] = None,
+    art_to: Optional[str] = None,
+    years: list[int] | None = None,
+    max_rows: int = 5000,  # safety (ajusta)
+) -> list[dict]:
+    """
+    Listado SIN paginación desde ZTPROVEART (para PDF).
+    max_rows es un cinturón de seguridad.
+    ZTCOMVEN se une SUMADO por ITMREF_0 para evitar duplicados cuando usamos varios años.
+    """
+    sql, params = _build_products_all_sql(
+        families=families,
+        subfams_by_fam=subfams_by_fam,
+        date_from=date_from,
+        date_to=date_to,
+        supp_from=supp_from,
+        supp_to=supp_to,
+        comp_from=comp_from,
+        comp_to=comp_to,
+        art_from=art_from,
+        art_to=art_to,
+        years=years,
+        max_rows=max_rows,
+    )
+
     with get_connection() as conn:
-        cur = conn.cursor()
+        cur = _cursor(conn)
         cur.execute(sql, params)
         cols = [c[0] for c in cur.description]
         return [dict(zip(cols, row)) for row in cur.fetchall()]
 
+
+def iter_products_all(
+    families: Optional[list[str]] = None,
+    subfams_by_fam: dict[str, list[str]] | None = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    supp_from: Optional[str] = None,
+    supp_to: Optional[str] = None,
+    comp_from: Optional[str] = None,
+    comp_to: Optional[str] = None,
+    art_from: Optional[str] = None,
+    art_to: Optional[str] = None,
+    years: list[int] | None = None,
+    max_rows: int = 5000,  # safety (ajusta)
+    batch_size: int = 1000,
+) -> Iterator[list[dict]]:
+    """
+    Igual que get_products_all pero en lotes de `batch_size` filas leídos del
+    cursor con fetchmany: memoria constante aunque el listado sea grande.
+    """
+    sql, params = _build_products_all_sql(
+        families=families,
+        subfams_by_fam=subfams_by_fam,
+        date_from=date_from,
+        date_to=date_to,
+        supp_from=supp_from,
+        supp_to=supp_to,
+        comp_from=comp_from,
+        comp_to=comp_to,
+        art_from=art_from,
+        art_to=art_to,
+        years=years,
+        max_rows=max_rows,
+    )
+
+    with get_connection() as conn:
+        cur = _cursor(conn)
+        with span("db.iter_products_all"):
+            cur.execute(sql, params)
+        cols = [c[0] for c in cur.description]
+        while True:
+            rows = cur.fetchmany(batch_size)
+            if not rows:
+                break
+            yield [dict(zip(cols, row)) for row in rows]
+
+@timed("db.get_buyers_distinct")
 def get_buyers_distinct() -> list[dict]:
     sql = """
     SELECT DISTINCT LTRIM(RTRIM(COD_COM_0)) AS COD_COM_0
@@ -744,11 +861,59 @@ def get_buyers_distinct() -> list[dict]:
     ORDER BY LTRIM(RTRIM(COD_COM_0));
     """
     with get_connection() as conn:
-        cur = conn.cursor()
+        cur = _cursor(conn)
         cur.execute(sql)
         cols = [c[0] for c in cur.description]
         return [dict(zip(cols, row)) for row in cur.fetchall()]
 
+
+_BUYERS_TTL = 60 * 10
+_BUYERS_CACHE = TTLCache("buyers", ttl=_BUYERS_TTL, maxsize=1)
+
+
+def _load_buyers_with_etag() -> tuple[list[dict], str]:
+    data = get_buyers_distinct()
+    raw = "\n".join(str(r.get("COD_COM_0") or "") for r in data)
+    etag = '"' + hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16] + '"'
+    return data, etag
+
+
+def get_buyers_cached() -> tuple[list[dict], str]:
+    """
+    Compradores distintos con caché en memoria.
+    Devuelve (items, etag); el etag solo cambia si cambia la lista.
+    """
+    return _BUYERS_CACHE.get("all", _load_buyers_with_etag)
+
+
+_DATA_VERSION_TTL = 60
+_DATA_VERSION_CACHE = TTLCache("data_version", ttl=_DATA_VERSION_TTL, maxsize=1)
+
+
+@timed("db.get_data_version")
+def _get_data_version() -> str | None:
+    with get_connection() as conn:
+        cur = _cursor(conn)
+        cur.execute(DATA_VERSION_SQL)
+        row = cur.fetchone()
+        return None if row is None else "|".join(str(v) for v in row)
+
+
+def get_data_version_cached() -> str | None:
+    """
+    Sello de versión de los datos (ZP_DATA_VERSION_SQL), refrescado cada
+    minuto. None si no está configurado.
+    """
+    if not DATA_VERSION_SQL:
+        return None
+    return _DATA_VERSION_CACHE.get("v", _get_data_version)
+
+
+def cache_stats() -> list[dict]:
+    """Contadores de las cachés de lookups (para diagnóstico)."""
+    return [c.stats() for c in (_FAMS_CACHE, _SUBFAMS_CACHE, _BUYERS_CACHE, _DATA_VERSION_CACHE)]
+
+@timed("db.search_suppliers")
 def search_suppliers(q: str, limit: int = 60) -> list[dict]:
     q = (q or "").strip()
     if not q:
@@ -770,7 +935,7 @@ def search_suppliers(q: str, limit: int = 60) -> list[dict]:
     like_name = f"%{q}%"
 
     with get_connection() as conn:
-        cur = conn.cursor()
+        cur = _cursor(conn)
         cur.execute(sql, [limit, like_code, like_name, like_code])
         cols = [c[0] for c in cur.description]
         return [dict(zip(cols, row)) for row in cur.fetchall()]
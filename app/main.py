@@ -1,5 +1,5 @@
 from fastapi import FastAPI, Request, Query, Response, HTTPException, status, APIRouter
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, JSONResponse, FileResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles
 from urllib.parse import quote
@@ -10,44 +10,86 @@ from app.db.sqlserver import (
     count_products,
     get_fams_cached,
     get_subfams_cached,
+    get_subfams_batch_cached,
+    get_subfams_map_cached,
     get_eta_rows,
     get_products_all,
-    get_buyers_distinct,
+    iter_products_all,
+    get_buyers_cached,
     search_suppliers,
+    cache_stats,
+    test_connection,
+    get_data_version_cached,
 )
-from app.services.product_formatter import format_products
+from app.db import query_log
+from app.services.product_formatter import format_products, product_cache_stats
+from app.services.card_cache import card_cache_stats, render_cards
 from app.services.filters import parse_date
-from app.services.excel_exporter import ExcelExporter, append_row_daily
+from app.services.excel_exporter import (
+    ExcelExporter,
+    append_rows_daily,
+    make_row,
+    materialize_if_stale,
+    replay_spilled,
+    spill_rows,
+)
+from app.services.submission_queue import SubmissionQueue
+from app.services.xlsx_export import iter_products_xlsx
+from app.services import metrics, timing
+from app.services.timing import span
+from app.services.warmup import WarmUp
+from app.services import pdf_cache, pdf_engines, pdf_tuning
+from starlette.concurrency import run_in_threadpool
 from app.config import EXPORT_DIR
 from app.routes import fotos
-from playwright.sync_api import sync_playwright
 from pathlib import Path
 import math
 
 from datetime import date
 from io import BytesIO
+import tempfile
 
 import os
+import time
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from fastapi import Form
 from fastapi.responses import RedirectResponse
 from starlette.middleware.sessions import SessionMiddleware
 import json
-from passlib.context import CryptContext
+import hashlib
+import hmac
+from functools import lru_cache
+from itertools import groupby
+from collections import deque
 
-PdfMerger = None
-PdfWriter = None
-_pypdf_import_error = None
+# playwright, pypdf, passlib y openpyxl se importan al usarse (o en el
+# warm-up de arranque), no al cargar el módulo
+
+
+@lru_cache(maxsize=1)
+def _pypdf_classes():
+    """(PdfMerger, PdfWriter, error): uno de los dos o el error de importación."""
+    PdfMerger = None
+    PdfWriter = None
+    _pypdf_import_error = None
 
-try:
-    # pypdf moderno (ojo: PdfMerger ya no existe en 6.x, esto fallará y cae al fallback)
-    from pypdf import PdfMerger  # type: ignore
-except Exception as e:
-    _pypdf_import_error = e
     try:
-        # fallback: PdfWriter existe
-        from pypdf import PdfWriter  # type: ignore
-    except Exception as e2:
-        _pypdf_import_error = e2
+        # pypdf moderno (ojo: PdfMerger ya no existe en 6.x, esto fallará y cae al fallback)
+        from pypdf import PdfMerger  # type: ignore
+    except Exception as e:
+        _pypdf_import_error = e
+        try:
+            # fallback: PdfWriter existe
+            from pypdf import PdfWriter  # type: ignore
+        except Exception as e2:
+            _pypdf_import_error = e2
+
+    return PdfMerger, PdfWriter, _pypdf_import_error
+
+logger = logging.getLogger("zproveart")
 
 app = FastAPI()
 app.add_middleware(
@@ -56,13 +98,67 @@ app.add_middleware(
     same_site="lax",
     https_only=False,
 )
+
+
+@app.middleware("http")
+async def server_timing(request: Request, call_next):
+    # Spans de BD / formato / render de esta petición -> cabecera Server-Timing
+    spans, token = timing.start_request()
+    t0 = time.perf_counter()
+    try:
+        response = await call_next(request)
+    finally:
+        timing.end_request(token)
+    total_ms = (time.perf_counter() - t0) * 1000.0
+
+    if not request.url.path.startswith("/static"):
+        route = request.scope.get("route")
+        route_path = route.path if route else "other"
+        timing.record(f"route.{route_path}", total_ms)
+        metrics.inc("http_requests_total", route=route_path, status=response.status_code)
+        response.headers["Server-Timing"] = timing.server_timing_header(spans, total_ms)
+    return response
+
+
 app.mount("/static", StaticFiles(directory="app/static"), name="static")
 templates = Jinja2Templates(directory="app/templates")
+
+# Plantillas compiladas en disco: un worker nuevo no recompila las 235 líneas
+# de la tarjeta (el fichero se invalida solo si cambia la plantilla)
+JINJA_CACHE_DIR = Path(os.getenv("ZPROVEART_JINJA_CACHE_DIR", Path(tempfile.gettempdir()) / "zproveart_jinja"))
+try:
+    from jinja2 import FileSystemBytecodeCache
+
+    JINJA_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    templates.env.bytecode_cache = FileSystemBytecodeCache(str(JINJA_CACHE_DIR))
+except OSError as e:
+    logger.warning("Sin caché de bytecode de Jinja (%s): %r", JINJA_CACHE_DIR, e)
 app.include_router(fotos.router)
 
 exporter = ExcelExporter(EXPORT_DIR)
+EXPORT_XLSX_EVERY_S = int(os.getenv("ZPROVEART_EXPORT_XLSX_EVERY_S", "60"))
+
+# Envíos "Guardar": cola write-behind, se escriben por lotes
+# SUBMIT_ACK = "durable" -> 204 cuando la fila ya está en disco
+# SUBMIT_ACK = "queued"  -> 202 nada más encolar; como nadie espera la
+#   escritura, un lote que sigue fallando tras los reintentos se aparca en
+#   disco (spill_rows) y el bucle de materialización lo pasa al diario.
+SUBMIT_ACK = os.getenv("ZPROVEART_SUBMIT_ACK", "durable").strip().lower()
+submit_queue = SubmissionQueue(
+    lambda rows: append_rows_daily(exporter, rows),
+    max_batch=int(os.getenv("ZPROVEART_SUBMIT_BATCH", "200")),
+    max_delay_ms=int(os.getenv("ZPROVEART_SUBMIT_DELAY_MS", "250")),
+    retries=int(os.getenv("ZPROVEART_SUBMIT_RETRIES", "4")),
+    spill=(lambda rows: spill_rows(exporter, rows)) if SUBMIT_ACK == "queued" else None,
+)
+
+@lru_cache(maxsize=1)
+def _pwd_context():
+    from passlib.context import CryptContext
+
+    return CryptContext(schemes=["pbkdf2_sha256"], deprecated="auto")
+
 
-pwd_context = CryptContext(schemes=["pbkdf2_sha256"], deprecated="auto")
 USERS_FILE = Path(__file__).resolve().parent / "data" / "users.json"
 
 def require_login(request: Request, *, redirect: bool = True) -> dict:
@@ -81,16 +177,36 @@ def require_login(request: Request, *, redirect: bool = True) -> dict:
     # para endpoints tipo API
     raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated")
 
+# Usuarios en memoria; se relee users.json solo si cambia (mtime/tamaño)
+_users_cache: dict = {"sig": None, "data": {}}
+_users_lock = threading.Lock()
+
+# Verificación pbkdf2 fuera del event loop, con tope de hilos simultáneos
+LOGIN_VERIFY_WORKERS = int(os.getenv("ZPROVEART_LOGIN_WORKERS", "2"))
+_login_pool = ThreadPoolExecutor(max_workers=LOGIN_VERIFY_WORKERS, thread_name_prefix="login")
+
+
 def load_users() -> dict[str, dict]:
-    if not USERS_FILE.exists():
+    try:
+        st = USERS_FILE.stat()
+    except FileNotFoundError:
         return {}
-    data = json.loads(USERS_FILE.read_text("utf-8"))
-    out: dict[str, dict] = {}
-    for u in data.get("users", []):
-        name = (u.get("username") or "").strip()
-        if name:
-            out[name] = u
-    return out
+    sig = (st.st_mtime_ns, st.st_size)
+
+    with _users_lock:
+        if _users_cache["sig"] == sig:
+            return _users_cache["data"]
+
+        data = json.loads(USERS_FILE.read_text("utf-8"))
+        out: dict[str, dict] = {}
+        for u in data.get("users", []):
+            name = (u.get("username") or "").strip()
+            if name:
+                out[name] = u
+
+        _users_cache["sig"] = sig
+        _users_cache["data"] = out
+        return out
 
 def verify_user(username: str, password: str) -> bool:
     users = load_users()
@@ -100,7 +216,12 @@ def verify_user(username: str, password: str) -> bool:
     ph = (u.get("password_hash") or "").strip()
     if not ph:
         return False
-    return pwd_context.verify(password, ph)
+    return _pwd_context().verify(password, ph)
+
+
+async def verify_user_async(username: str, password: str) -> bool:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_login_pool, verify_user, username, password)
 
 
 def _default_years() -> list[int]:
@@ -132,7 +253,7 @@ async def login_post(
     username = (username or "").strip()
     next_url = next or "/zproveart"
 
-    if verify_user(username, password):
+    if await verify_user_async(username, password):
         request.session["user"] = {"username": username}
         return RedirectResponse(url=next_url, status_code=303)
 
@@ -159,6 +280,189 @@ def api_subfamilies(family: str):
     return {"family": family, "subfamilies": get_subfams_cached(family)}
 
 
+# Subfamilias de varias familias en una sola petición
+@app.get("/api/zproveart/subfamilies/batch")
+def api_subfamilies_batch(family: list[str] = Query(default=[])):
+    return {"subfamilies": get_subfams_batch_cached(family)}
+
+
+def _cache_metrics() -> list[tuple[str, dict, float]]:
+    out = []
+    for st in [*cache_stats(), product_cache_stats(), card_cache_stats()]:
+        labels = {"cache": st["name"]}
+        out.append(("cache_entries", labels, st["size"]))
+        for k in ("hits", "stale_hits", "misses", "refreshes", "evictions", "errors"):
+            out.append((f"cache_{k}_total", labels, st[k]))
+    pdf_st = pdf_cache.stats()
+    out.append(("pdf_cache_files", {}, pdf_st["files"]))
+    out.append(("pdf_cache_bytes", {}, pdf_st["bytes"]))
+    for engine, size in pdf_tuning.current_sizes().items():
+        out.append(("pdf_chunk_size", {"engine": engine}, size))
+    out.append(("submit_queue_depth", {}, submit_queue.depth()))
+    out.append(("submit_queue_written_rows_total", {}, submit_queue.written_rows))
+    out.append(("submit_queue_failed_batches_total", {}, submit_queue.failed_batches))
+    out.append(("submit_queue_retried_batches_total", {}, submit_queue.retried_batches))
+    out.append(("submit_queue_spilled_rows_total", {}, submit_queue.spilled_rows))
+    return out
+
+
+metrics.register_collector(_cache_metrics)
+# Con token: Prometheus entra con "Authorization: Bearer <token>" sin sesión.
+# Sin token: solo administradores con sesión (ZPROVEART_ADMIN_USERS).
+METRICS_TOKEN = os.getenv("ZPROVEART_METRICS_TOKEN", "")
+
+
+async def _metrics_flush_loop():
+    # Cada worker deja su snapshot en disco para que /metrics vea a todos
+    while True:
+        try:
+            await run_in_threadpool(metrics.write_snapshot)
+        except Exception as e:
+            logger.warning("Error guardando métricas: %r", e)
+        await asyncio.sleep(metrics.METRICS_FLUSH_S)
+
+
+@app.on_event("startup")
+async def start_metrics_flush():
+    app.state.metrics_task = asyncio.create_task(_metrics_flush_loop())
+
+
+@app.on_event("shutdown")
+async def stop_metrics_flush():
+    task = getattr(app.state, "metrics_task", None)
+    if task:
+        task.cancel()
+    (metrics.METRICS_DIR / f"{os.getpid()}.json").unlink(missing_ok=True)
+
+
+@app.get("/metrics")
+def prometheus_metrics(request: Request):
+    if METRICS_TOKEN:
+        given = request.headers.get("authorization") or ""
+        if not hmac.compare_digest(given.encode(), f"Bearer {METRICS_TOKEN}".encode()):
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated")
+    else:
+        require_admin(request)
+    return Response(
+        content=metrics.render_prometheus(),
+        media_type="text/plain; version=0.0.4; charset=utf-8",
+    )
+
+
+# =========================
+# Warm-up de arranque + /readyz
+# =========================
+warmup = WarmUp()
+WARM_DB_CONNECTIONS = int(os.getenv("ZPROVEART_WARM_DB_CONNECTIONS", "4"))
+
+
+@warmup.step("db_pool")
+def _warm_db_pool():
+    # Conexiones abiertas a la vez; al soltarse quedan en el pool de pyodbc
+    with ThreadPoolExecutor(max_workers=max(1, WARM_DB_CONNECTIONS)) as ex:
+        list(ex.map(lambda _: test_connection(), range(max(1, WARM_DB_CONNECTIONS))))
+    return {"connections": WARM_DB_CONNECTIONS}
+
+
+@warmup.step("templates")
+def _warm_templates():
+    names = templates.env.list_templates(filter_func=lambda n: n.endswith(".html"))
+    for name in names:
+        templates.env.get_template(name)
+    return {"templates": len(names)}
+
+
+@warmup.step("families")
+def _warm_families():
+    return {"families": len(get_fams_cached())}
+
+
+@warmup.step("subfamilies")
+def _warm_subfamilies():
+    # Mapa completo familia -> subfamilias en memoria desde el arranque
+    return {"families": len(get_subfams_map_cached())}
+
+
+@warmup.step("buyers")
+def _warm_buyers():
+    return {"buyers": len(get_buyers_cached()[0])}
+
+
+@warmup.step("imports")
+def _warm_imports():
+    _pwd_context()
+    _pypdf_classes()
+    import openpyxl  # noqa: F401
+    import playwright.sync_api  # noqa: F401
+
+
+if pdf_engines.PDF_ENGINE != "chromium":
+    @warmup.step("weasyprint")
+    def _warm_weasyprint():
+        # Procesos del pool arrancados, con WeasyPrint, fuentes y CSS cargados
+        logger.warning("ZPROVEART_PDF_ENGINE=%s: WeasyPrint es experimental", pdf_engines.PDF_ENGINE)
+        if not pdf_engines.weasyprint_available():
+            logger.warning("WeasyPrint no disponible: los PDF se generan con Chromium")
+            return {"available": False}
+        return {"workers": pdf_engines.warm_weasyprint(list(_read_pdf_css()))}
+
+
+@app.on_event("startup")
+async def start_warmup():
+    # En un hilo: el worker acepta conexiones ya, pero /readyz da 503 hasta terminar
+    threading.Thread(target=warmup.run, name="warmup", daemon=True).start()
+
+
+@app.get("/readyz")
+def readyz():
+    st = warmup.status()
+    return JSONResponse(st, status_code=200 if st["ready"] else 503)
+
+
+def _replay_spilled() -> None:
+    try:
+        n = replay_spilled(exporter)
+    except Exception as e:
+        logger.warning("Error pasando al diario las selecciones aparcadas: %r", e)
+        return
+    if n:
+        logger.info("%d selecciones aparcadas pasadas al diario", n)
+
+
+async def _materialize_exports_loop():
+    # Regenera el .xlsx diario desde el diario append-only cada X segundos
+    # (antes, pasa al diario lo que la cola de envíos tuviera aparcado)
+    while True:
+        await asyncio.sleep(EXPORT_XLSX_EVERY_S)
+        await run_in_threadpool(_replay_spilled)
+        try:
+            await run_in_threadpool(materialize_if_stale, exporter)
+        except Exception as e:
+            logger.warning("Error materializando export diario: %r", e)
+
+
+@app.on_event("startup")
+async def start_export_materializer():
+    await run_in_threadpool(_replay_spilled)
+    await submit_queue.start()
+    app.state.export_task = asyncio.create_task(_materialize_exports_loop())
+
+
+@app.on_event("shutdown")
+async def stop_pdf_engines():
+    pdf_engines.shutdown_weasyprint()
+
+
+@app.on_event("shutdown")
+async def stop_export_materializer():
+    task = getattr(app.state, "export_task", None)
+    if task:
+        task.cancel()
+    # primero vaciar la cola de envíos, luego el último .xlsx
+    await submit_queue.stop()
+    materialize_if_stale(exporter)
+
+
 @app.get("/zproveart", response_class=HTMLResponse)
 def zproveart_home(
     request: Request,
@@ -258,31 +562,35 @@ def zproveart_home(
 
     families = get_fams_cached()
 
-    return templates.TemplateResponse(
-        "pages/zproveart.html",
-        {
-            "request": request,
-            "products": products,
-            "page": page,
-            "page_size": PAGE_SIZE,
-            "total_pages": total_pages,
-            "families": families,
-            "family_list": family_list,
-            # Para mantener estado / debug
-            "subfams_by_fam": subfams_by_fam,
-            # Para el pager (muy importante)
-            "subfam_params": subfam_params,
-            "date_from": date_from.isoformat() if date_from else "",
-            "date_to": date_to.isoformat() if date_to else "",
-            "supp_from": supp_from,
-            "supp_to": supp_to,
-            "comp_from": comp_from,
-            "comp_to": comp_to,
-            "art_from": art_from,
-            "art_to": art_to,
-            "user": user,
-        },
-    )
+    with span("render"):
+        cards = render_cards(templates.env, "components/product_card.html", products)
+        response = templates.TemplateResponse(
+            "pages/zproveart.html",
+            {
+                "request": request,
+                "products": products,
+                "cards": cards,
+                "page": page,
+                "page_size": PAGE_SIZE,
+                "total_pages": total_pages,
+                "families": families,
+                "family_list": family_list,
+                # Para mantener estado / debug
+                "subfams_by_fam": subfams_by_fam,
+                # Para el pager (muy importante)
+                "subfam_params": subfam_params,
+                "date_from": date_from.isoformat() if date_from else "",
+                "date_to": date_to.isoformat() if date_to else "",
+                "supp_from": supp_from,
+                "supp_to": supp_to,
+                "comp_from": comp_from,
+                "comp_to": comp_to,
+                "art_from": art_from,
+                "art_to": art_to,
+                "user": user,
+            },
+        )
+    return response
 
 
 @app.post("/zproveart/submit")
@@ -298,17 +606,123 @@ async def zproveart_submit(request: Request):
     selected = selected_raw in ("1", "on", "true", "True")
 
 
-    if itmref:
-        append_row_daily(
-            exporter,
+    if not itmref:
+        return Response(status_code=204)
+
+    row = make_row(
+        itmref=itmref,
+        selected=selected,
+        comment=comment,
+        bpsnum=bpsnum,
+        user_ad=user['username'],
+    )
+    fut = submit_queue.submit(row)
+
+    if SUBMIT_ACK == "queued":
+        fut.add_done_callback(_log_submit_error)
+        return Response(status_code=202)
+
+    try:
+        await fut
+    except Exception as e:
+        logger.error("No se pudo guardar la selección %s: %r", itmref, e)
+        return Response(status_code=503)
+
+    return Response(status_code=204)
+
+
+MAX_BULK_ITEMS = 500
+
+
+@app.post("/zproveart/submit/bulk")
+async def zproveart_submit_bulk(request: Request):
+    """
+    Varias tarjetas en una petición: {"items": [{itmref, bpsnum, selected, comment}, ...]}
+    Todas las filas se escriben juntas en una sola escritura del diario.
+    """
+    user = require_login(request, redirect=False)
+
+    try:
+        payload = await request.json()
+    except Exception:
+        raise HTTPException(status_code=400, detail="JSON inválido")
+
+    items = payload.get("items") if isinstance(payload, dict) else None
+    if not isinstance(items, list):
+        raise HTTPException(status_code=400, detail="Falta 'items'")
+    if len(items) > MAX_BULK_ITEMS:
+        raise HTTPException(status_code=413, detail=f"Máximo {MAX_BULK_ITEMS} elementos")
+
+    rows = []
+    for it in items:
+        if not isinstance(it, dict):
+            continue
+        itmref = str(it.get("itmref") or "").strip()
+        if not itmref:
+            continue
+        rows.append(make_row(
             itmref=itmref,
-            selected=selected,
-            comment=comment,
-            bpsnum=bpsnum,
+            selected=it.get("selected") in (True, 1, "1", "on", "true", "True"),
+            comment=str(it.get("comment") or "").strip(),
+            bpsnum=str(it.get("bpsnum") or "").strip(),
             user_ad=user['username'],
-        )
+        ))
 
-    return Response(status_code=204)
+    fut = submit_queue.submit_many(rows)
+
+    if SUBMIT_ACK == "queued":
+        fut.add_done_callback(_log_submit_error)
+        return JSONResponse({"saved": len(rows)}, status_code=202)
+
+    try:
+        await fut
+    except Exception as e:
+        logger.error("No se pudo guardar el lote de %s selecciones: %r", len(rows), e)
+        return JSONResponse({"saved": 0}, status_code=503)
+
+    return JSONResponse({"saved": len(rows)})
+
+
+def _log_submit_error(fut: asyncio.Future) -> None:
+    if not fut.cancelled() and fut.exception() is not None:
+        logger.error("No se pudo guardar una selección encolada: %r", fut.exception())
+
+
+@app.get("/api/zproveart/timings")
+def api_timings(request: Request):
+    require_login(request, redirect=False)
+    return timing.histograms_snapshot()
+
+
+# Usuarios con acceso a los endpoints de diagnóstico (vacío = nadie)
+ADMIN_USERS = {u.strip() for u in os.getenv("ZPROVEART_ADMIN_USERS", "").split(",") if u.strip()}
+
+
+def require_admin(request: Request) -> dict:
+    user = require_login(request, redirect=False)
+    if user.get("username") not in ADMIN_USERS:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Solo administradores")
+    return user
+
+
+@app.get("/api/zproveart/admin/queries")
+def api_admin_queries(
+    request: Request,
+    top: int = Query(default=20, ge=1, le=200),
+    order: str = Query(default="total_ms", pattern="^(total_ms|max_ms|calls|rows|slow)$"),
+):
+    require_admin(request)
+    return {
+        "slow_query_ms": query_log.SLOW_QUERY_MS,
+        "window_s": query_log.STATS_WINDOW_S,
+        "queries": query_log.top_queries(top, order_by=order),
+    }
+
+
+@app.get("/api/zproveart/submit/queue")
+def api_submit_queue(request: Request):
+    require_login(request, redirect=False)
+    return submit_queue.stats()
 
 
 @app.get("/zproveart/pdf")
@@ -333,34 +747,48 @@ def zproveart_pdf(request: Request, family: list[str] = Query(default=[])):
     family_list = [str(f).strip() for f in family if f and str(f).strip()]
     subfams_by_fam = parse_subfams_by_fam(request.query_params, family_list)
 
+    filters = {
+        "families": family_list,
+        "subfams_by_fam": subfams_by_fam,
+        "date_from": date_from,
+        "date_to": date_to,
+        "supp_from": supp_from,
+        "supp_to": supp_to,
+        "comp_from": comp_from,
+        "comp_to": comp_to,
+        "art_from": art_from,
+        "art_to": art_to,
+    }
+
+    # motor: ?engine=chromium|weasyprint|auto (por defecto ZPROVEART_PDF_ENGINE)
+    engine = (request.query_params.get("engine") or pdf_engines.PDF_ENGINE).strip().lower()
+    if engine != "auto" and engine not in pdf_engines.ENGINES:
+        raise HTTPException(status_code=400, detail=f"Motor de PDF desconocido: {engine}")
+
+    # CSS inline
+    cards_css, pdf_css = _read_pdf_css()
+    render_version = _pdf_render_version(request, cards_css, pdf_css, engine)
+
+    # PDF ya generado con estos filtros y estos datos -> se sirve tal cual
+    try:
+        data_version = get_data_version_cached()
+    except Exception as e:
+        logger.warning("Sin versión de datos para la caché de PDF: %r", e)
+        data_version = None
+    if data_version:
+        key = pdf_cache.cache_key(filters, data_version, render_version)
+        cached = pdf_cache.lookup(key)
+        if cached is not None:
+            return _pdf_cached_response(cached)
+
     # total informativo
-    total = count_products(
-        families=family_list,
-        subfams_by_fam=subfams_by_fam,
-        date_from=date_from,
-        date_to=date_to,
-        supp_from=supp_from,
-        supp_to=supp_to,
-        comp_from=comp_from,
-        comp_to=comp_to,
-        art_from=art_from,
-        art_to=art_to,
-    )
+    total = count_products(**filters)
 
     years = _default_years()
 
     # traer TODO (sin paginación)
     products = get_products_all(
-        families=family_list,
-        subfams_by_fam=subfams_by_fam,
-        date_from=date_from,
-        date_to=date_to,
-        supp_from=supp_from,
-        supp_to=supp_to,
-        comp_from=comp_from,
-        comp_to=comp_to,
-        art_from=art_from,
-        art_to=art_to,
+        **filters,
         years=years,         
         max_rows=20000,      # ajusta si hace falta
     )
@@ -374,65 +802,324 @@ def zproveart_pdf(request: Request, family: list[str] = Query(default=[])):
         sales_rows.extend(get_sales_12m(chunk))
         eta_rows.extend(get_eta_rows(chunk))
 
-    products = format_products(products, sales_rows=sales_rows, eta_rows=eta_rows)
+    if not data_version:
+        # sin sello configurado: la versión son las propias filas (se ahorra
+        # formateo + Chromium + unión, que es lo caro)
+        key = pdf_cache.cache_key(filters, pdf_cache.rows_version(products, sales_rows, eta_rows), render_version)
+        cached = pdf_cache.lookup(key)
+        if cached is not None:
+            return _pdf_cached_response(cached)
+
+    # Un solo worker genera cada clave; los demás esperan y la sirven de disco.
+    # La espera tiene tope: si el otro no acaba a tiempo, se genera aquí.
+    with pdf_cache.key_lock(key) as locked:
+        if not locked:
+            logger.warning("PDF %s: lock no conseguido en %.0f s, se genera sin esperar",
+                           key[:12], pdf_cache.PDF_LOCK_WAIT_S)
+        cached = pdf_cache.lookup(key)
+        if cached is not None:
+            return _pdf_cached_response(cached)
+
+        products = format_products(products, sales_rows=sales_rows, eta_rows=eta_rows)
+
+        # header (Chromium permite pageNumber/totalPages con esos spans)
+        header_html = templates.get_template("partials/pdf_header_playwright.html").render({
+        "request": request,
+        "total": total,
+        "family_list": family_list,
+
+        "subfams_by_fam": subfams_by_fam,   # opcional si lo quieres mostrar
+
+        "date_from": date_from.isoformat() if date_from else "",
+        "date_to": date_to.isoformat() if date_to else "",
+
+        "supp_from": supp_from or "",
+        "supp_to": supp_to or "",
+
+        "comp_from": comp_from or "",
+        "comp_to": comp_to or "",
+
+        "art_from": art_from or "",
+        "art_to": art_to or "",
+        })
+
+        try:
+            pdf_bytes, engine_used = _render_products_pdf(
+                request,
+                products,
+                total=total,
+                header_html=header_html,
+                cards_css=cards_css,
+                pdf_css=pdf_css,
+                engine=engine,
+            )
+        except pdf_engines.EngineUnavailable as e:
+            raise HTTPException(status_code=503, detail=str(e))
+
+        # sin artículos no se guarda: es una página de cabecera, barata de
+        # generar. Tampoco si se pidió WeasyPrint y salió de Chromium: la
+        # clave lleva el motor pedido
+        if products and engine in ("auto", engine_used):
+            try:
+                pdf_cache.store(key, pdf_bytes)
+            except OSError as e:
+                logger.warning("No se pudo guardar el PDF en caché: %r", e)
 
-    # CSS inline
+    return Response(
+        content=pdf_bytes,
+        media_type="application/pdf",
+        headers={
+            "Content-Disposition": 'attachment; filename="zproveart.pdf"',
+            "X-ZPROVEART-PDF-Cache": "miss",
+            "X-ZPROVEART-PDF-Engine": engine_used,
+        },
+    )
+
+
+def _read_pdf_css() -> tuple[str, str]:
     base_dir = Path(__file__).resolve().parent
     cards_css = (base_dir / "static" / "css" / "zproveart" / "_cards_pdf.css").read_text("utf-8")
     pdf_css = (base_dir / "static" / "css" / "zproveart" / "pdf.css").read_text("utf-8")
+    return cards_css, pdf_css
 
-    # header (Chromium permite pageNumber/totalPages con esos spans)
-    header_html = templates.get_template("partials/pdf_header_playwright.html").render({
-    "request": request,
-    "total": total,
-    "family_list": family_list,
 
-    "subfams_by_fam": subfams_by_fam,   # opcional si lo quieres mostrar
+def _pdf_render_version(request: Request, cards_css: str, pdf_css: str, engine: str) -> str:
+    """
+    Todo lo que cambia el PDF aparte de los datos: motor, plantillas, CSS,
+    host (<base href>) y el día (ventana de 12 meses / años por defecto).
+    """
+    h = hashlib.sha256(engine.encode("utf-8"))
+    for name in (
+        "pages/zproveart_pdf.html",
+        "components/product_card_pdf.html",
+        "partials/pdf_header_playwright.html",
+    ):
+        source, _, _ = templates.env.loader.get_source(templates.env, name)
+        h.update(source.encode("utf-8"))
+    for part in (cards_css, pdf_css, str(request.base_url), date.today().isoformat()):
+        h.update(part.encode("utf-8"))
+    return h.hexdigest()[:32]
+
+
+def _pdf_cached_response(path: Path) -> FileResponse:
+    metrics.inc("pdf_cache_hits_total")
+    return FileResponse(
+        path,
+        media_type="application/pdf",
+        filename="zproveart.pdf",
+        headers={"X-ZPROVEART-PDF-Cache": "hit"},
+    )
 
-    "date_from": date_from.isoformat() if date_from else "",
-    "date_to": date_to.isoformat() if date_to else "",
 
-    "supp_from": supp_from or "",
-    "supp_to": supp_to or "",
+def _pdf_sections(products: list[dict], max_cards: int = pdf_cache.PDF_SECTION_MAX_CARDS) -> list[list[dict]]:
+    """
+    Trozos en frontera de proveedor (vienen ORDER BY BPSNUM_0, ITMREF_0);
+    un proveedor con más de `max_cards` tarjetas se parte en varios.
+    """
+    sections: list[list[dict]] = []
+    for _, group in groupby(products, key=lambda p: p.get("BPSNUM_0")):
+        sections.extend(_chunks(list(group), max_cards))
+    return sections
 
-    "comp_from": comp_from or "",
-    "comp_to": comp_to or "",
 
-    "art_from": art_from or "",
-    "art_to": art_to or "",
-    })
-    # CHUNK de tarjetas por “doc” (evita HTML gigantesco)
-    CARDS_PER_PDF_CHUNK = 100  # prueba 40/60/80 según tamaño de cada card
+def _pdf_section_version(request: Request, cards_css: str, pdf_css: str, engine: str) -> str:
+    # Lo que cambia una sección aparte de sus tarjetas (no los filtros: la
+    # cabecera va en una capa aparte)
+    h = hashlib.sha256(engine.encode("utf-8"))
+    for name in ("pages/zproveart_pdf.html", "components/product_card_pdf.html"):
+        source, _, _ = templates.env.loader.get_source(templates.env, name)
+        h.update(source.encode("utf-8"))
+    for part in (cards_css, pdf_css, str(request.base_url)):
+        h.update(part.encode("utf-8"))
+    return h.hexdigest()
 
-    pdf_parts: list[bytes] = []
 
-    with sync_playwright() as p:
-        browser = p.chromium.launch(args=["--disable-dev-shm-usage", "--no-sandbox"])
+def _render_products_pdf(
+    request: Request,
+    products: list[dict],
+    *,
+    total: int,
+    header_html: str,
+    cards_css: str,
+    pdf_css: str,
+    engine: str = "chromium",
+) -> tuple[bytes, str]:
+    """
+    PDF = secciones por proveedor (cacheadas por contenido en pdf_cache)
+    + una capa con la cabecera de esta exportación (filtros, total, pág. X/Y).
+    Solo se renderizan las secciones que no están en caché, con el motor de
+    pdf_engines; pdf_tuning decide cuántas tarjetas van en cada llamada al
+    motor (una sección grande puede ir en varias y se une antes de guardarla).
+
+    Si WeasyPrint (experimental) no está disponible o se rompe, se hace con
+    Chromium. Devuelve (pdf, motor usado).
+    """
+    kwargs = dict(total=total, header_html=header_html, cards_css=cards_css, pdf_css=pdf_css)
+    try:
+        name = pdf_engines.resolve(engine, len(products))
+    except pdf_engines.EngineUnavailable as e:
+        logger.warning("%s; el PDF se genera con Chromium", e)
+        name = "chromium"
 
-        # render por bloques
-        for prod_chunk in _chunks(products, CARDS_PER_PDF_CHUNK):
-            html = templates.get_template("pages/zproveart_pdf.html").render({
-                "request": request,
-                "products": prod_chunk,
-                "total": total,
-                "cards_css": cards_css,
-                "pdf_css": pdf_css,
-            })
+    if name != "chromium":
+        try:
+            return _render_products_pdf_with(request, products, name, **kwargs), name
+        except pdf_engines.EngineUnavailable as e:
+            logger.warning("%s; el PDF se genera con Chromium", e)
+    return _render_products_pdf_with(request, products, "chromium", **kwargs), "chromium"
 
-            pdf_parts.append(_render_pdf_chunk(browser=browser, html=html, header_html=header_html))
 
-        browser.close()
+def _render_products_pdf_with(
+    request: Request,
+    products: list[dict],
+    name: str,
+    *,
+    total: int,
+    header_html: str,
+    cards_css: str,
+    pdf_css: str,
+) -> bytes:
+    eng = pdf_engines.create(name, base_url=str(request.base_url), css=[cards_css, pdf_css])
+    version = _pdf_section_version(request, cards_css, pdf_css, eng.name)
+    tuner = pdf_tuning.ChunkTuner.load(eng.name)
+    sections = _pdf_sections(products)
+    pdf_parts: list[bytes | None] = []
+    pieces: dict[int, list[bytes | None]] = {}  # sección -> trozos ya renderizados
+    keys: dict[int, str] = {}
+    pending: deque = deque()  # (sección, trozo, tarjetas, Future) en vuelo
+    n_cached = 0
+
+    def finish(entry) -> None:
+        i, j, n_cards, fut = entry
+        part, stats = fut.result()
+        # tiempo de render del propio motor: Chromium renderiza dentro de
+        # submit() y WeasyPrint en otro proceso, esperar al Future no lo mide
+        timing.record(f"pdf.{eng.name}", stats["seconds"] * 1000.0)
+        tuner.observe(n_cards, stats["seconds"], stats.get("mem_bytes", 0))
+        metrics.inc("pdf_chunks_total", engine=eng.name)
+        pieces[i][j] = part
+        if any(p is None for p in pieces[i]):
+            return
+        done = pieces.pop(i)
+        pdf_parts[i] = done[0] if len(done) == 1 else _merge_pdfs(done)
+        try:
+            pdf_cache.store_section(keys.pop(i), pdf_parts[i])
+        except OSError as e:
+            logger.warning("No se pudo guardar la sección de PDF: %r", e)
+
+    with eng:
+        for i, section in enumerate(sections):
+            key = pdf_cache.section_key(version, section)
+            part = pdf_cache.lookup_section(key)
+            pdf_parts.append(part)
+            if part is not None:
+                n_cached += 1
+                continue
+
+            # render solo de las secciones nuevas o cambiadas, en trozos de
+            # como mucho tuner.size tarjetas (el tamaño del momento)
+            chunks = list(_chunks(section, tuner.size))
+            keys[i] = key
+            pieces[i] = [None] * len(chunks)
+            for j, chunk in enumerate(chunks):
+                with span("pdf.render_html"):
+                    cards = render_cards(templates.env, "components/product_card_pdf.html", chunk)
+                    html = templates.get_template("pages/zproveart_pdf.html").render({
+                        "request": request,
+                        "products": chunk,
+                        "cards": cards,
+                        "total": total,
+                        "cards_css": cards_css if eng.inline_css else "",
+                        "pdf_css": pdf_css if eng.inline_css else "",
+                    })
+
+                pending.append((i, j, len(chunk), eng.submit(html)))
+                while len(pending) >= eng.parallelism:
+                    finish(pending.popleft())
+        while pending:
+            finish(pending.popleft())
+
+        if not pdf_parts:
+            # sin artículos: una sola página con la cabecera (filtros, total 0)
+            with span("pdf.header"):
+                n_pages = 1
+                pdf_bytes = eng.render_headers(header_html, n_pages)
+        else:
+            # unir PDFs
+            with span("pdf.merge"):
+                pdf_bytes = _merge_pdfs(pdf_parts)
+
+            # cabecera con numeración global, estampada sobre cada página
+            with span("pdf.header"):
+                n_pages = _count_pdf_pages(pdf_bytes)
+                header_pdf = eng.render_headers(header_html, n_pages)
+                pdf_bytes = _stamp_pdf_headers(pdf_bytes, header_pdf)
+
+    tuner.save()
+    metrics.inc("pdf_sections_total", len(pdf_parts))
+    metrics.inc("pdf_sections_cached_total", n_cached)
+    metrics.inc("pdf_bytes_total", len(pdf_bytes))
+    logger.info(
+        "PDF: %d tarjetas, %d secciones (%d en caché), %d páginas; render %s",
+        len(products), len(pdf_parts), n_cached, n_pages,
+        " ".join(f"{k}={v}" for k, v in tuner.summary().items()),
+    )
+    return pdf_bytes
 
-    # unir PDFs
-    pdf_bytes = _merge_pdfs(pdf_parts)
 
-    return Response(
-        content=pdf_bytes,
-        media_type="application/pdf",
-        headers={"Content-Disposition": 'attachment; filename="zproveart.pdf"'},
+@app.get("/zproveart/xlsx")
+def zproveart_xlsx(request: Request, family: list[str] = Query(default=[])):
+    """
+    Mismo listado filtrado que el PDF (producto + 12 meses + ETA) en Excel.
+    Se lee del cursor por lotes y cada lote sale comprimido hacia el cliente
+    antes de leer el siguiente: memoria constante aunque sean 50k filas y el
+    primer byte no espera al libro entero. La conexión de la BD queda tomada
+    mientras dura la descarga.
+    """
+    auth = require_login(request, redirect=True)
+    if isinstance(auth, RedirectResponse):
+        return auth
+
+    filters = _filters_from_request(request, family)
+
+    batches = iter_products_all(
+        **filters,
+        years=_default_years(),
+        max_rows=50000,
+        batch_size=1000,
+    )
+
+    filename = f"zproveart_{date.today().strftime('%Y%m%d')}.xlsx"
+    return StreamingResponse(
+        iter_products_xlsx(batches, sales_fn=get_sales_12m, eta_fn=get_eta_rows),
+        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
     )
 
 
+def _filters_from_request(request: Request, family: list[str]) -> dict:
+    """Filtros comunes (mismos query params que la galería / PDF)."""
+    date_from = parse_date(request.query_params.get("from"))
+    date_to = parse_date(request.query_params.get("to"))
+    if date_from and date_to and date_from > date_to:
+        date_from, date_to = date_to, date_from
+
+    family_list = [str(f).strip() for f in family if f and str(f).strip()]
+
+    return {
+        "families": family_list,
+        "subfams_by_fam": parse_subfams_by_fam(request.query_params, family_list),
+        "date_from": date_from,
+        "date_to": date_to,
+        "supp_from": request.query_params.get("supp_from"),
+        "supp_to": request.query_params.get("supp_to"),
+        "comp_from": request.query_params.get("comp_from"),
+        "comp_to": request.query_params.get("comp_to"),
+        "art_from": request.query_params.get("art_from"),
+        "art_to": request.query_params.get("art_to"),
+    }
+
+
 def parse_subfams_by_fam(query_params, fams: list[str]) -> dict[str, list[str]]:
     """
     Lee params tipo subfam_12=1207&subfam_12=1208 y devuelve:
@@ -458,6 +1145,8 @@ def _merge_pdfs(pdf_list: list[bytes]) -> bytes:
     if not pdf_list:
         return b""
 
+    PdfMerger, PdfWriter, _pypdf_import_error = _pypdf_classes()
+
     # 1) Si hay PdfMerger, perfecto
     if PdfMerger is not None:
         merger = PdfMerger()
@@ -487,37 +1176,24 @@ def _merge_pdfs(pdf_list: list[bytes]) -> bytes:
     )
 
 
-def _render_pdf_chunk(
-    *,
-    browser,
-    html: str,
-    header_html: str,
-) -> bytes:
-    page = browser.new_page()
-    page.set_content(html, wait_until="domcontentloaded")
+def _count_pdf_pages(pdf_bytes: bytes) -> int:
+    from pypdf import PdfReader
 
-    # Espera a que exista el grid (ajusta selector si tu template usa otro)
-    page.wait_for_selector(".pdf-grid", timeout=60000)
+    return len(PdfReader(BytesIO(pdf_bytes)).pages)
 
-    # Espera imágenes (con timeout razonable)
-    try:
-        page.wait_for_function(
-            "() => Array.from(document.images).every(img => img.complete)",
-            timeout=60000,
-        )
-    except Exception:
-        # si alguna imagen no carga (404 / lenta), no bloqueamos el PDF
-        pass
-
-    return page.pdf(
-        format="A4",
-        landscape=True,
-        print_background=True,
-        display_header_footer=True,
-        header_template=header_html,
-        footer_template="<div></div>",
-        margin={"top": "18mm", "bottom": "0mm", "left": "0mm", "right": "0mm"},
-    )
+
+def _stamp_pdf_headers(pdf_bytes: bytes, header_pdf: bytes) -> bytes:
+    """Superpone la página i de `header_pdf` sobre la página i del PDF."""
+    from pypdf import PdfReader, PdfWriter
+
+    headers = PdfReader(BytesIO(header_pdf)).pages
+    writer = PdfWriter(clone_from=BytesIO(pdf_bytes))
+    for i, page in enumerate(writer.pages):
+        if i < len(headers):
+            page.merge_page(headers[i])
+    out = BytesIO()
+    writer.write(out)
+    return out.getvalue()
 router = APIRouter()
 @app.get("/zproveart/lookup/{kind}", response_class=HTMLResponse)
 def lookup_popup(request: Request, kind: str, target: str = ""):
@@ -548,5 +1224,12 @@ def api_lookup_suppliers(
 @app.get("/api/lookup/buyers")
 def api_lookup_buyers(request: Request):
     auth = require_login(request, redirect=False)
-    rows = get_buyers_distinct()
-    return {"items": rows}
\ No newline at end of file
+    rows, etag = get_buyers_cached()
+
+    # La lista cambia muy poco: el navegador revalida con If-None-Match
+    headers = {"ETag": etag, "Cache-Control": "private, max-age=300"}
+    inm = request.headers.get("if-none-match") or ""
+    if etag in [t.strip() for t in inm.split(",")]:
+        return Response(status_code=304, headers=headers)
+
+    return JSONResponse({"items": rows}, headers=headers)
\ No newline at end of file
@@ -3,6 +3,9 @@ from fastapi.responses import StreamingResponse
 from urllib.parse import urlparse
 import httpx
 
+from app.services import metrics
+from app.services.timing import span
+
 router = APIRouter()
 
 ALLOWED_HOSTS = {"192.168.1.82"}
@@ -18,9 +21,12 @@ async def foto(u: str = Query(..., description="URL completa de la imagen")):
         raise HTTPException(status_code=403, detail="Host no permitido")
 
     async with httpx.AsyncClient(verify=False, timeout=20.0) as client:
-        r = await client.get(u)
+        with span("foto.upstream"):
+            r = await client.get(u)
+        metrics.inc("foto_upstream_requests_total", status=r.status_code)
         if r.status_code != 200:
             raise HTTPException(status_code=404, detail="Foto no encontrada")
 
+        metrics.inc("foto_upstream_bytes_total", len(r.content))
         ctype = r.headers.get("content-type", "image/jpeg")
         return StreamingResponse(r.aiter_bytes(), media_type=ctype)
@@ -0,0 +1,59 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import pickle
+
+from markupsafe import Markup
+
+from app.services.ttl_cache import TTLCache
+
+# HTML ya renderizado de cada tarjeta (components/product_card*.html).
+# Clave: plantilla + huella del registro formateado; si el artículo no ha
+# cambiado, la tarjeta no se vuelve a pasar por Jinja (~250 µs por tarjeta).
+# Sin comprimir (zlib costaba casi lo mismo que renderizar): ~6-8 KB por
+# tarjeta, el tamaño por defecto cubre un PDF de 20k tarjetas.
+CARD_CACHE_TTL = int(os.getenv("ZPROVEART_CARD_CACHE_TTL", str(60 * 60)))
+CARD_CACHE_SIZE = int(os.getenv("ZPROVEART_CARD_CACHE_SIZE", "25000"))
+
+_CARDS_CACHE = TTLCache("card_fragments", ttl=CARD_CACHE_TTL, maxsize=CARD_CACHE_SIZE)
+
+
+def _record_hash(p: dict) -> bytes:
+    return hashlib.blake2b(pickle.dumps(p, protocol=5), digest_size=16).digest()
+
+
+def _template_hash(env, template_name: str) -> bytes:
+    # Huella del fuente (no id() del objeto, que se reutiliza tras liberarlo):
+    # si la plantilla cambia, sus entradas viejas dejan de usarse hasta que
+    # las echa el LRU. Las tarjetas no incluyen otras plantillas.
+    source, _, _ = env.loader.get_source(env, template_name)
+    return hashlib.blake2b(source.encode("utf-8"), digest_size=16).digest()
+
+
+def render_cards(env, template_name: str, products: list[dict]) -> list[Markup]:
+    """
+    Tarjetas de `products` con la plantilla `template_name` (solo usa `p`),
+    reutilizando las ya renderizadas. Solo los registros nuevos o cambiados
+    pasan por Jinja.
+    """
+    tmpl = env.get_template(template_name)
+    tmpl_hash = _template_hash(env, template_name)
+    keys = [(template_name, tmpl_hash, _record_hash(p)) for p in products]
+
+    found = _CARDS_CACHE.get_many(keys)
+    out: list[Markup] = []
+    fresh: dict = {}
+    for key, p in zip(keys, products):
+        html = found.get(key) or fresh.get(key)
+        if html is None:
+            html = fresh[key] = Markup(tmpl.render(p=p))
+        out.append(html)
+
+    if fresh:
+        _CARDS_CACHE.set_many(fresh)
+    return out
+
+
+def card_cache_stats() -> dict:
+    return _CARDS_CACHE.stats()
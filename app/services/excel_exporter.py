@@ -1,11 +1,25 @@
 from __future__ import annotations
 
+import json
+import os
+import time
 from dataclasses import dataclass
-from datetime import date, datetime
+from datetime import date, datetime, timedelta
 from pathlib import Path
 from threading import Lock
 
-from openpyxl import Workbook, load_workbook
+from app.services.file_lock import file_lock, lock_path_for, unique_tmp_path
+from app.services.timing import record, span
+
+HEADERS = [
+    "timestamp",
+    "itmref",
+    "selected",
+    "comment",
+    "user_ad",
+    "cod_proveedor",
+]
+
 
 @dataclass(frozen=True)
 class ExcelExporter:
@@ -19,22 +33,53 @@ class ExcelExporter:
         day = day or date.today()
         return self.export_dir / f"{self.prefix}_{day.strftime('%Y%m%d')}.xlsx"
 
+    def journal_path(self, day: date | None = None) -> Path:
+        """Diario append-only del día (una fila JSON por línea)."""
+        day = day or date.today()
+        return self.export_dir / f"{self.prefix}_{day.strftime('%Y%m%d')}.jsonl"
+
 
+# _lock serializa los hilos de este proceso; file_lock(...) el resto de
+# workers de uvicorn que escriben en el mismo directorio.
 _lock = Lock()
 
+# tamaño del diario en la última materialización (por ruta)
+_materialized_sizes: dict[Path, int] = {}
 
-def append_row_daily(
-    exporter: ExcelExporter,
+
+def _import_legacy_xlsx(exporter: ExcelExporter, day: date) -> None:
+    """
+    Si existe el .xlsx del día pero aún no hay diario (p.ej. el día del
+    despliegue), vuelca sus filas al diario para no perderlas al materializar.
+    Se llama con _lock y el file_lock del diario tomados.
+    """
+    journal = exporter.journal_path(day)
+    xlsx = exporter.daily_path(day)
+    if journal.exists() or not xlsx.exists():
+        return
+
+    from openpyxl import load_workbook  # import perezoso: solo el día del despliegue
+
+    wb = load_workbook(xlsx, read_only=True)
+    ws = wb.active
+    with journal.open("a", encoding="utf-8") as f:
+        for i, row in enumerate(ws.iter_rows(values_only=True)):
+            if i == 0:
+                continue  # cabecera
+            vals = ["" if v is None else str(v) for v in row[: len(HEADERS)]]
+            f.write(json.dumps(vals, ensure_ascii=False) + "\n")
+    wb.close()
+
+
+def make_row(
     itmref: str,
     selected: bool,
     comment: str,
     bpsnum: str,
-    user_ad: str,   # 👈 nuevo
-) -> Path:
-    filepath = exporter.daily_path()
+    user_ad: str,
+) -> list[str]:
     ts = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-
-    row = [
+    return [
         ts,
         itmref,
         "1" if selected else "0",
@@ -43,24 +88,175 @@ def append_row_daily(
         bpsnum,
     ]
 
-    with _lock:
-        if filepath.exists():
-            wb = load_workbook(filepath)
-            ws = wb.active
-        else:
-            wb = Workbook()
-            ws = wb.active
-            ws.title = "ZPROVEART"
-            ws.append([
-                "timestamp",
-                "itmref",
-                "selected",
-                "comment",
-                "user_ad",
-                "cod_proveedor",
-            ])
-
-        ws.append(row)
-        wb.save(filepath)
+
+def append_rows_daily(exporter: ExcelExporter, rows: list[list[str]], day: date | None = None) -> Path:
+    """
+    Añade un lote de filas al diario del día con una sola escritura + fsync.
+    Cuando vuelve, las filas están en disco.
+    """
+    day = day or date.today()
+    filepath = exporter.journal_path(day)
+    data = "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in rows)
+
+    t0 = time.perf_counter()
+    with _lock, file_lock(lock_path_for(filepath)):
+        record("exporter.lock_wait", (time.perf_counter() - t0) * 1000.0)
+        _import_legacy_xlsx(exporter, day)
+        with filepath.open("a", encoding="utf-8") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
 
     return filepath
+
+
+def append_row_daily(
+    exporter: ExcelExporter,
+    itmref: str,
+    selected: bool,
+    comment: str,
+    bpsnum: str,
+    user_ad: str,   # 👈 nuevo
+) -> Path:
+    """
+    Añade la fila al diario del día (una línea JSON, coste constante).
+    El .xlsx se genera a partir del diario con materialize_daily_xlsx.
+    """
+    row = make_row(itmref, selected, comment, bpsnum, user_ad)
+    return append_rows_daily(exporter, [row])
+
+
+# =========================
+# FILAS APARCADAS (cola en modo "queued")
+# =========================
+# Si un lote no se puede añadir al diario ni tras los reintentos, se aparca
+# en un fichero propio y se pasa al diario más tarde (replay_spilled).
+def spill_dir(exporter: ExcelExporter) -> Path:
+    return exporter.export_dir / ".submit_spill"
+
+
+def spill_rows(exporter: ExcelExporter, rows: list[list[str]]) -> Path:
+    """Guarda el lote en un fichero nuevo (temporal + fsync + rename)."""
+    folder = spill_dir(exporter)
+    folder.mkdir(parents=True, exist_ok=True)
+    path = folder / f"{datetime.now().strftime('%Y%m%d%H%M%S%f')}_{os.getpid()}.jsonl"
+    tmp = unique_tmp_path(path)
+    with tmp.open("w", encoding="utf-8") as f:
+        f.write("".join(json.dumps(r, ensure_ascii=False) + "\n" for r in rows))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    return path
+
+
+def _row_day(row: list[str]) -> date | None:
+    try:
+        return date.fromisoformat(str(row[0])[:10])
+    except (IndexError, ValueError):
+        return None
+
+
+def replay_spilled(exporter: ExcelExporter) -> int:
+    """
+    Pasa las filas aparcadas al diario de su día (por el timestamp de la
+    fila) y borra cada fichero cuando ya está escrito. Devuelve las filas.
+    """
+    folder = spill_dir(exporter)
+    if not folder.is_dir():
+        return 0
+
+    n = 0
+    # un solo worker a la vez: dos a la vez duplicarían filas
+    with file_lock(folder / ".replay.lock"):
+        for path in sorted(folder.glob("*.jsonl")):
+            by_day: dict[date | None, list[list[str]]] = {}
+            with path.open("r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        row = json.loads(line)
+                    except ValueError:
+                        continue
+                    by_day.setdefault(_row_day(row), []).append(row)
+            for day, rows in by_day.items():
+                append_rows_daily(exporter, rows, day)
+                n += len(rows)
+            path.unlink()
+    return n
+
+
+def read_journal(exporter: ExcelExporter, day: date | None = None) -> list[list[str]]:
+    journal = exporter.journal_path(day)
+    if not journal.exists():
+        return []
+
+    rows: list[list[str]] = []
+    with journal.open("r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                rows.append(json.loads(line))
+            except ValueError:
+                # línea cortada (caída a mitad de escritura): se ignora
+                continue
+    return rows
+
+
+def materialize_daily_xlsx(exporter: ExcelExporter, day: date | None = None) -> Path | None:
+    """
+    Genera el .xlsx del día a partir del diario (write-only, streaming).
+    Se escribe en un temporal y se renombra, así nunca queda un .xlsx a medias.
+    """
+    day = day or date.today()
+    journal = exporter.journal_path(day)
+    if not journal.exists():
+        return None
+
+    with _lock, file_lock(lock_path_for(journal)):
+        _import_legacy_xlsx(exporter, day)
+
+    xlsx = exporter.daily_path(day)
+
+    # Un solo worker materializa a la vez; los anexos al diario no esperan
+    with file_lock(lock_path_for(xlsx)), span("exporter.materialize"):
+        tmp = unique_tmp_path(xlsx)
+        size = journal.stat().st_size
+
+        from openpyxl import Workbook
+
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet("ZPROVEART")
+        ws.append(HEADERS)
+        for row in read_journal(exporter, day):
+            ws.append(row)
+        wb.save(tmp)
+        os.replace(tmp, xlsx)
+    _materialized_sizes[journal] = size
+
+    return xlsx
+
+
+def materialize_if_stale(exporter: ExcelExporter, days_back: int = 1) -> list[Path]:
+    """
+    Regenera los .xlsx (hoy y `days_back` días atrás) cuyo diario es más
+    reciente que el .xlsx. Pensado para llamarse a intervalos y al apagar.
+    """
+    out: list[Path] = []
+    today = date.today()
+    for i in range(days_back + 1):
+        day = today - timedelta(days=i)
+        journal = exporter.journal_path(day)
+        xlsx = exporter.daily_path(day)
+        if not journal.exists():
+            continue
+        done = _materialized_sizes.get(journal)
+        if done is not None:
+            if done == journal.stat().st_size:
+                continue
+        elif xlsx.exists() and xlsx.stat().st_mtime > journal.stat().st_mtime:
+            continue
+        path = materialize_daily_xlsx(exporter, day)
+        if path:
+            out.append(path)
+    return out
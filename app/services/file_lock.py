@@ -0,0 +1,79 @@
+from __future__ import annotations
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import fcntl  # type: ignore
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt  # type: ignore
+
+
+@contextmanager
+def file_lock(path: Path, timeout: float | None = None):
+    """
+    Lock exclusivo entre procesos sobre un fichero auxiliar (p.ej. "x.jsonl.lock").
+    flock en Linux; msvcrt.locking en Windows.
+
+    Sin `timeout` bloquea hasta conseguirlo. Con `timeout` (segundos) lo
+    intenta hasta entonces y, si no lo consigue, entra igualmente sin lock:
+    el valor del `with` dice si se tiene (True) o no (False).
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    deadline = None if timeout is None else time.monotonic() + max(0.0, timeout)
+    with open(path, "a+b") as f:
+        if fcntl is not None:
+            if deadline is None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+                locked = True
+            else:
+                locked = _retry(lambda: fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB), deadline)
+            try:
+                yield locked
+            finally:
+                if locked:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            return
+
+        # msvcrt: LK_LOCK reintenta ~10 s y luego lanza OSError -> seguimos esperando
+        f.seek(0)
+        if deadline is None:
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    time.sleep(0.05)
+            locked = True
+        else:
+            locked = _retry(lambda: msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1), deadline)
+        try:
+            yield locked
+        finally:
+            if locked:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def _retry(try_lock, deadline: float) -> bool:
+    while True:
+        try:
+            try_lock()
+            return True
+        except OSError:  # BlockingIOError con flock
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.05)
+
+
+def lock_path_for(path: Path) -> Path:
+    return path.with_name(path.name + ".lock")
+
+
+def unique_tmp_path(path: Path) -> Path:
+    """Temporal por proceso e hilo, para que dos escritores no usen el mismo .tmp."""
+    return path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
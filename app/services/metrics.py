@@ -0,0 +1,153 @@
+from __future__ import annotations
+
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Callable
+
+from app.config import EXPORT_DIR
+from app.services import timing
+from app.services.file_lock import unique_tmp_path
+
+# Métricas en formato texto de Prometheus.
+#
+# Cada worker de uvicorn tiene sus propios contadores en memoria. Para que
+# /metrics (que atiende un worker cualquiera) los muestre todos, cada worker
+# vuelca su snapshot a METRICS_DIR/<pid>.json y /metrics junta los ficheros
+# con la etiqueta worker="<pid>". Los de workers muertos caducan solos.
+
+METRICS_DIR = Path(os.getenv("ZPROVEART_METRICS_DIR", str(EXPORT_DIR / ".metrics")))
+METRICS_FLUSH_S = int(os.getenv("ZPROVEART_METRICS_FLUSH_S", "15"))
+_STALE_AFTER_S = max(60, METRICS_FLUSH_S * 4)
+
+PREFIX = "zproveart"
+
+# (nombre, etiquetas ordenadas) -> valor
+_counters: dict[tuple[str, tuple], float] = {}
+_counters_lock = threading.Lock()
+
+# callables que devuelven gauges/contadores "externos" (p.ej. stats de cachés)
+_collectors: list[Callable[[], list[tuple[str, dict, float]]]] = []
+
+
+def inc(name: str, value: float = 1.0, **labels) -> None:
+    key = (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+    with _counters_lock:
+        _counters[key] = _counters.get(key, 0.0) + value
+
+
+def register_collector(fn: Callable[[], list[tuple[str, dict, float]]]) -> None:
+    """`fn` devuelve [(nombre, etiquetas, valor)] en el momento del scrape."""
+    _collectors.append(fn)
+
+
+# Familias de histogramas a partir de los nombres de span de timing.py
+_SPAN_FAMILIES = (
+    ("db.", "db_query_duration_seconds", "query"),
+    ("pdf.", "pdf_stage_duration_seconds", "stage"),
+    ("foto.", "foto_upstream_duration_seconds", "stage"),
+    ("exporter.", "exporter_duration_seconds", "stage"),
+    ("route.", "http_request_duration_seconds", "route"),
+)
+
+
+def _span_family(span_name: str) -> tuple[str, str, str]:
+    for prefix, family, label in _SPAN_FAMILIES:
+        if span_name.startswith(prefix):
+            return family, label, span_name[len(prefix):]
+    return "span_duration_seconds", "span", span_name
+
+
+def snapshot() -> dict:
+    """Estado de este worker (serializable a JSON)."""
+    with _counters_lock:
+        counters = [[n, list(map(list, lbl)), v] for (n, lbl), v in _counters.items()]
+
+    for fn in _collectors:
+        try:
+            for name, labels, value in fn():
+                counters.append([name, sorted([k, str(v)] for k, v in labels.items()), value])
+        except Exception:
+            continue
+
+    return {
+        "ts": time.time(),
+        "counters": counters,
+        "histograms": timing.histograms_snapshot(),
+    }
+
+
+def write_snapshot() -> None:
+    METRICS_DIR.mkdir(parents=True, exist_ok=True)
+    path = METRICS_DIR / f"{os.getpid()}.json"
+    tmp = unique_tmp_path(path)
+    tmp.write_text(json.dumps(snapshot()), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def _read_snapshots() -> dict[str, dict]:
+    own = str(os.getpid())
+    out = {own: snapshot()}
+    if not METRICS_DIR.exists():
+        return out
+
+    now = time.time()
+    for f in METRICS_DIR.glob("*.json"):
+        pid = f.stem
+        if pid == own:
+            continue
+        try:
+            if now - f.stat().st_mtime > _STALE_AFTER_S:
+                f.unlink(missing_ok=True)
+                continue
+            out[pid] = json.loads(f.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            # fichero a medio escribir o borrado por otro worker
+            continue
+    return out
+
+
+def _esc(v: str) -> str:
+    return v.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(pairs) -> str:
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_esc(str(v))}"' for k, v in pairs) + "}"
+
+
+def render_prometheus() -> str:
+    """Todas las métricas de todos los workers en formato texto de Prometheus."""
+    families: dict[str, tuple[str, list[str]]] = {}
+
+    def add(family: str, kind: str, line: str) -> None:
+        families.setdefault(family, (kind, []))[1].append(line)
+
+    for pid, snap in sorted(_read_snapshots().items()):
+        worker = ("worker", pid)
+
+        for name, labels, value in snap.get("counters", []):
+            family = f"{PREFIX}_{name}"
+            kind = "counter" if name.endswith("_total") else "gauge"
+            add(family, kind, f"{family}{_labels([*map(tuple, labels), worker])} {value:g}")
+
+        for span_name, h in snap.get("histograms", {}).items():
+            family, label, value = _span_family(span_name)
+            family = f"{PREFIX}_{family}"
+            base = [(label, value), worker]
+            acc = 0
+            for le, n in h["buckets"].items():
+                acc += n
+                le_s = le if le == "+Inf" else f"{float(le) / 1000.0:g}"
+                add(family, "histogram", f"{family}_bucket{_labels([*base, ('le', le_s)])} {acc}")
+            add(family, "histogram", f"{family}_sum{_labels(base)} {h['sum_ms'] / 1000.0:g}")
+            add(family, "histogram", f"{family}_count{_labels(base)} {h['count']}")
+
+    out: list[str] = []
+    for family, (kind, lines) in sorted(families.items()):
+        out.append(f"# TYPE {family} {kind}")
+        out.extend(lines)
+    return "\n".join(out) + "\n"
@@ -0,0 +1,171 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import pickle
+from datetime import date
+from pathlib import Path
+
+from app.config import EXPORT_DIR
+from app.services.file_lock import file_lock, unique_tmp_path
+
+# PDFs terminados en disco, direccionados por contenido: la clave es el hash
+# de (filtros canónicos + versión de los datos + versión del render).
+# Si cambia cualquiera de las tres, la clave es otra y el PDF viejo deja de
+# usarse hasta que lo echa el límite de tamaño (LRU por mtime).
+#
+# En sections/ van los trozos por proveedor (sin cabecera), direccionados por
+# su contenido: sirven para cualquier combinación de filtros que los incluya.
+PDF_CACHE_DIR = Path(os.getenv("ZPROVEART_PDF_CACHE_DIR", str(EXPORT_DIR / "pdf_cache")))
+PDF_CACHE_MAX_MB = int(os.getenv("ZPROVEART_PDF_CACHE_MAX_MB", "1024"))
+# Corte fijo de los proveedores grandes en secciones: no depende del ajuste
+# de pdf_tuning, así las claves de sección no cambian de una exportación a otra
+PDF_SECTION_MAX_CARDS = int(os.getenv("ZPROVEART_PDF_SECTION_MAX_CARDS", "400"))
+# Espera máxima por el lock de una clave: pasado ese tiempo se genera aquí
+# también (la petición no se queda colgada si el otro worker se atasca)
+PDF_LOCK_WAIT_S = float(os.getenv("ZPROVEART_PDF_LOCK_WAIT_S", "90"))
+
+
+def canonical_filters(filters: dict) -> dict:
+    """Mismos filtros -> mismo dict (orden, espacios, vacíos, fechas)."""
+    out: dict = {}
+    for k, v in sorted(filters.items()):
+        if isinstance(v, date):
+            v = v.isoformat()
+        elif isinstance(v, str):
+            v = v.strip()
+        elif isinstance(v, dict):
+            v = {str(kk).strip(): sorted({str(x).strip() for x in vv}) for kk, vv in sorted(v.items()) if vv}
+        elif isinstance(v, (list, tuple, set)):
+            v = sorted({str(x).strip() for x in v})
+        if v in (None, "", [], {}):
+            continue
+        out[k] = v
+    return out
+
+
+def cache_key(filters: dict, data_version: str, render_version: str) -> str:
+    raw = json.dumps(
+        {"f": canonical_filters(filters), "d": data_version, "r": render_version},
+        sort_keys=True,
+        ensure_ascii=False,
+        default=str,
+    )
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def rows_version(*row_lists: list[dict]) -> str:
+    """Versión de datos a partir de las filas ya leídas (sin ZP_DATA_VERSION_SQL)."""
+    h = hashlib.sha256()
+    for rows in row_lists:
+        h.update(pickle.dumps([tuple(r.items()) for r in rows], protocol=5))
+    return "rows:" + h.hexdigest()[:32]
+
+
+def path_for(key: str) -> Path:
+    return PDF_CACHE_DIR / f"{key}.pdf"
+
+
+def lookup(key: str) -> Path | None:
+    return _touch(path_for(key))
+
+
+def _touch(path: Path) -> Path | None:
+    try:
+        os.utime(path)  # marca de uso para el LRU
+        if path.stat().st_size == 0:
+            return None  # nunca es un PDF válido (p.ej. de una versión anterior)
+    except FileNotFoundError:
+        return None
+    return path
+
+
+def section_key(render_version: str, products: list[dict]) -> str:
+    h = hashlib.sha256(render_version.encode("utf-8"))
+    h.update(pickle.dumps(products, protocol=5))
+    return h.hexdigest()
+
+
+def section_path(key: str) -> Path:
+    return PDF_CACHE_DIR / "sections" / f"{key}.pdf"
+
+
+def lookup_section(key: str) -> bytes | None:
+    path = _touch(section_path(key))
+    if path is None:
+        return None
+    try:
+        return path.read_bytes()
+    except FileNotFoundError:
+        return None
+
+
+def key_lock(key: str, timeout: float | None = None):
+    """
+    Lock entre workers por clave: dos exportaciones iguales generan una vez.
+    Como mucho `timeout` segundos (PDF_LOCK_WAIT_S); el `with` dice si se
+    consiguió. Los ficheros de lock no se borran nunca (borrar uno mientras
+    otro lo tiene abierto deja a dos procesos con locks distintos), así que
+    son un número fijo: uno por prefijo de 3 caracteres de la clave.
+    """
+    path = PDF_CACHE_DIR / "locks" / f"{key[:3]}.lock"
+    return file_lock(path, timeout=PDF_LOCK_WAIT_S if timeout is None else timeout)
+
+
+def store(key: str, data: bytes) -> Path:
+    if not data:
+        raise ValueError("PDF vacío: no se guarda en caché")
+    # evict() recorre toda la caché: una vez por exportación (aquí), no por sección
+    path = _store(path_for(key), data)
+    evict()
+    return path
+
+
+def store_section(key: str, data: bytes) -> Path:
+    return _store(section_path(key), data)
+
+
+def _store(path: Path, data: bytes) -> Path:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = unique_tmp_path(path)
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+    return path
+
+
+def evict(max_bytes: int | None = None) -> int:
+    """Borra los PDFs menos usados hasta quedar bajo el límite. Devuelve cuántos."""
+    max_bytes = PDF_CACHE_MAX_MB * 1024 * 1024 if max_bytes is None else max_bytes
+    if not PDF_CACHE_DIR.exists():
+        return 0
+
+    with file_lock(PDF_CACHE_DIR / ".evict.lock"):
+        files = []
+        for f in PDF_CACHE_DIR.rglob("*.pdf"):
+            try:
+                st = f.stat()
+            except FileNotFoundError:
+                continue
+            files.append((st.st_mtime, st.st_size, f))
+
+        total = sum(size for _, size, _ in files)
+        removed = 0
+        for _, size, f in sorted(files):
+            if total <= max_bytes:
+                break
+            f.unlink(missing_ok=True)
+            total -= size
+            removed += 1
+    return removed
+
+
+def stats() -> dict:
+    files = list(PDF_CACHE_DIR.rglob("*.pdf")) if PDF_CACHE_DIR.exists() else []
+    size = 0
+    for f in files:
+        try:
+            size += f.stat().st_size
+        except FileNotFoundError:
+            pass
+    return {"files": len(files), "bytes": size, "max_bytes": PDF_CACHE_MAX_MB * 1024 * 1024}
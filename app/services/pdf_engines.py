@@ -0,0 +1,373 @@
+from __future__ import annotations
+
+import hashlib
+import importlib.util
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+logger = logging.getLogger("zproveart")
+
+# Motores de PDF. Cada uno recibe el HTML de una sección
+# (pages/zproveart_pdf.html) y devuelve sus páginas, y pinta la capa de
+# cabeceras (partials/pdf_header_playwright.html) para N páginas:
+#   - chromium: Playwright, un navegador por exportación.
+#   - weasyprint (EXPERIMENTAL): sin navegador, en un pool de procesos con
+#     fuentes y CSS ya cargados. Para exportaciones pequeñas ahorra arrancar
+#     Chromium. Usa tal cual el CSS y la capa de cabeceras pensados para
+#     Chromium; no hay todavía comparación de salida ni números de
+#     bench.pdf_engines que digan que el PDF es equivalente.
+# Por defecto chromium. WeasyPrint solo si se pide (config o ?engine=):
+# "weasyprint" siempre que esté disponible, "auto" hasta
+# PDF_ENGINE_AUTO_MAX_CARDS tarjetas y Chromium por encima. Si WeasyPrint no
+# está (sin Pango, pool roto) se usa Chromium y se avisa en el log.
+ENGINES = ("chromium", "weasyprint")
+PDF_ENGINE = os.getenv("ZPROVEART_PDF_ENGINE", "chromium").strip().lower()
+PDF_ENGINE_AUTO_MAX_CARDS = int(os.getenv("ZPROVEART_PDF_ENGINE_AUTO_MAX_CARDS", "500"))
+WEASY_WORKERS = int(os.getenv("ZPROVEART_WEASY_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+# Márgenes/tamaño comunes a las secciones y a la capa de cabeceras
+PAGE_OPTIONS = {
+    "format": "A4",
+    "landscape": True,
+    "margin": {"top": "18mm", "bottom": "0mm", "left": "0mm", "right": "0mm"},
+}
+# Lo mismo para WeasyPrint (va después de pdf.css, que solo fija el tamaño)
+_WEASY_PAGE_CSS = "@page { size: A4 landscape; margin: 18mm 0 0 0; }"
+
+
+class EngineUnavailable(RuntimeError):
+    pass
+
+
+def resolve(requested: str, n_cards: int) -> str:
+    """Motor concreto para `requested` (chromium / weasyprint / auto)."""
+    if requested == "auto":
+        if n_cards <= PDF_ENGINE_AUTO_MAX_CARDS and weasyprint_available():
+            return "weasyprint"
+        return "chromium"
+    if requested not in ENGINES:
+        raise ValueError(f"Motor de PDF desconocido: {requested!r}")
+    if requested == "weasyprint" and not weasyprint_available():
+        raise EngineUnavailable(f"WeasyPrint no disponible: {_weasy_error or 'no instalado'}")
+    return requested
+
+
+def create(name: str, *, base_url: str, css: list[str]):
+    if name == "weasyprint":
+        return WeasyPrintEngine(base_url=base_url, css=css)
+    return ChromiumEngine()
+
+
+# =========================
+# Chromium (Playwright)
+# =========================
+class ChromiumEngine:
+    """
+    Un navegador por exportación (with ...). Playwright sync va atado a su
+    hilo, así que submit() renderiza en el momento y devuelve el Future ya
+    resuelto.
+    """
+
+    name = "chromium"
+    parallelism = 1
+    inline_css = True  # el CSS va en <style> dentro de la página
+
+    def __enter__(self):
+        try:
+            from playwright.sync_api import sync_playwright
+
+            self._pw = sync_playwright().start()
+        except Exception as e:
+            raise EngineUnavailable(f"Playwright no disponible: {e}") from e
+        try:
+            self._browser = self._pw.chromium.launch(args=["--disable-dev-shm-usage", "--no-sandbox"])
+        except Exception as e:
+            self._pw.stop()
+            first_line = (str(e).strip().splitlines() or [repr(e)])[0]
+            raise EngineUnavailable(
+                f"Chromium de Playwright no arranca ({first_line}); ¿falta 'playwright install chromium'?"
+            ) from e
+        try:
+            # para localizar los procesos renderer (memoria, ver _renderer_rss)
+            self._cdp = self._browser.new_browser_cdp_session()
+        except Exception:
+            self._cdp = None
+        return self
+
+    def __exit__(self, *exc):
+        try:
+            self._browser.close()
+        finally:
+            self._pw.stop()
+
+    def submit(self, html: str) -> Future:
+        fut: Future = Future()
+        stats: dict = {}
+        t0 = time.perf_counter()
+        try:
+            pdf = _chromium_render(
+                self._browser, html, header_html="<div></div>", stats=stats, measure_mem=self._renderer_rss,
+            )
+        except Exception as e:
+            fut.set_exception(e)
+            return fut
+        stats["seconds"] = time.perf_counter() - t0
+        fut.set_result((pdf, stats))
+        return fut
+
+    def _renderer_rss(self) -> int:
+        """
+        RSS del mayor proceso renderer de Chromium (incluye layout e imágenes,
+        que el heap JS no cuenta). Solo Linux (/proc); 0 si no se puede medir.
+        """
+        if self._cdp is None:
+            return 0
+        try:
+            procs = self._cdp.send("SystemInfo.getProcessInfo")["processInfo"]
+        except Exception:
+            return 0
+        return max((_proc_rss(p["id"]) for p in procs if p.get("type") == "renderer"), default=0)
+
+    def render_headers(self, header_html: str, n_pages: int) -> bytes:
+        """
+        PDF de `n_pages` páginas en blanco (fondo transparente) con solo la
+        cabecera: Chromium rellena pageNumber/totalPages con la numeración global.
+        """
+        blank = (
+            "<!doctype html><html><head><style>"
+            "html,body{margin:0} .pg{height:1px} .pg + .pg{break-before:page}"
+            "</style></head><body>"
+            + '<div class="pg"></div>' * max(1, n_pages)
+            + "</body></html>"
+        )
+        page = self._browser.new_page()
+        try:
+            page.set_content(blank, wait_until="domcontentloaded")
+            return page.pdf(
+                **PAGE_OPTIONS,
+                print_background=False,
+                display_header_footer=True,
+                header_template=header_html,
+                footer_template="<div></div>",
+            )
+        finally:
+            page.close()
+
+
+def _proc_rss(pid: int) -> int:
+    try:
+        with open(f"/proc/{pid}/status", encoding="ascii", errors="replace") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return 0
+
+
+def _chromium_render(
+    browser,
+    html: str,
+    *,
+    header_html: str,
+    stats: dict | None = None,
+    measure_mem=None,
+) -> bytes:
+    page = browser.new_page()
+    try:
+        page.set_content(html, wait_until="domcontentloaded")
+
+        # Espera a que exista el grid (ajusta selector si tu template usa otro)
+        page.wait_for_selector(".pdf-grid", timeout=60000)
+
+        # Espera imágenes (con timeout razonable)
+        try:
+            page.wait_for_function(
+                "() => Array.from(document.images).every(img => img.complete)",
+                timeout=60000,
+            )
+        except Exception:
+            # si alguna imagen no carga (404 / lenta), no bloqueamos el PDF
+            pass
+
+        pdf = page.pdf(
+            **PAGE_OPTIONS,
+            print_background=True,
+            display_header_footer=True,
+            header_template=header_html,
+            footer_template="<div></div>",
+        )
+        if stats is not None and measure_mem is not None:
+            # con la página aún abierta: DOM, layout e imágenes siguen en memoria
+            stats["mem_bytes"] = measure_mem()
+        return pdf
+    finally:
+        page.close()
+
+
+# =========================
+# WeasyPrint (pool de procesos)
+# =========================
+_weasy_pool: ProcessPoolExecutor | None = None
+_weasy_lock = threading.Lock()
+_weasy_error: str | None = None  # si el pool no pudo arrancar (p.ej. falta Pango)
+
+
+def weasyprint_available() -> bool:
+    return _weasy_error is None and importlib.util.find_spec("weasyprint") is not None
+
+
+def weasy_pool(css: list[str] | None = None) -> ProcessPoolExecutor:
+    """
+    Pool compartido por todas las exportaciones del worker. "spawn" (no fork:
+    el proceso tiene hilos) y cada proceso importa WeasyPrint, crea la
+    configuración de fuentes y parsea `css` una sola vez al arrancar.
+    """
+    global _weasy_pool
+    with _weasy_lock:
+        if _weasy_pool is None:
+            _weasy_pool = ProcessPoolExecutor(
+                max_workers=max(1, WEASY_WORKERS),
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_weasy_init,
+                initargs=(list(css or []),),
+            )
+        return _weasy_pool
+
+
+def _weasy_broken(e: BaseException) -> EngineUnavailable:
+    global _weasy_pool, _weasy_error
+    with _weasy_lock:
+        _weasy_error = repr(e)
+        if _weasy_pool is not None:
+            _weasy_pool.shutdown(wait=False, cancel_futures=True)
+            _weasy_pool = None
+    logger.warning("WeasyPrint desactivado: %s", _weasy_error)
+    return EngineUnavailable(f"WeasyPrint no disponible: {_weasy_error}")
+
+
+def _weasy_css(css: list[str]) -> list[str]:
+    # Misma lista (y mismo hash) en el warm-up y en el render: si no, las
+    # hojas precargadas no se usan y cada proceso vuelve a parsearlas
+    return [*css, _WEASY_PAGE_CSS]
+
+
+def warm_weasyprint(css: list[str]) -> int:
+    """Arranca todos los procesos del pool (warm-up). Devuelve cuántos."""
+    pool = weasy_pool(_weasy_css(css))
+    try:
+        for f in [pool.submit(_weasy_ping) for _ in range(max(1, WEASY_WORKERS))]:
+            f.result()
+    except BrokenProcessPool as e:
+        raise _weasy_broken(e) from e
+    return max(1, WEASY_WORKERS)
+
+
+def shutdown_weasyprint(wait: bool = False) -> None:
+    global _weasy_pool
+    with _weasy_lock:
+        if _weasy_pool is not None:
+            _weasy_pool.shutdown(wait=wait, cancel_futures=True)
+            _weasy_pool = None
+
+
+class WeasyPrintEngine:
+    """
+    Las secciones se reparten en el pool (varias a la vez); el CSS no va en
+    la página sino como hojas ya parseadas en cada proceso.
+    """
+
+    name = "weasyprint"
+    inline_css = False
+
+    def __init__(self, *, base_url: str, css: list[str]):
+        self.base_url = base_url
+        self.css = _weasy_css(css)
+        self.parallelism = max(1, WEASY_WORKERS)
+
+    def __enter__(self):
+        self._pool = weasy_pool(self.css)
+        return self
+
+    def __exit__(self, *exc):
+        pass  # el pool se queda para la siguiente exportación
+
+    def submit(self, html: str) -> Future:
+        try:
+            fut = self._pool.submit(_weasy_render, html, self.base_url, self.css)
+        except BrokenProcessPool as e:
+            raise _weasy_broken(e) from e
+        out: Future = Future()
+
+        def done(f: Future):
+            e = f.exception()
+            if isinstance(e, BrokenProcessPool):
+                out.set_exception(_weasy_broken(e))
+            elif e is not None:
+                out.set_exception(e)
+            else:
+                out.set_result(f.result())
+
+        fut.add_done_callback(done)
+        return out
+
+    def render_headers(self, header_html: str, n_pages: int) -> bytes:
+        # Sin pageNumber/totalPages automáticos: se escribe el número en cada página
+        pages = []
+        for i in range(1, max(1, n_pages) + 1):
+            h = header_html.replace('<span class="pageNumber"></span>', str(i))
+            h = h.replace('<span class="totalPages"></span>', str(n_pages))
+            pages.append(f'<div class="pg">{h}</div>')
+        html = (
+            '<!doctype html><html><head><meta charset="utf-8"><style>'
+            "@page{size:A4 landscape;margin:0} html,body{margin:0}"
+            " .pg{height:18mm;overflow:hidden} .pg + .pg{break-before:page}"
+            "</style></head><body>" + "".join(pages) + "</body></html>"
+        )
+        pdf, _ = self.submit(html).result()
+        return pdf
+
+
+# --- dentro de los procesos del pool ---
+_WEASY: dict = {}
+
+
+def _weasy_init(css: list[str]) -> None:
+    from weasyprint.text.fonts import FontConfiguration
+
+    _WEASY["fonts"] = FontConfiguration()
+    _WEASY["css"] = {}
+    if css:
+        _weasy_stylesheets(css)
+
+
+def _weasy_ping() -> int:
+    return os.getpid()
+
+
+def _weasy_stylesheets(css: list[str]) -> list:
+    from weasyprint import CSS
+
+    key = hashlib.sha1("\0".join(css).encode("utf-8")).hexdigest()
+    sheets = _WEASY["css"].get(key)
+    if sheets is None:
+        if len(_WEASY["css"]) >= 8:
+            _WEASY["css"].clear()
+        sheets = _WEASY["css"][key] = [CSS(string=t, font_config=_WEASY["fonts"]) for t in css]
+    return sheets
+
+
+def _weasy_render(html: str, base_url: str, css: list[str]) -> tuple[bytes, dict]:
+    from weasyprint import HTML
+
+    t0 = time.perf_counter()
+    pdf = HTML(string=html, base_url=base_url).write_pdf(
+        stylesheets=_weasy_stylesheets(css),
+        font_config=_WEASY["fonts"],
+    )
+    return pdf, {"seconds": time.perf_counter() - t0, "mem_bytes": _proc_rss(os.getpid())}
@@ -0,0 +1,179 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+from pathlib import Path
+
+from app.config import EXPORT_DIR
+from app.services.file_lock import file_lock, lock_path_for, unique_tmp_path
+
+logger = logging.getLogger("zproveart")
+
+# Máximo de tarjetas por llamada al motor de PDF (page.pdf() / write_pdf()),
+# ajustado con lo medido: demasiadas disparan la memoria del render, pocas
+# pagan muchas veces el coste fijo de cada llamada. Se busca el mayor tamaño
+# que no pase de PDF_CHUNK_TARGET_S segundos ni de PDF_CHUNK_MAX_MEM_MB de
+# memoria del proceso que renderiza.
+#
+# No decide cómo se parten las secciones cacheadas (eso es fijo, en
+# pdf_cache.PDF_SECTION_MAX_CARDS): una sección más grande que `size` se
+# renderiza en varias llamadas y se une antes de guardarla.
+#
+# El valor ajustado y los ajustes lineales se guardan en disco por motor
+# (pdf_engines) y los comparten los workers.
+PDF_CHUNK_DEFAULT = int(os.getenv("ZPROVEART_PDF_CHUNK", "100"))
+PDF_CHUNK_MIN = int(os.getenv("ZPROVEART_PDF_CHUNK_MIN", "20"))
+PDF_CHUNK_MAX = int(os.getenv("ZPROVEART_PDF_CHUNK_MAX", "400"))
+PDF_CHUNK_TARGET_S = float(os.getenv("ZPROVEART_PDF_CHUNK_TARGET_S", "6"))
+PDF_CHUNK_MAX_MEM_MB = float(os.getenv("ZPROVEART_PDF_CHUNK_MAX_MEM_MB", "1024"))
+PDF_CHUNK_STATE = Path(os.getenv("ZPROVEART_PDF_CHUNK_STATE", str(EXPORT_DIR / "pdf_chunk_tuning.json")))
+
+_STEP = 20
+_DECAY = 0.9  # peso de lo ya medido frente a cada medida nueva (~10 trozos)
+_MIN_SPREAD = 1.0  # varianza mínima del nº de tarjetas (tarjetas²) para estimar la pendiente
+
+_last_size: dict[str, int] = {}
+
+
+def _clamp(n: float) -> int:
+    n = int(n // _STEP * _STEP)
+    return max(PDF_CHUNK_MIN, min(PDF_CHUNK_MAX, n))
+
+
+def current_sizes() -> dict[str, int]:
+    """Último tamaño usado en este worker, por motor (para /metrics)."""
+    return dict(_last_size)
+
+
+def _read_state() -> dict:
+    try:
+        return json.loads(PDF_CHUNK_STATE.read_text(encoding="utf-8"))
+    except FileNotFoundError:
+        return {}
+
+
+class _LinearFit:
+    """
+    y ≈ fijo + por_tarjeta · tarjetas, por mínimos cuadrados con olvido
+    exponencial. Separa el coste fijo de cada llamada del que crece con las
+    tarjetas (con secciones de pocas tarjetas, dividir y/n lo confunde todo).
+    """
+
+    def __init__(self, sums: list[float] | None = None):
+        self.w, self.sx, self.sy, self.sxx, self.sxy = (list(sums) + [0.0] * 5)[:5] if sums else [0.0] * 5
+
+    def add(self, x: float, y: float) -> None:
+        self.w = self.w * _DECAY + 1.0
+        self.sx = self.sx * _DECAY + x
+        self.sy = self.sy * _DECAY + y
+        self.sxx = self.sxx * _DECAY + x * x
+        self.sxy = self.sxy * _DECAY + x * y
+
+    def coef(self) -> tuple[float, float] | None:
+        """(fijo, por_tarjeta), o None si todos los trozos tenían casi el mismo tamaño."""
+        if self.w < 2:
+            return None
+        mx, my = self.sx / self.w, self.sy / self.w
+        var = self.sxx / self.w - mx * mx
+        if var < _MIN_SPREAD:
+            return None
+        slope = max((self.sxy / self.w - mx * my) / var, 1e-9)
+        return max(0.0, my - slope * mx), slope
+
+    def dump(self) -> list[float]:
+        return [self.w, self.sx, self.sy, self.sxx, self.sxy]
+
+
+class ChunkTuner:
+    """
+    Ajuste del tamaño de trozo durante una exportación.
+
+    observe() recibe lo medido en cada llamada al motor (tarjetas, segundos,
+    memoria) y recalcula `size` para las siguientes; save() deja el estado
+    para la próxima exportación y summary() resume la exportación para el log.
+    """
+
+    def __init__(self, engine: str = "chromium", size: int = PDF_CHUNK_DEFAULT, state: dict | None = None):
+        state = state or {}
+        self.engine = engine
+        self.size = _clamp(size)
+        self.size_start = self.size
+        self.time_fit = _LinearFit(state.get("time"))
+        self.mem_fit = _LinearFit(state.get("mem"))
+        self.chunks = 0
+        self.cards = 0
+        self.render_s = 0.0
+        self.max_mem = 0
+
+    @classmethod
+    def load(cls, engine: str = "chromium") -> "ChunkTuner":
+        try:
+            st = _read_state().get(engine)
+            if st is None:
+                return cls(engine)
+            return cls(engine, int(st["size"]), st)
+        except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+            logger.warning("Estado de ajuste de trozos PDF ilegible (%r); uso %d", e, PDF_CHUNK_DEFAULT)
+            return cls(engine)
+
+    def observe(self, cards: int, seconds: float, mem_bytes: int = 0) -> None:
+        if cards <= 0:
+            return
+        self.chunks += 1
+        self.cards += cards
+        self.render_s += seconds
+        self.max_mem = max(self.max_mem, mem_bytes)
+
+        self.time_fit.add(cards, seconds)
+        if mem_bytes:
+            self.mem_fit.add(cards, mem_bytes)
+
+        limits = []
+        for fit, budget in (
+            (self.time_fit, PDF_CHUNK_TARGET_S),
+            (self.mem_fit, PDF_CHUNK_MAX_MEM_MB * 1024 * 1024),
+        ):
+            c = fit.coef()
+            if c is not None:
+                fixed, per_card = c
+                limits.append((budget - fixed) / per_card)
+        if not limits:
+            return  # sin variedad de tamaños todavía: no hay con qué decidir
+        # baja de golpe, sube como mucho un 50% por trozo (evita oscilar)
+        self.size = _clamp(min(min(limits), self.size * 1.5))
+
+    def save(self) -> None:
+        _last_size[self.engine] = self.size
+        if not self.chunks:
+            return
+        mine = {"size": self.size, "time": self.time_fit.dump(), "mem": self.mem_fit.dump()}
+        try:
+            # leer-modificar-escribir: cada motor tiene su entrada
+            with file_lock(lock_path_for(PDF_CHUNK_STATE)):
+                try:
+                    state = _read_state()
+                except ValueError:
+                    state = {}
+                if not isinstance(state, dict):
+                    state = {}
+                state[self.engine] = mine
+                tmp = unique_tmp_path(PDF_CHUNK_STATE)
+                tmp.write_text(json.dumps(state), encoding="utf-8")
+                os.replace(tmp, PDF_CHUNK_STATE)
+        except OSError as e:
+            logger.warning("No se pudo guardar el ajuste de trozos PDF: %r", e)
+
+    def summary(self) -> dict:
+        c = self.time_fit.coef()
+        return {
+            "engine": self.engine,
+            "chunks": self.chunks,
+            "cards": self.cards,
+            "size_start": self.size_start,
+            "size_end": self.size,
+            "render_s": round(self.render_s, 2),
+            "fixed_ms": round(c[0] * 1000.0, 1) if c else None,
+            "ms_per_card": round(c[1] * 1000.0, 2) if c else None,
+            "max_mem_mb": round(self.max_mem / (1024 * 1024), 1),
+        }
@@ -1,5 +1,11 @@
+import os
 from datetime import date
+from functools import lru_cache
 from decimal import Decimal, InvalidOperation
+from typing import NamedTuple
+
+from app.services.timing import timed
+from app.services.ttl_cache import TTLCache
 
 
 # =========================
@@ -86,16 +92,14 @@ def fmt_date(d) -> str:
 # =========================
 # CONDICIONES COMERCIALES
 # =========================
-def _format_condiciones_comerciales(p: dict) -> dict:
-    out = dict(p)
-
-    out["FUC_0_FMT"] = fmt_date(p.get("FUC_0"))
+def _format_condiciones_comerciales(out: dict) -> dict:
+    out["FUC_0_FMT"] = fmt_date(out.get("FUC_0"))
 
     for f in ("FOB_0", "PUE_0", "PVPT4_0", "DIF_0", "ARANCEL_0"):
-        out[f"{f}_FMT"] = fmt_money(p.get(f))
+        out[f"{f}_FMT"] = fmt_money(out.get(f))
 
-    out["UQTY_0"] = fmt_int(p.get("UQTY_0"))
-    out["DTO_0_FMT"] = fmt_pct(p.get("DTO_0"))
+    out["UQTY_0"] = fmt_int(out.get("UQTY_0"))
+    out["DTO_0_FMT"] = fmt_pct(out.get("DTO_0"))
 
     return out
 
@@ -119,8 +123,8 @@ MESES = {
 }
 
 
-def _last_12_months_desc(end: date | None = None):
-    end = end or date.today()
+@lru_cache(maxsize=4)
+def _months_desc_for(end: date) -> tuple[tuple[int, int, str], ...]:
     y, m = end.year, end.month
 
     out = []
@@ -132,37 +136,68 @@ def _last_12_months_desc(end: date | None = None):
             yy -= 1
         out.append((yy, mm, MESES[mm]))
 
-    return out
+    return tuple(out)
 
 
-def _attach_sales_12m(products: list[dict], sales_rows: list[dict], end_date: date | None = None) -> list[dict]:
-    idx: dict[tuple[str, int], dict] = {}
-    for r in sales_rows:
-        y = int(r["ANNO_0"])
-        m = int(r["MES_0"])
-        yyyymm = y * 100 + m
-        idx[(r["ITMREF_0"], yyyymm)] = r
+def _last_12_months_desc(end: date | None = None):
+    return list(_months_desc_for(end or date.today()))
 
-    months = _last_12_months_desc(end_date)
 
-    for p in products:
-        itm = p.get("ITMREF_0")
-        m12 = []
-        for y, m, label in months:
-            yyyymm = y * 100 + m
-            r = idx.get((itm, yyyymm))
+def _fmt_es_int(v) -> str:
+    return f"{float(v):,.0f}".replace(",", ".")
+
+
+# m12 y eta son tuplas de registros inmutables: los mismos objetos pueden
+# estar en la caché de productos y en varios resultados sin que nadie los
+# cambie por debajo (la plantilla lee r.label / r.fecha igual que en un dict).
+class SalesMonth(NamedTuple):
+    label: str
+    ventas: str
+    compras: str
 
-            ventas = ""
-            compras = ""
-            if r:
-                if r.get("VENTAS_0") is not None:
-                    ventas = _fmt_es(float(r["VENTAS_0"]), 0)
-                if r.get("COMPRAS_0") is not None:
-                    compras = _fmt_es(float(r["COMPRAS_0"]), 0)
 
-            m12.append({"label": label, "ventas": ventas, "compras": compras})
+class EtaRow(NamedTuple):
+    fecha: str
+    qty: str
+    vcr: str
+
+
+def _attach_sales_12m(products: list[dict], sales_rows: list[dict], end_date: date | None = None) -> list[dict]:
+    """
+    Agrupa las ventas en una pasada: ITMREF -> 12 huecos (0 = mes actual).
+    Cada hueco con datos se formatea una sola vez, al rellenarlo.
+    """
+    months = _months_desc_for(end_date or date.today())
+    labels = [label for _, _, label in months]
+    empty = [SalesMonth(label, "", "") for label in labels]
+    no_sales = tuple(empty)
+    base = months[0][0] * 12 + months[0][1]
 
-        p["m12"] = m12
+    slots: dict[str, list] = {}
+    for r in sales_rows:
+        off = base - (int(r["ANNO_0"]) * 12 + int(r["MES_0"]))
+        if not 0 <= off < 12:
+            continue
+
+        itm = r["ITMREF_0"]
+        arr = slots.get(itm)
+        if arr is None:
+            arr = slots[itm] = [None] * 12
+
+        ventas = r.get("VENTAS_0")
+        compras = r.get("COMPRAS_0")
+        arr[off] = SalesMonth(
+            labels[off],
+            "" if ventas is None else _fmt_es_int(ventas),
+            "" if compras is None else _fmt_es_int(compras),
+        )
+
+    m12_by_itm = {
+        itm: tuple(e if s is None else s for e, s in zip(empty, arr))
+        for itm, arr in slots.items()
+    }
+    for p in products:
+        p["m12"] = m12_by_itm.get(p.get("ITMREF_0"), no_sales)
 
     return products
 
@@ -170,10 +205,9 @@ def _attach_sales_12m(products: list[dict], sales_rows: list[dict], end_date: da
 # =========================
 # EXISTENCIAS
 # =========================
-def _format_existencias(p: dict) -> dict:
-    out = dict(p)
+def _format_existencias(out: dict) -> dict:
     for f in ("EX_ACT_0", "EX_DISP_0", "EX_PREV_0", "QTY_PEND_SC_0"):
-        out[f"{f}_FMT"] = fmt_int(p.get(f))
+        out[f"{f}_FMT"] = fmt_int(out.get(f))
     return out
 
 
@@ -181,24 +215,47 @@ def _format_existencias(p: dict) -> dict:
 # ETA / FECHAS PREVISTAS
 # =========================
 def _attach_eta(products: list[dict], eta_rows: list[dict], max_rows: int = 3) -> list[dict]:
-    idx: dict[str, list[dict]] = {}
+    """
+    Recorre las filas (ya vienen ORDER BY ITMREF_0, FECHA_0) en una pasada:
+    formatea solo las `max_rows` primeras de cada artículo y cuenta el resto.
+    Si la fila trae CNT_0 (get_eta_rows ya recortado en SQL) se usa como total.
+    """
+    # ITMREF -> [filas formateadas, filas vistas, CNT_0]
+    idx: dict[str, list] = {}
+    last_itm = None
+    entry: list = []
+
     for r in eta_rows:
-        idx.setdefault(r["ITMREF_0"], []).append(r)
+        itm = r["ITMREF_0"]
+        if itm != last_itm or not entry:
+            entry = idx.get(itm)
+            if entry is None:
+                entry = idx[itm] = [[], 0, 0]
+            last_itm = itm
+
+        entry[1] += 1
+        cnt = r.get("CNT_0")
+        if cnt is not None and cnt > entry[2]:
+            entry[2] = cnt
+
+        if len(entry[0]) < max_rows:
+            entry[0].append(EtaRow(
+                fmt_date(r.get("FECHA_0")),
+                fmt_int(r.get("QTY_0")),
+                (r.get("VCR_0") or ""),
+            ))
+
+    for entry in idx.values():
+        entry[0] = tuple(entry[0])
 
     for p in products:
-        itm = p.get("ITMREF_0")
-        rows = idx.get(itm, [])
-
-        out_rows = []
-        for r in rows[:max_rows]:
-            out_rows.append({
-                "fecha": fmt_date(r.get("FECHA_0")),
-                "qty": fmt_int(r.get("QTY_0")),
-                "vcr": (r.get("VCR_0") or ""),
-            })
-
-        p["eta"] = out_rows
-        p["eta_extra"] = max(0, len(rows) - max_rows)
+        entry = idx.get(p.get("ITMREF_0"))
+        if entry is None:
+            p["eta"] = ()
+            p["eta_extra"] = 0
+        else:
+            p["eta"] = entry[0]
+            p["eta_extra"] = max(0, max(entry[1], entry[2]) - max_rows)
 
     return products
 
@@ -206,25 +263,23 @@ def _attach_eta(products: list[dict], eta_rows: list[dict], max_rows: int = 3) -
 # =========================
 # LOGÍSTICA
 # =========================
-def _format_logistica(p: dict) -> dict:
-    out = dict(p)
-
-    out["MED_PZ_0_FMT"] = p.get("MED_PZ_0") or "-"
-    out["MED_CJ_0_FMT"] = p.get("MED_CJ_0") or "-"
-    out["CUBIC_0_FMT"] = _fmt_es(float(p["CUBIC_0"]), 4) if p.get("CUBIC_0") else "-"
+def _format_logistica(out: dict) -> dict:
+    out["MED_PZ_0_FMT"] = out.get("MED_PZ_0") or "-"
+    out["MED_CJ_0_FMT"] = out.get("MED_CJ_0") or "-"
+    out["CUBIC_0_FMT"] = _fmt_es(float(out["CUBIC_0"]), 4) if out.get("CUBIC_0") else "-"
 
-    out["UNXCAJ_0_FMT"] = fmt_int(p.get("UNXCAJ_0"))
-    out["UNXPAL_0_FMT"] = fmt_int(p.get("UNXPAL_0"))
-    out["UNXPAQ_0_FMT"] = fmt_int(p.get("UNXPAQ_0"))
+    out["UNXCAJ_0_FMT"] = fmt_int(out.get("UNXCAJ_0"))
+    out["UNXPAL_0_FMT"] = fmt_int(out.get("UNXPAL_0"))
+    out["UNXPAQ_0_FMT"] = fmt_int(out.get("UNXPAQ_0"))
 
-    out["ZPUERTO_0_FMT"] = p.get("ZPUERTO_0") or "-"
-    out["ZSLIM_0_FMT"] = p.get("ZSLIM_0") or "-"
-    out["CMC_0_FMT"] = fmt_int(p.get("CMC_0"))
+    out["ZPUERTO_0_FMT"] = out.get("ZPUERTO_0") or "-"
+    out["ZSLIM_0_FMT"] = out.get("ZSLIM_0") or "-"
+    out["CMC_0_FMT"] = fmt_int(out.get("CMC_0"))
 
-    out["ZVERNTV_0_FMT"] = "Sí" if p.get("ZVERNTV_0") in (1, "1", True) else "No"
-    out["ZVTASINSTOCK_0_FMT"] = "Sí" if p.get("ZVTASINSTOCK_0") in (1, "1", True) else "No"
+    out["ZVERNTV_0_FMT"] = "Sí" if out.get("ZVERNTV_0") in (1, "1", True) else "No"
+    out["ZVTASINSTOCK_0_FMT"] = "Sí" if out.get("ZVTASINSTOCK_0") in (1, "1", True) else "No"
 
-    out["COD_ART_PRO_0_FMT"] = p.get("COD_ART_PRO_0") or "-"
+    out["COD_ART_PRO_0_FMT"] = out.get("COD_ART_PRO_0") or "-"
 
     return out
 
@@ -232,17 +287,15 @@ def _format_logistica(p: dict) -> dict:
 # =========================
 # DATOS PROVEEDOR
 # =========================
-def _format_proveedor(p: dict) -> dict:
-    out = dict(p)
+def _format_proveedor(out: dict) -> dict:
+    out["ZFRECUPED_0_FMT"] = fmt_int_blank(out.get("ZFRECUPED_0"))
+    out["ZNUMPALMIN_0_FMT"] = fmt_int_blank(out.get("ZNUMPALMIN_0"))
 
-    out["ZFRECUPED_0_FMT"] = fmt_int_blank(p.get("ZFRECUPED_0"))
-    out["ZNUMPALMIN_0_FMT"] = fmt_int_blank(p.get("ZNUMPALMIN_0"))
-
-    plazo = p.get("ZPLAZOENTRE_0")
+    plazo = out.get("ZPLAZOENTRE_0")
     out["ZPLAZOENTRE_0_FMT"] = "-" if is_zeroish(plazo) else f"{fmt_int(plazo)} d"
 
-    out["ZIMPMINPED_0_FMT"] = fmt_money_blank(p.get("ZIMPMINPED_0"))
-    out["ZVOLMINCOM_0_FMT"] = fmt_money_blank(p.get("ZVOLMINCOM_0"))
+    out["ZIMPMINPED_0_FMT"] = fmt_money_blank(out.get("ZIMPMINPED_0"))
+    out["ZVOLMINCOM_0_FMT"] = fmt_money_blank(out.get("ZVOLMINCOM_0"))
 
     details = [
         out["ZFRECUPED_0_FMT"],
@@ -258,9 +311,7 @@ def _format_proveedor(p: dict) -> dict:
 # =========================
 # COMPRA VENTA
 # =========================
-def _format_compven(p: dict) -> dict:
-    out = dict(p)
-
+def _format_compven(out: dict) -> dict:
     # Números: quitar decimales, mantener ceros
     out["NUM_CLIENTES_FMT"]  = fmt_int(out.get("NUM_CLIENTES_0"))
     out["NUM_ENTRADAS_FMT"]  = fmt_int(out.get("NUM_ENTRADAS_0"))
@@ -276,10 +327,8 @@ def _format_compven(p: dict) -> dict:
 # =========================
 # VALIDACIÓN ESTADO
 # =========================
-def _format_estado(p: dict) -> dict:
-    out = dict(p)
-
-    estado = (p.get("ESTADO_0") or "").strip()
+def _format_estado(out: dict) -> dict:
+    estado = (out.get("ESTADO_0") or "").strip()
     out["ESTADO_0_FMT"] = estado or "-"
     out["ESTADO_OK"] = (estado == "OK")
 
@@ -290,23 +339,247 @@ def _format_estado(p: dict) -> dict:
 
 
 # =========================
-# ENTRYPOINT
+# FORMATO COLUMNAR
 # =========================
-def format_products(
-    products: list[dict],
-    sales_rows: list[dict] | None = None,
-    eta_rows: list[dict] | None = None
-) -> list[dict]:
+# Mismo resultado que los _format_* por fila, pero formateando cada columna
+# de golpe y construyendo un solo dict por producto.
+# Los tipos habituales de pyodbc (int/float/Decimal) van por la vía rápida;
+# cualquier otro valor cae en la función escalar original.
+_FAST_TYPES = frozenset((int, float, Decimal))
+_ES_TABLE = str.maketrans({",": ".", ".": ","})
+
+
+def _floats(values: list) -> list[float | None]:
+    """float(v) para tipos numéricos; None donde hay que usar la vía lenta."""
+    return [float(v) if type(v) in _FAST_TYPES else None for v in values]
+
+
+def _bulk_es(floats: list[float | None], decimals: int) -> list[str | None]:
+    """
+    Formatea toda la columna de una vez: un solo format por valor y un único
+    replace/translate sobre el texto unido (en vez de 3 replace por número).
+    """
+    fast = [f for f in floats if f is not None]
+    if not fast:
+        return [None] * len(floats)
+
+    joined = "\n".join(map(f"{{:,.{decimals}f}}".format, fast))
+    if decimals == 0:
+        joined = joined.replace(",", ".")
+    else:
+        joined = joined.translate(_ES_TABLE)
+
+    it = iter(joined.split("\n"))
+    return [None if f is None else next(it) for f in floats]
+
 
+def _col_int(values: list) -> list[str]:
+    floats = [
+        None if f is None else (0.0 if -1e-6 < f < 1e-6 else f)
+        for f in _floats(values)
+    ]
+    return [
+        fmt_int(v) if s is None else s
+        for v, s in zip(values, _bulk_es(floats, 0))
+    ]
+
+
+def _col_money(values: list) -> list[str]:
+    return [
+        fmt_money(v) if s is None else s
+        for v, s in zip(values, _bulk_es(_floats(values), 2))
+    ]
+
+
+def _col_pct(values: list) -> list[str]:
+    return [
+        fmt_pct(v) if s is None else f"{s} %"
+        for v, s in zip(values, _bulk_es(_floats(values), 2))
+    ]
+
+
+def _col_zeroish(values: list) -> list[bool]:
+    return [
+        is_zeroish(v) if f is None else f == 0
+        for v, f in zip(values, _floats(values))
+    ]
+
+
+def _col_blank(values: list, zeroish: list[bool], decimals: int, fallback) -> list[str]:
+    formatted = _bulk_es(_floats(values), decimals)
+    return [
+        "-" if z else (fallback(v) if s is None else s)
+        for v, z, s in zip(values, zeroish, formatted)
+    ]
+
+
+def _col_date(values: list) -> list[str]:
+    return [d.strftime("%d/%m/%Y") if d else "-" for d in values]
+
+
+def _col_text(values: list) -> list:
+    return [v or "-" for v in values]
+
+
+def _col_yes_no(values: list) -> list[str]:
+    return ["Sí" if v in (1, "1", True) else "No" for v in values]
+
+
+def _format_products_columnar(products: list[dict]) -> list[dict]:
+    if not products:
+        return []
+
+    # Una sola copia por producto, hecha al principio: cada columna se escribe
+    # en los registros de salida nada más formatearse y se suelta, así no se
+    # acumulan ~45 listas de n textos ni una tupla por fila para unirlas.
+    out = [dict(p) for p in products]
+
+    def col(name: str) -> list:
+        return [p.get(name) for p in products]
+
+    def add(name: str, values: list) -> None:
+        for o, v in zip(out, values):
+            o[name] = v
+
+    add("UQTY_0", _col_int(col("UQTY_0")))
+
+    # Condiciones comerciales
+    add("FUC_0_FMT", _col_date(col("FUC_0")))
+    for f in ("FOB_0", "PUE_0", "PVPT4_0", "DIF_0", "ARANCEL_0"):
+        add(f"{f}_FMT", _col_money(col(f)))
+    add("DTO_0_FMT", _col_pct(col("DTO_0")))
+
+    # Existencias
+    for f in ("EX_ACT_0", "EX_DISP_0", "EX_PREV_0", "QTY_PEND_SC_0"):
+        add(f"{f}_FMT", _col_int(col(f)))
+
+    # Logística
+    add("MED_PZ_0_FMT", _col_text(col("MED_PZ_0")))
+    add("MED_CJ_0_FMT", _col_text(col("MED_CJ_0")))
+    cubic = _bulk_es([float(v) if v else None for v in col("CUBIC_0")], 4)
+    add("CUBIC_0_FMT", [c or "-" for c in cubic])
+    add("UNXCAJ_0_FMT", _col_int(col("UNXCAJ_0")))
+    add("UNXPAL_0_FMT", _col_int(col("UNXPAL_0")))
+    add("UNXPAQ_0_FMT", _col_int(col("UNXPAQ_0")))
+    add("ZPUERTO_0_FMT", _col_text(col("ZPUERTO_0")))
+    add("ZSLIM_0_FMT", _col_text(col("ZSLIM_0")))
+    add("CMC_0_FMT", _col_int(col("CMC_0")))
+    add("ZVERNTV_0_FMT", _col_yes_no(col("ZVERNTV_0")))
+    add("ZVTASINSTOCK_0_FMT", _col_yes_no(col("ZVTASINSTOCK_0")))
+    add("COD_ART_PRO_0_FMT", _col_text(col("COD_ART_PRO_0")))
+
+    # Proveedor
+    details: list[list[str]] = []
+    for f, decimals, fallback in (
+        ("ZFRECUPED_0", 0, fmt_int_blank),
+        ("ZNUMPALMIN_0", 0, fmt_int_blank),
+    ):
+        vals = col(f)
+        details.append(_col_blank(vals, _col_zeroish(vals), decimals, fallback))
+        add(f"{f}_FMT", details[-1])
+
+    plazo = col("ZPLAZOENTRE_0")
+    plazo_fmt = [
+        "-" if z else f"{s} d"
+        for z, s in zip(_col_zeroish(plazo), _col_int(plazo))
+    ]
+    details.append(plazo_fmt)
+    add("ZPLAZOENTRE_0_FMT", plazo_fmt)
+
+    for f in ("ZIMPMINPED_0", "ZVOLMINCOM_0"):
+        vals = col(f)
+        details.append(_col_blank(vals, _col_zeroish(vals), 2, fmt_money_blank))
+        add(f"{f}_FMT", details[-1])
+
+    add("SUPPLIER_HAS_DETAILS", [
+        any(x not in ("-", "", None) for x in row) for row in zip(*details)
+    ])
+
+    # Compra / venta
+    add("NUM_CLIENTES_FMT", _col_int(col("NUM_CLIENTES_0")))
+    add("NUM_ENTRADAS_FMT", _col_int(col("NUM_ENTRADAS_0")))
+    add("NUM_VENTAS_FMT", _col_int(col("NUM_VENTAS_0")))
+    add("NUM_OCU_FMT", _col_int(col("NUM_OCU_0")))
+    add("COD_COM_FMT", [
+        str(v).strip() if v not in (None, "") else "-" for v in col("COD_COM_0")
+    ])
+
+    # Estado
+    estados = [(v or "").strip() for v in col("ESTADO_0")]
+    add("ESTADO_0_FMT", [e or "-" for e in estados])
+    add("ESTADO_OK", [e == "OK" for e in estados])
+
+    for o in out:
+        if not o["ESTADO_OK"]:
+            o["ESTADO_MSG"] = "¡ARTÍCULO NO ACTIVO!"
+
+    return out
+
+
+# Las etapas _format_* modifican el registro in situ: se copia una sola vez
+# el dict de la BD y todas trabajan sobre esa copia.
+_ROW_STAGES = (
+    _format_condiciones_comerciales,
+    _format_existencias,
+    _format_logistica,
+    _format_proveedor,
+    _format_compven,
+    _format_estado,
+)
+
+
+def _format_products_rows(products: list[dict]) -> list[dict]:
+    """Ruta fila a fila (referencia para comparar con la columnar)."""
     out = []
     for p in products:
-        p2 = _format_condiciones_comerciales(p)
-        p2 = _format_existencias(p2)
-        p2 = _format_logistica(p2)
-        p2 = _format_proveedor(p2)
-        p2 = _format_compven(p2)
-        p2 = _format_estado(p2)
+        p2 = dict(p)
+        for stage in _ROW_STAGES:
+            stage(p2)
         out.append(p2)
+    return out
+
+
+# =========================
+# CACHÉ DE PRODUCTOS FORMATEADOS
+# =========================
+# Compartida por la galería y el PDF. Clave: ITMREF + hash de la huella del
+# artículo (columnas de la BD + sus filas de ventas/ETA + mes actual, que
+# fija las etiquetas de m12). La huella se guarda junto al valor y se
+# compara en cada acierto, así una colisión de hash nunca sirve datos ajenos.
+#
+# Tamaño por memoria: cada entrada (registro + huella, con ventas y ETA)
+# ocupa ~9 KB medidos con tracemalloc (python -m bench.bench_formatter_alloc);
+# con PRODUCTS_CACHE_MB=256 caben ~29k artículos, una exportación de 20k.
+PRODUCTS_CACHE_MB = int(os.getenv("ZPROVEART_PRODUCTS_CACHE_MB", "256"))
+_PRODUCTS_CACHE_ENTRY_KB = 9
+_PRODUCTS_CACHE = TTLCache(
+    "formatted_products",
+    ttl=60 * 30,
+    maxsize=PRODUCTS_CACHE_MB * 1024 // _PRODUCTS_CACHE_ENTRY_KB,
+)
+
+
+def _group_by_itmref(rows: list[dict] | None) -> dict[str, list[dict]] | None:
+    if rows is None:
+        return None
+    out: dict[str, list[dict]] = {}
+    for r in rows:
+        out.setdefault(r["ITMREF_0"], []).append(r)
+    return out
+
+
+def _rows_fingerprint(rows: list[dict] | None) -> tuple | None:
+    if rows is None:
+        return None
+    return tuple(tuple(r.values()) for r in rows)
+
+
+def _format_products_uncached(
+    products: list[dict],
+    sales_rows: list[dict] | None,
+    eta_rows: list[dict] | None,
+) -> list[dict]:
+    out = _format_products_columnar(products)
 
     if sales_rows is not None:
         out = _attach_sales_12m(out, sales_rows)
@@ -315,3 +588,83 @@ def format_products(
         out = _attach_eta(out, eta_rows, max_rows=3)
 
     return out
+
+
+def product_cache_stats() -> dict:
+    st = _PRODUCTS_CACHE.stats()
+    lookups = st["hits"] + st["misses"]
+    st["hit_rate"] = round(st["hits"] / lookups, 4) if lookups else 0.0
+    return st
+
+
+# =========================
+# ENTRYPOINT
+# =========================
+@timed("format_products")
+def format_products(
+    products: list[dict],
+    sales_rows: list[dict] | None = None,
+    eta_rows: list[dict] | None = None,
+    use_cache: bool = True,
+) -> list[dict]:
+
+    if not use_cache or not products:
+        return _format_products_uncached(products, sales_rows, eta_rows)
+
+    sales_by_itm = _group_by_itmref(sales_rows)
+    eta_by_itm = _group_by_itmref(eta_rows)
+    today = date.today()
+    month_key = today.year * 12 + today.month
+
+    keys: list = []
+    fps: list = []
+    for p in products:
+        itm = p.get("ITMREF_0")
+        fp = (
+            tuple(p.items()),
+            _rows_fingerprint(sales_by_itm.get(itm, [])) if sales_by_itm is not None else None,
+            _rows_fingerprint(eta_by_itm.get(itm, [])) if eta_by_itm is not None else None,
+            month_key,
+        )
+        try:
+            key = (itm, hash(fp))
+        except TypeError:
+            key = None  # valor no hasheable: este artículo no se cachea
+        keys.append(key)
+        fps.append(fp)
+
+    found = _PRODUCTS_CACHE.get_many([k for k in keys if k is not None])
+
+    out: list[dict | None] = []
+    miss_idx: list[int] = []
+    for i, (key, fp) in enumerate(zip(keys, fps)):
+        entry = found.get(key) if key is not None else None
+        if entry is not None and entry[0] == fp:
+            # copia superficial: el llamador puede tocar el dict sin ensuciar la
+            # caché; m12/eta son tuplas inmutables y se pueden compartir
+            out.append(dict(entry[1]))
+        else:
+            out.append(None)
+            miss_idx.append(i)
+
+    if miss_idx:
+        miss_products = [products[i] for i in miss_idx]
+        miss_itms = {p.get("ITMREF_0") for p in miss_products}
+
+        miss_sales = None
+        if sales_by_itm is not None:
+            miss_sales = [r for itm in miss_itms for r in sales_by_itm.get(itm, [])]
+        miss_eta = None
+        if eta_by_itm is not None:
+            miss_eta = [r for itm in miss_itms for r in eta_by_itm.get(itm, [])]
+
+        formatted = _format_products_uncached(miss_products, miss_sales, miss_eta)
+
+        to_store = {}
+        for i, f in zip(miss_idx, formatted):
+            out[i] = f
+            if keys[i] is not None:
+                to_store[keys[i]] = (fps[i], dict(f))
+        _PRODUCTS_CACHE.set_many(to_store)
+
+    return out
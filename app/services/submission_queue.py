@@ -0,0 +1,193 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Any, Callable
+
+logger = logging.getLogger("zproveart")
+
+
+class SubmissionQueue:
+    """
+    Cola write-behind para las selecciones de /zproveart/submit.
+
+    Las filas se acumulan en memoria y una tarea de fondo las escribe por
+    lotes: cuando hay `max_batch` filas o han pasado `max_delay_ms` desde la
+    primera del lote. `write_batch` se ejecuta en un hilo (E/S bloqueante).
+
+    submit()/submit_many() devuelven un future que se resuelve cuando el lote
+    que contiene las filas ya está escrito (o falla con la excepción de la
+    escritura): quien necesite confirmación de durabilidad lo espera; quien
+    no, lo ignora. Las filas de un mismo submit_many van siempre en la misma
+    escritura.
+
+    Si la escritura falla se reintenta `retries` veces con espera creciente
+    (retry_base_ms, x2 cada vez, máx. 5 s); mientras, los lotes siguientes
+    esperan, así el orden se mantiene. Si aun así falla y hay `spill`, el
+    lote se aparca con spill(filas) y sus futures se resuelven bien (las
+    filas ya están en disco); sin `spill`, fallan con la excepción.
+    """
+
+    def __init__(
+        self,
+        write_batch: Callable[[list[Any]], Any],
+        max_batch: int = 200,
+        max_delay_ms: int = 250,
+        retries: int = 0,
+        retry_base_ms: int = 200,
+        spill: Callable[[list[Any]], Any] | None = None,
+    ):
+        self._write_batch = write_batch
+        self.max_batch = max(1, int(max_batch))
+        self.max_delay = max(0, int(max_delay_ms)) / 1000.0
+        self.retries = max(0, int(retries))
+        self.retry_base = max(0, int(retry_base_ms)) / 1000.0
+        self._spill = spill
+
+        # unidades encoladas: (filas, future); una unidad nunca se parte
+        self._pending: list[tuple[list[Any], asyncio.Future]] = []
+        self._pending_rows = 0
+        self._has_items: asyncio.Event | None = None
+        self._full: asyncio.Event | None = None
+        self._task: asyncio.Task | None = None
+        self._closing = False
+
+        self.written_rows = 0
+        self.written_batches = 0
+        self.failed_batches = 0
+        self.retried_batches = 0
+        self.spilled_rows = 0
+
+    def depth(self) -> int:
+        return self._pending_rows
+
+    def stats(self) -> dict:
+        return {
+            "depth": self.depth(),
+            "max_batch": self.max_batch,
+            "max_delay_ms": int(self.max_delay * 1000),
+            "written_rows": self.written_rows,
+            "written_batches": self.written_batches,
+            "failed_batches": self.failed_batches,
+            "retried_batches": self.retried_batches,
+            "spilled_rows": self.spilled_rows,
+        }
+
+    async def start(self) -> None:
+        if self._task and not self._task.done():
+            return
+        self._closing = False
+        self._has_items = asyncio.Event()
+        self._full = asyncio.Event()
+        if self._pending:
+            self._has_items.set()
+        self._task = asyncio.create_task(self._run())
+
+    def submit(self, row: Any) -> asyncio.Future:
+        return self.submit_many([row])
+
+    def submit_many(self, rows: list[Any]) -> asyncio.Future:
+        if self._closing:
+            raise RuntimeError("La cola de envíos se está cerrando")
+        if self._task is None or self._task.done():
+            # arranque perezoso (p.ej. sin evento de startup)
+            self._has_items = asyncio.Event()
+            self._full = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+        fut = asyncio.get_running_loop().create_future()
+        if not rows:
+            fut.set_result(None)
+            return fut
+
+        self._pending.append((list(rows), fut))
+        self._pending_rows += len(rows)
+        self._has_items.set()
+        if self._pending_rows >= self.max_batch:
+            self._full.set()
+        return fut
+
+    async def _run(self) -> None:
+        while True:
+            await self._has_items.wait()
+            if not self._closing and self._pending_rows < self.max_batch:
+                try:
+                    await asyncio.wait_for(self._full.wait(), timeout=self.max_delay)
+                except asyncio.TimeoutError:
+                    pass
+            await self._flush()
+            if self._closing and not self._pending:
+                return
+
+    async def _flush(self) -> None:
+        # unidades completas hasta llenar el lote (al menos una)
+        batch: list[tuple[list[Any], asyncio.Future]] = []
+        n = 0
+        while self._pending and (not batch or n + len(self._pending[0][0]) <= self.max_batch):
+            unit = self._pending.pop(0)
+            batch.append(unit)
+            n += len(unit[0])
+        self._pending_rows -= n
+
+        if self._pending_rows < self.max_batch:
+            self._full.clear()
+        if not self._pending:
+            self._has_items.clear()
+        if not batch:
+            return
+
+        rows = [row for unit_rows, _ in batch for row in unit_rows]
+        try:
+            await self._write_with_retries(rows)
+        except Exception as e:
+            self.failed_batches += 1
+            if not await self._spill_batch(rows, e):
+                for _, fut in batch:
+                    if not fut.done():
+                        fut.set_exception(e)
+                return
+        else:
+            self.written_rows += len(rows)
+            self.written_batches += 1
+
+        for _, fut in batch:
+            if not fut.done():
+                fut.set_result(None)
+
+    async def _write_with_retries(self, rows: list[Any]) -> None:
+        for attempt in range(self.retries + 1):
+            try:
+                await asyncio.to_thread(self._write_batch, rows)
+                return
+            except Exception as e:
+                if attempt == self.retries:
+                    raise
+                if attempt == 0:
+                    self.retried_batches += 1
+                delay = min(5.0, self.retry_base * 2 ** attempt)
+                logger.warning("Fallo escribiendo %d selecciones (%r); reintento en %.1f s", len(rows), e, delay)
+                await asyncio.sleep(delay)
+
+    async def _spill_batch(self, rows: list[Any], error: Exception) -> bool:
+        if self._spill is None:
+            return False
+        try:
+            await asyncio.to_thread(self._spill, rows)
+        except Exception as e:
+            # último recurso: que las filas queden al menos en el log
+            logger.error("Lote de %d selecciones perdido (%r, %r): %r", len(rows), error, e, rows)
+            return False
+        self.spilled_rows += len(rows)
+        logger.warning("Lote de %d selecciones aparcado tras %r", len(rows), error)
+        return True
+
+    async def stop(self) -> None:
+        """Vacía la cola (todo lo pendiente se escribe) y para la tarea."""
+        self._closing = True
+        if self._task and not self._task.done():
+            self._has_items.set()
+            self._full.set()
+            await self._task
+        elif self._pending:
+            while self._pending:
+                await self._flush()
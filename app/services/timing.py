@@ -0,0 +1,121 @@
+from __future__ import annotations
+
+import bisect
+import functools
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Spans de la petición en curso (los pone el middleware de main.py).
+# Los endpoints síncronos corren en el threadpool con una copia del contexto,
+# pero la lista es la misma: lo que se añade allí lo ve el middleware.
+_request_spans: ContextVar[list | None] = ContextVar("zp_request_spans", default=None)
+
+# Límites de los buckets en ms (el último bucket es +Inf)
+BUCKETS_MS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS_MS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, ms: float) -> None:
+        i = bisect.bisect_left(self.buckets, ms)
+        with self._lock:
+            self.counts[i] += 1
+            self.count += 1
+            self.total += ms
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            counts = list(self.counts)
+            count = self.count
+            total = self.total
+        return {
+            "count": count,
+            "sum_ms": round(total, 3),
+            "buckets": dict(zip([*map(str, self.buckets), "+Inf"], counts)),
+        }
+
+
+_histograms: dict[str, Histogram] = {}
+_histograms_lock = threading.Lock()
+
+
+def _histogram(name: str) -> Histogram:
+    h = _histograms.get(name)
+    if h is None:
+        with _histograms_lock:
+            h = _histograms.setdefault(name, Histogram())
+    return h
+
+
+def record(name: str, ms: float) -> None:
+    """Anota una duración: en la petición actual (si hay) y en su histograma."""
+    spans = _request_spans.get()
+    if spans is not None:
+        spans.append((name, ms))
+    _histogram(name).observe(ms)
+
+
+@contextmanager
+def span(name: str):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, (time.perf_counter() - t0) * 1000.0)
+
+
+def timed(name: str):
+    """Decorador: mide cada llamada a la función como un span `name`."""
+    def deco(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return deco
+
+
+def start_request() -> tuple[list, object]:
+    spans: list = []
+    token = _request_spans.set(spans)
+    return spans, token
+
+
+def end_request(token) -> None:
+    _request_spans.reset(token)
+
+
+def server_timing_header(spans: list, total_ms: float | None = None) -> str:
+    """
+    Agrupa por nombre (p.ej. 40 llamadas a get_sales_12m en el PDF) y
+    genera la cabecera Server-Timing.
+    """
+    agg: dict[str, list] = {}
+    for name, ms in spans:
+        a = agg.setdefault(name, [0.0, 0])
+        a[0] += ms
+        a[1] += 1
+
+    parts = []
+    for name, (ms, n) in agg.items():
+        part = f"{name};dur={ms:.1f}"
+        if n > 1:
+            part += f';desc="x{n}"'
+        parts.append(part)
+    if total_ms is not None:
+        parts.append(f"total;dur={total_ms:.1f}")
+    return ", ".join(parts)
+
+
+def histograms_snapshot() -> dict[str, dict]:
+    with _histograms_lock:
+        items = list(_histograms.items())
+    return {name: h.snapshot() for name, h in sorted(items)}
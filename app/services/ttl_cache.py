@@ -0,0 +1,159 @@
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, Hashable
+
+
+class TTLCache:
+    """
+    Caché en memoria con TTL, pensada para lookups de BD (familias, subfamilias...).
+
+    - LRU con tamaño máximo (no crece sin límite con claves arbitrarias).
+    - Single-flight: si varias peticiones piden la misma clave caducada,
+      solo una ejecuta el loader y el resto espera su resultado.
+    - Stale-while-revalidate: pasado el TTL, durante `stale_ttl` se sirve el
+      valor anterior y se refresca en segundo plano.
+    - Contadores de hits/misses para diagnóstico.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        ttl: float,
+        maxsize: int = 256,
+        stale_ttl: float | None = None,
+    ):
+        self.name = name
+        self.ttl = float(ttl)
+        self.stale_ttl = float(ttl if stale_ttl is None else stale_ttl)
+        self.maxsize = max(1, int(maxsize))
+
+        self._lock = threading.Lock()
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self._inflight: dict[Hashable, Future] = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+        self.refreshes = 0
+        self.evictions = 0
+        self.errors = 0
+
+    def get(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        now = time.time()
+
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                ts, value = entry
+                age = now - ts
+                if age < self.ttl:
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                if age < self.ttl + self.stale_ttl:
+                    self._data.move_to_end(key)
+                    self.stale_hits += 1
+                    if key not in self._inflight:
+                        self._start_background_refresh(key, loader)
+                    return value
+
+            self.misses += 1
+            fut = self._inflight.get(key)
+            owner = fut is None
+            if owner:
+                fut = Future()
+                self._inflight[key] = fut
+
+        if not owner:
+            return fut.result()
+
+        return self._load(key, loader, fut)
+
+    def _load(self, key: Hashable, loader: Callable[[], Any], fut: Future) -> Any:
+        try:
+            value = loader()
+        except BaseException as e:
+            with self._lock:
+                self.errors += 1
+                self._inflight.pop(key, None)
+            fut.set_exception(e)
+            raise
+
+        with self._lock:
+            self._data[key] = (time.time(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+            self._inflight.pop(key, None)
+
+        fut.set_result(value)
+        return value
+
+    def _start_background_refresh(self, key: Hashable, loader: Callable[[], Any]) -> None:
+        # Se llama con self._lock tomado
+        fut: Future = Future()
+        self._inflight[key] = fut
+        self.refreshes += 1
+
+        def run():
+            try:
+                self._load(key, loader, fut)
+            except Exception:
+                # El valor anterior sigue sirviéndose hasta que caduque del todo
+                pass
+
+        threading.Thread(target=run, name=f"cache-refresh-{self.name}", daemon=True).start()
+
+    def get_many(self, keys: list[Hashable]) -> dict[Hashable, Any]:
+        """
+        Consulta por lotes (un solo lock): devuelve solo las claves vigentes.
+        Sin loader ni refresco; el llamador calcula y guarda los fallos con set_many.
+        """
+        now = time.time()
+        found: dict[Hashable, Any] = {}
+        with self._lock:
+            for key in keys:
+                entry = self._data.get(key)
+                if entry is not None and (now - entry[0]) < self.ttl:
+                    self._data.move_to_end(key)
+                    found[key] = entry[1]
+                    self.hits += 1
+                else:
+                    self.misses += 1
+        return found
+
+    def set_many(self, items: dict[Hashable, Any]) -> None:
+        now = time.time()
+        with self._lock:
+            for key, value in items.items():
+                self._data[key] = (now, value)
+                self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key: Hashable | None = None) -> None:
+        with self._lock:
+            if key is None:
+                self._data.clear()
+            else:
+                self._data.pop(key, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "name": self.name,
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "stale_hits": self.stale_hits,
+                "misses": self.misses,
+                "refreshes": self.refreshes,
+                "evictions": self.evictions,
+                "errors": self.errors,
+            }
@@ -0,0 +1,68 @@
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from typing import Callable
+
+logger = logging.getLogger("zproveart")
+
+
+class WarmUp:
+    """
+    Pasos de calentamiento al arrancar (plantillas, cachés, pool de BD...).
+
+    run() los ejecuta en orden y anota duración y error de cada uno; un paso
+    que falla no para el resto. `ready` se activa al terminar todos, haya
+    habido errores o no (quedan en status() para /readyz).
+    """
+
+    def __init__(self):
+        self._steps: list[tuple[str, Callable[[], object]]] = []
+        self._status: dict[str, dict] = {}
+        self._lock = threading.Lock()
+        self.ready = threading.Event()
+        self.started_at: float | None = None
+        self.finished_at: float | None = None
+
+    def step(self, name: str):
+        """Decorador: registra `fn` como paso `name`."""
+        def deco(fn):
+            self._steps.append((name, fn))
+            return fn
+        return deco
+
+    def run(self) -> None:
+        self.started_at = time.time()
+        for name, fn in self._steps:
+            with self._lock:
+                self._status[name] = {"state": "running"}
+            t0 = time.perf_counter()
+            try:
+                detail = fn()
+                st = {"state": "ok"}
+                if detail is not None:
+                    st["detail"] = detail
+            except Exception as e:
+                logger.warning("Warm-up '%s' falló: %r", name, e)
+                st = {"state": "error", "error": repr(e)}
+            st["ms"] = round((time.perf_counter() - t0) * 1000.0, 1)
+            with self._lock:
+                self._status[name] = st
+        self.finished_at = time.time()
+        self.ready.set()
+        logger.info("Warm-up terminado en %.0f ms", (self.finished_at - self.started_at) * 1000.0)
+
+    def status(self) -> dict:
+        with self._lock:
+            steps = {name: dict(st) for name, st in self._status.items()}
+        for name, _ in self._steps:
+            steps.setdefault(name, {"state": "pending"})
+        return {
+            "ready": self.ready.is_set(),
+            "duration_ms": (
+                round((self.finished_at - self.started_at) * 1000.0, 1)
+                if self.started_at and self.finished_at else None
+            ),
+            "steps": steps,
+        }
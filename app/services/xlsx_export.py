@@ -0,0 +1,240 @@
+from __future__ import annotations
+
+import math
+import re
+import zipfile
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Callable, Iterable, Iterator
+from xml.sax.saxutils import escape
+
+from app.services.product_formatter import _last_12_months_desc
+
+# (cabecera, columna de la BD)
+PRODUCT_COLUMNS: list[tuple[str, str]] = [
+    ("Artículo", "ITMREF_0"),
+    ("Descripción", "ITMDES_0"),
+    ("Proveedor", "BPSNUM_0"),
+    ("Nombre proveedor", "BPSNAM_0"),
+    ("Familia", "COD_FAM_0"),
+    ("Desc. familia", "DES_FAM_0"),
+    ("Subfamilia", "COD_SUBFAM_ZTP"),
+    ("Comprador", "COD_COM_0"),
+    ("Estado", "ESTADO_0"),
+    ("F. ult. compra", "FUC_0"),
+    ("Ult. cant.", "UQTY_0"),
+    ("FOB neto", "FOB_0"),
+    ("U.P. compra", "PUE_0"),
+    ("PVP T4", "PVPT4_0"),
+    ("Dto %", "DTO_0"),
+    ("% Dif. pdte.", "DIF_0"),
+    ("% Arancel", "ARANCEL_0"),
+    ("Exist. actuales", "EX_ACT_0"),
+    ("Exist. disponibles", "EX_DISP_0"),
+    ("Exist. prev. entrar", "EX_PREV_0"),
+    ("Exist. en SC", "QTY_PEND_SC_0"),
+    ("Ud x caja", "UNXCAJ_0"),
+    ("Ud x palet", "UNXPAL_0"),
+    ("Ud x paquete", "UNXPAQ_0"),
+    ("Cubicaje", "CUBIC_0"),
+    ("Cod. art. prov.", "COD_ART_PRO_0"),
+    ("Nº ventas", "NUM_VENTAS_0"),
+    ("Nº entradas", "NUM_ENTRADAS_0"),
+    ("Nº ocurrencias", "NUM_OCU_0"),
+    ("Nº clientes", "NUM_CLIENTES_0"),
+]
+
+ETA_SLOTS = 3
+
+
+def _cell(v):
+    # Números como números (no texto) para que se puedan sumar/filtrar en Excel
+    if isinstance(v, Decimal):
+        return float(v)
+    if isinstance(v, str):
+        return v.strip()
+    return v
+
+
+def _product_rows(
+    batches: Iterable[list[dict]],
+    sales_fn: Callable[[list[str]], list[dict]],
+    eta_fn: Callable[[list[str]], list[dict]],
+    end_date: date | None = None,
+) -> Iterator[list[list]]:
+    """Cabecera y luego, por cada lote de productos, sus filas (producto + 12 meses + ETA)."""
+    months = _last_12_months_desc(end_date)
+    base = months[0][0] * 12 + months[0][1]
+
+    headers = [h for h, _ in PRODUCT_COLUMNS]
+    headers += [f"Ventas {label} {y}" for y, _, label in months]
+    headers += [f"Compras {label} {y}" for y, _, label in months]
+    for k in range(1, ETA_SLOTS + 1):
+        headers += [f"ETA {k} fecha", f"ETA {k} cant.", f"ETA {k} VCR"]
+    headers.append("ETA total")
+    yield [headers]
+
+    for batch in batches:
+        itmrefs = [p["ITMREF_0"] for p in batch if p.get("ITMREF_0")]
+
+        # ventas: ITMREF -> 12 huecos de (ventas, compras)
+        sales: dict[str, list] = {}
+        for r in sales_fn(itmrefs) if itmrefs else []:
+            off = base - (int(r["ANNO_0"]) * 12 + int(r["MES_0"]))
+            if 0 <= off < 12:
+                arr = sales.setdefault(r["ITMREF_0"], [(None, None)] * 12)
+                arr[off] = (_cell(r.get("VENTAS_0")), _cell(r.get("COMPRAS_0")))
+
+        # ETA: ya vienen ordenadas por ITMREF, FECHA
+        eta: dict[str, list] = {}
+        eta_total: dict[str, int] = {}
+        for r in eta_fn(itmrefs) if itmrefs else []:
+            itm = r["ITMREF_0"]
+            rows = eta.setdefault(itm, [])
+            if len(rows) < ETA_SLOTS:
+                rows.append((r.get("FECHA_0"), _cell(r.get("QTY_0")), _cell(r.get("VCR_0"))))
+            eta_total[itm] = max(eta_total.get(itm, 0) + 1, int(r.get("CNT_0") or 0))
+
+        out = []
+        for p in batch:
+            itm = p.get("ITMREF_0")
+            row = [_cell(p.get(col)) for _, col in PRODUCT_COLUMNS]
+
+            slots = sales.get(itm) or [(None, None)] * 12
+            row += [v for v, _ in slots]
+            row += [c for _, c in slots]
+
+            rows = eta.get(itm, [])
+            for k in range(ETA_SLOTS):
+                row += list(rows[k]) if k < len(rows) else [None, None, None]
+            row.append(eta_total.get(itm, 0))
+            out.append(row)
+        yield out
+
+
+# =========================
+# XLSX EN STREAMING
+# =========================
+# openpyxl (incluso write-only) guarda la hoja en un temporal y no escribe
+# el .xlsx hasta save(): el primer byte sale cuando ya está todo hecho. Aquí
+# el XML de la hoja se genera lote a lote dentro del zip y cada trozo
+# comprimido se entrega en cuanto existe. Partes mínimas: libro, una hoja
+# con textos en línea (sin sharedStrings) y un estilo de fecha.
+_XLSX_PARTS = (
+    ("[Content_Types].xml",
+     '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+     '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+     '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+     '<Default Extension="xml" ContentType="application/xml"/>'
+     '<Override PartName="/xl/workbook.xml" '
+     'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+     '<Override PartName="/xl/worksheets/sheet1.xml" '
+     'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+     '<Override PartName="/xl/styles.xml" '
+     'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+     '</Types>'),
+    ("_rels/.rels",
+     '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+     '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+     '<Relationship Id="rId1" Target="xl/workbook.xml" '
+     'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"/>'
+     '</Relationships>'),
+    ("xl/workbook.xml",
+     '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+     '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+     'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+     '<sheets><sheet name="ZPROVEART" sheetId="1" r:id="rId1"/></sheets></workbook>'),
+    ("xl/_rels/workbook.xml.rels",
+     '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+     '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+     '<Relationship Id="rId1" Target="worksheets/sheet1.xml" '
+     'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet"/>'
+     '<Relationship Id="rId2" Target="styles.xml" '
+     'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles"/>'
+     '</Relationships>'),
+    ("xl/styles.xml",
+     '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+     '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+     '<fonts count="1"><font><sz val="11"/><name val="Calibri"/></font></fonts>'
+     '<fills count="2"><fill><patternFill patternType="none"/></fill>'
+     '<fill><patternFill patternType="gray125"/></fill></fills>'
+     '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+     '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+     '<cellXfs count="2"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+     '<xf numFmtId="14" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/></cellXfs>'
+     '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+     '</styleSheet>'),
+)
+_SHEET_HEAD = (
+    b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+)
+_SHEET_TAIL = b"</sheetData></worksheet>"
+
+_EXCEL_EPOCH = date(1899, 12, 30)
+# caracteres de control que XML 1.0 no admite (pueden venir de la BD)
+_XML_ILLEGAL = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+
+def _cell_xml(v) -> str:
+    if v is None or v == "":
+        return "<c/>"
+    if isinstance(v, bool):
+        return f'<c t="b"><v>{int(v)}</v></c>'
+    if isinstance(v, (int, float)):
+        if isinstance(v, float) and not math.isfinite(v):
+            return "<c/>"
+        return f"<c><v>{v!r}</v></c>"
+    if isinstance(v, datetime):
+        v = v.date()
+    if isinstance(v, date):
+        return f'<c s="1"><v>{(v - _EXCEL_EPOCH).days}</v></c>'
+    return f'<c t="inlineStr"><is><t>{escape(_XML_ILLEGAL.sub("", str(v)))}</t></is></c>'
+
+
+class _Chunks:
+    """Destino del zip: acumula lo escrito hasta que el generador lo entrega."""
+
+    def __init__(self):
+        self._parts: list[bytes] = []
+
+    def write(self, b) -> int:
+        self._parts.append(bytes(b))
+        return len(b)
+
+    def flush(self) -> None:
+        pass
+
+    def take(self) -> bytes:
+        out = b"".join(self._parts)
+        self._parts.clear()
+        return out
+
+
+def iter_products_xlsx(
+    batches: Iterable[list[dict]],
+    sales_fn: Callable[[list[str]], list[dict]],
+    eta_fn: Callable[[list[str]], list[dict]],
+    end_date: date | None = None,
+) -> Iterator[bytes]:
+    """
+    Listado filtrado (producto + 12 meses + ETA) como .xlsx, en trozos: cada
+    lote de `batches` se convierte, se comprime y se entrega antes de leer
+    el siguiente. Memoria constante y primer byte tras el primer lote.
+    """
+    sink = _Chunks()
+    # sin seek(): zipfile usa descriptores de datos detrás de cada fichero
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        for name, xml in _XLSX_PARTS:
+            zf.writestr(name, xml)
+        with zf.open("xl/worksheets/sheet1.xml", "w") as sheet:
+            sheet.write(_SHEET_HEAD)
+            for rows in _product_rows(batches, sales_fn, eta_fn, end_date):
+                sheet.write("".join(
+                    "<row>" + "".join(map(_cell_xml, row)) + "</row>" for row in rows
+                ).encode("utf-8"))
+                chunk = sink.take()
+                if chunk:
+                    yield chunk
+            sheet.write(_SHEET_TAIL)
+    yield sink.take()
@@ -1,45 +1,96 @@
 // =========================
 // Submit AJAX (solo forms .js-send)
+// Los "Enviar" se agrupan: se guardan juntos en /zproveart/submit/bulk
+// (una petición y una escritura para varios clics seguidos)
 // =========================
-document.addEventListener("submit", async function (e) {
-  const form = e.target;
-  if (!(form instanceof HTMLFormElement)) return;
-  if (!form.classList.contains("js-send")) return;
+const SEND_BATCH_DELAY_MS = 400;
+const sendPending = new Map();   // itmref -> { item, buttons[] }
+let sendTimer = null;
 
-  e.preventDefault();
+function setSendButton(button, text, disabled) {
+  if (!button) return;
+  button.textContent = text;
+  button.disabled = disabled;
+}
 
-  const button = form.querySelector("button[type='submit']");
-  const originalText = button ? button.textContent : "";
+function resetSendButtonLater(button, originalText) {
+  setTimeout(() => {
+    if (button) {
+      button.textContent = originalText;
+      button.disabled = false;
+    }
+  }, 2000);
+}
 
-  if (button) {
-    button.disabled = true;
-    button.textContent = "Guardando...";
-  }
+async function flushSendBatch() {
+  clearTimeout(sendTimer);
+  sendTimer = null;
+  if (!sendPending.size) return;
 
+  const entries = Array.from(sendPending.values());
+  sendPending.clear();
+
+  let ok = false;
   try {
-    const response = await fetch(form.action, {
+    const response = await fetch("/zproveart/submit/bulk", {
       method: "POST",
-      body: new FormData(form),
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify({ items: entries.map(e => e.item) }),
     });
-
-    if (button) {
-      button.textContent = response.ok ? "Guardado" : "Error";
-      if (!response.ok) button.disabled = false;
-    }
+    ok = response.ok;
   } catch (err) {
     console.error(err);
-    if (button) {
-      button.textContent = "Error";
-      button.disabled = false;
-    }
   }
 
-  setTimeout(() => {
-    if (button) {
-      button.textContent = originalText;
-      button.disabled = false;
-    }
-  }, 2000);
+  entries.forEach(e => {
+    e.buttons.forEach(({ button, originalText }) => {
+      setSendButton(button, ok ? "Guardado" : "Error", ok);
+      resetSendButtonLater(button, originalText);
+    });
+  });
+}
+
+document.addEventListener("submit", function (e) {
+  const form = e.target;
+  if (!(form instanceof HTMLFormElement)) return;
+  if (!form.classList.contains("js-send")) return;
+
+  e.preventDefault();
+
+  const fd = new FormData(form);
+  const itmref = String(fd.get("itmref") || "").trim();
+  if (!itmref) return;
+
+  const button = form.querySelector("button[type='submit']");
+  const originalText = button ? (button.dataset.originalText || button.textContent) : "";
+  if (button) button.dataset.originalText = originalText;
+  setSendButton(button, "Guardando...", true);
+
+  // Si la misma tarjeta se envía otra vez antes de salir, gana el último estado
+  const prev = sendPending.get(itmref);
+  sendPending.set(itmref, {
+    item: {
+      itmref,
+      bpsnum: String(fd.get("bpsnum") || "").trim(),
+      selected: fd.get("selected") === "1",
+      comment: String(fd.get("comment") || "").trim(),
+    },
+    buttons: (prev ? prev.buttons : []).concat([{ button, originalText }]),
+  });
+
+  clearTimeout(sendTimer);
+  sendTimer = setTimeout(flushSendBatch, SEND_BATCH_DELAY_MS);
+});
+
+// Si se sale de la página con envíos pendientes, se mandan igualmente
+window.addEventListener("pagehide", function () {
+  if (!sendPending.size) return;
+  const items = Array.from(sendPending.values()).map(e => e.item);
+  sendPending.clear();
+  navigator.sendBeacon(
+    "/zproveart/submit/bulk",
+    new Blob([JSON.stringify({ items })], { type: "application/json" })
+  );
 });
 
 // =========================
@@ -113,11 +164,13 @@ document.addEventListener("DOMContentLoaded", () => {
     return map;
   }
 
-  async function fetchSubfamilies(fam) {
-    const res = await fetch(`/api/zproveart/subfamilies?family=${encodeURIComponent(fam)}`);
+  async function fetchSubfamiliesBatch(fams) {
+    const params = new URLSearchParams();
+    fams.forEach(f => params.append("family", f));
+    const res = await fetch(`/api/zproveart/subfamilies/batch?${params.toString()}`);
     if (!res.ok) throw new Error("Error cargando subfamilias");
     const data = await res.json();
-    return Array.isArray(data.subfamilies) ? data.subfamilies : [];
+    return data.subfamilies || {};
   }
 
   function renderFamilyBlock(fam, rows, prevSet) {
@@ -199,8 +252,10 @@ document.addEventListener("DOMContentLoaded", () => {
     wrapper.className = "subfam-wrapper";
     container.appendChild(wrapper);
 
+    // Una sola petición para todas las familias marcadas
+    const byFam = await fetchSubfamiliesBatch(fams);
     for (const fam of fams) {
-      const rows = await fetchSubfamilies(fam);
+      const rows = Array.isArray(byFam[fam]) ? byFam[fam] : [];
       wrapper.appendChild(renderFamilyBlock(fam, rows, useMap.get(fam)));
     }
   }
@@ -251,6 +306,32 @@ document.addEventListener("click", function (e) {
   }, 15000);
 });
 
+// =========================
+// Exportar Excel (mismos filtros que el form)
+// =========================
+document.addEventListener("click", function (e) {
+  const btn = e.target.closest("#btnXlsx");
+  if (!btn) return;
+
+  const form = btn.closest("form");
+  if (!form) return;
+
+  const fd = new FormData(form);
+  const params = new URLSearchParams();
+
+  for (const [key, value] of fd.entries()) {
+    const v = String(value ?? "").trim();
+    if (!v) continue;
+    params.append(key, v);
+  }
+
+  params.delete("page");
+  params.delete("page_size");
+
+  // Descarga directa (Content-Disposition: attachment)
+  window.location.href = "/zproveart/xlsx" + (params.toString() ? "?" + params.toString() : "");
+});
+
 // =========================
 // Popup lookup (proveedor/comprador)
 // =========================
@@ -329,6 +410,9 @@ window.setLookupValue = function(targetId, value) {
   let debounceTimer = null;
   let aborter = null;
 
+  // Compradores: se piden una vez y se filtran en local
+  let buyersCache = null;
+
   function debounce(fn, ms) {
     return (...args) => {
       clearTimeout(debounceTimer);
@@ -356,22 +440,30 @@ window.setLookupValue = function(targetId, value) {
       if (aborter) aborter.abort();
       aborter = new AbortController();
 
-      let url = "";
-      if (cfg.kind === "supplier") {
-        url = `/api/lookup/suppliers?q=${encodeURIComponent(q)}&limit=80`;
+      let items = [];
+      if (cfg.kind === "buyer" && buyersCache) {
+        items = buyersCache;
       } else {
-        url = `/api/lookup/buyers`;
+        let url = "";
+        if (cfg.kind === "supplier") {
+          url = `/api/lookup/suppliers?q=${encodeURIComponent(q)}&limit=80`;
+        } else {
+          url = `/api/lookup/buyers`;
+        }
+
+        // buyers: el navegador revalida con ETag (304 si no ha cambiado)
+        const res = await fetch(url, {
+          headers: { "Accept":"application/json" },
+          cache: cfg.kind === "buyer" ? "no-cache" : "default",
+          signal: aborter.signal
+        });
+        if (!res.ok) throw new Error("HTTP " + res.status);
+
+        const data = await res.json();
+        items = data.items || [];
+        if (cfg.kind === "buyer") buyersCache = items;
       }
 
-      const res = await fetch(url, {
-        headers: { "Accept":"application/json" },
-        signal: aborter.signal
-      });
-      if (!res.ok) throw new Error("HTTP " + res.status);
-
-      const data = await res.json();
-      let items = data.items || [];
-
       // filtro local para buyer (opc)
       if (cfg.kind === "buyer" && q) {
         items = items.filter(x => String(x.COD_COM_0 || "").includes(q));
@@ -409,6 +501,11 @@ window.setLookupValue = function(targetId, value) {
   // Botón buscar sigue funcionando
   btnSearch?.addEventListener("click", load);
 
+  // Compradores: filtro local sobre la copia cacheada mientras se escribe
+  if (cfg.kind === "buyer") {
+    qEl.addEventListener("input", () => { if (buyersCache) load(); });
+  }
+
   // Enter busca
   qEl.addEventListener("keydown", (e) => {
     if (e.key === "Enter") {
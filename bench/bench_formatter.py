@@ -0,0 +1,53 @@
+"""
+Compara la ruta fila a fila con la columnar de product_formatter.
+
+    python -m bench.bench_formatter [n_products] [repeats]
+"""
+from __future__ import annotations
+
+import json
+import sys
+import time
+
+from app.services import product_formatter as pf
+from bench.synthetic import make_products
+
+
+def _best_of(fn, repeats: int) -> float:
+    best = float("inf")
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main(n: int = 20000, repeats: int = 5) -> dict:
+    products = make_products(n)
+
+    rows = pf._format_products_rows(products)
+    cols = pf._format_products_columnar(products)
+
+    # Mismo contenido y mismo orden de claves -> mismos bytes
+    a = json.dumps(rows, default=str, ensure_ascii=False)
+    b = json.dumps(cols, default=str, ensure_ascii=False)
+    if a != b:
+        raise SystemExit("ERROR: la salida columnar no coincide con la ruta por filas")
+
+    t_rows = _best_of(lambda: pf._format_products_rows(products), repeats)
+    t_cols = _best_of(lambda: pf._format_products_columnar(products), repeats)
+
+    result = {
+        "n_products": n,
+        "rows_s": round(t_rows, 4),
+        "columnar_s": round(t_cols, 4),
+        "speedup": round(t_rows / t_cols, 2) if t_cols else None,
+        "identical": True,
+    }
+    print(json.dumps(result))
+    return result
+
+
+if __name__ == "__main__":
+    args = [int(a) for a in sys.argv[1:3]]
+    main(*args)
@@ -0,0 +1,104 @@
+"""
+Memoria y número de asignaciones de format_products medidos con tracemalloc.
+
+Compara:
+  - copy_per_stage: como antes, cada etapa _format_* hacía dict(p)
+  - rows_in_place:  una copia por producto, etapas in situ
+  - columnar:       ruta por columnas (la que usa format_products)
+
+y lo que ocupa en memoria cada entrada de la caché de productos formateados
+(registro + huella, con ventas y ETA), que fija su tamaño máximo.
+
+    python -m bench.bench_formatter_alloc [n_products]
+"""
+from __future__ import annotations
+
+import gc
+import json
+import sys
+import time
+import tracemalloc
+
+from app.services import product_formatter as pf
+from bench.synthetic import make_eta_rows, make_products, make_sales_rows
+
+
+def _copy_per_stage(products: list[dict]) -> list[dict]:
+    out = []
+    for p in products:
+        p2 = p
+        for stage in pf._ROW_STAGES:
+            p2 = stage(dict(p2))
+        out.append(p2)
+    return out
+
+
+def _measure(fn, products: list[dict]) -> dict:
+    gc.collect()
+    t0 = time.perf_counter()
+    fn(products)
+    seconds = time.perf_counter() - t0
+
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+
+    result = fn(products)
+
+    after = tracemalloc.take_snapshot()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    diff = after.compare_to(before, "filename")
+    retained = sum(s.size_diff for s in diff)
+    blocks = sum(s.count_diff for s in diff)
+    del result
+
+    return {
+        "seconds": round(seconds, 4),
+        "peak_mb": round(peak / 1e6, 2),
+        "retained_mb": round(retained / 1e6, 2),
+        "retained_blocks": blocks,
+    }
+
+
+def _measure_cache(products: list[dict]) -> dict:
+    sales_rows = make_sales_rows(products)
+    eta_rows = make_eta_rows(products)
+    pf._PRODUCTS_CACHE.invalidate()
+    gc.collect()
+
+    tracemalloc.start()
+    pf.format_products(products, sales_rows=sales_rows, eta_rows=eta_rows)
+    gc.collect()
+    retained, _ = tracemalloc.get_traced_memory()  # solo queda lo que guarda la caché
+    tracemalloc.stop()
+
+    entries = pf.product_cache_stats()["size"]
+    pf._PRODUCTS_CACHE.invalidate()
+    return {
+        "entries": entries,
+        "retained_mb": round(retained / 1e6, 2),
+        "bytes_per_entry": round(retained / max(entries, 1)),
+        "maxsize": pf._PRODUCTS_CACHE.maxsize,
+    }
+
+
+def main(n: int = 20000) -> dict:
+    products = make_products(n)
+
+    result = {"n_products": n}
+    for name, fn in (
+        ("copy_per_stage", _copy_per_stage),
+        ("rows_in_place", pf._format_products_rows),
+        ("columnar", pf._format_products_columnar),
+    ):
+        result[name] = _measure(fn, products)
+    result["products_cache"] = _measure_cache(products)
+
+    print(json.dumps(result))
+    return result
+
+
+if __name__ == "__main__":
+    main(*[int(a) for a in sys.argv[1:2]])
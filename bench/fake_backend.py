@@ -0,0 +1,180 @@
+"""
+Sustituto en memoria de app.db.sqlserver para medir sin SQL Server.
+
+    backend = FakeBackend(n_products=5000)
+    with install(backend):
+        ...  # app.main y app.db.sqlserver usan los datos sintéticos
+
+Expone las mismas funciones públicas (mismas firmas y misma forma de filas)
+que sqlserver.py. Se puede enchufar otro backend con la misma interfaz,
+p.ej. uno que lea de un volcado real: --backend paquete.modulo:Clase
+"""
+from __future__ import annotations
+
+import hashlib
+import importlib
+import json
+import sys
+import time
+from contextlib import contextmanager
+from datetime import date
+
+from bench.synthetic import make_eta_rows, make_products, make_sales_rows
+
+# Funciones de sqlserver.py que se sustituyen (y que main.py importa por nombre)
+BACKEND_FUNCTIONS = (
+    "count_products",
+    "get_products",
+    "get_products_all",
+    "iter_products_all",
+    "get_sales_12m",
+    "get_eta_rows",
+    "get_fams_cached",
+    "get_subfams_cached",
+    "get_subfams_batch_cached",
+    "get_subfams_map_cached",
+    "get_buyers_cached",
+    "search_suppliers",
+)
+
+# Lo que una medida con este backend NO incluye (se copia en los informes)
+LIMITATIONS = (
+    "sin SQL Server: no se ejercitan las consultas SQL, pyodbc, el pool de "
+    "conexiones ni sqlserver._cursor/TracedCursor (query_log queda vacío); "
+    "cada consulta cuesta una latencia fija simulada",
+    "datos sintéticos (bench.synthetic): tamaños y distribución no son los de producción",
+)
+
+
+class FakeBackend:
+    """Datos sintéticos fijos (semilla) + latencia opcional por consulta."""
+
+    def __init__(self, n_products: int, latency_ms: float = 0.0, end_date: date | None = None):
+        self.latency = max(0.0, latency_ms) / 1000.0
+        self.products = make_products(n_products)
+        self._by_itm = {p["ITMREF_0"]: p for p in self.products}
+
+        # Ventas/ETA indexadas por ITMREF (se generan una vez)
+        self._sales: dict[str, list[dict]] = {}
+        for r in make_sales_rows(self.products, end=end_date):
+            self._sales.setdefault(r["ITMREF_0"], []).append(r)
+        self._eta: dict[str, list[dict]] = {}
+        for r in make_eta_rows(self.products):
+            self._eta.setdefault(r["ITMREF_0"], []).append(r)
+
+        self._fams = sorted({p["COD_FAM_0"] for p in self.products})
+        self._subfams: dict[str, list[dict]] = {}
+        for p in self.products:
+            subs = self._subfams.setdefault(p["COD_FAM_0"], [])
+            if not any(s["COD_SUBFAM"] == p["COD_SUBFAM_ZTP"] for s in subs):
+                subs.append({"COD_SUBFAM": p["COD_SUBFAM_ZTP"], "DES_SUBFAM": f"Subfamilia {p['COD_SUBFAM_ZTP']}"})
+        for subs in self._subfams.values():
+            subs.sort(key=lambda s: s["COD_SUBFAM"])
+
+        buyers = sorted({(p.get("COD_COM_0") or "").strip() for p in self.products} - {""})
+        self._buyers = [{"COD_COM_0": b} for b in buyers]
+        raw = json.dumps(self._buyers, sort_keys=True).encode("utf-8")
+        self._buyers_etag = '"' + hashlib.sha1(raw).hexdigest()[:16] + '"'
+
+    def _wait(self) -> None:
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _filtered(self, families=None, subfams_by_fam=None, **_ignored) -> list[dict]:
+        fams = set(families or [])
+        subs = {s for vals in (subfams_by_fam or {}).values() for s in vals}
+        out = self.products
+        if fams:
+            out = [p for p in out if p["COD_FAM_0"] in fams]
+        if subs:
+            out = [p for p in out if p["COD_SUBFAM_ZTP"] in subs]
+        return out
+
+    # --- mismas firmas que sqlserver.py ---
+
+    def count_products(self, **filters) -> int:
+        self._wait()
+        return len(self._filtered(**filters))
+
+    def get_products(self, page: int = 1, page_size: int = 3, years=None, **filters) -> list[dict]:
+        self._wait()
+        start = (max(1, page) - 1) * page_size
+        return [dict(p) for p in self._filtered(**filters)[start:start + page_size]]
+
+    def get_products_all(self, years=None, max_rows: int = 5000, **filters) -> list[dict]:
+        self._wait()
+        return [dict(p) for p in self._filtered(**filters)[:max_rows]]
+
+    def iter_products_all(self, years=None, max_rows: int = 5000, batch_size: int = 1000, **filters):
+        self._wait()
+        rows = self._filtered(**filters)[:max_rows]
+        for i in range(0, len(rows), batch_size):
+            yield [dict(p) for p in rows[i:i + batch_size]]
+
+    def get_sales_12m(self, itmrefs: list[str]) -> list[dict]:
+        self._wait()
+        return [r for itm in itmrefs for r in self._sales.get(itm, ())]
+
+    def get_eta_rows(self, itmrefs: list[str], max_per_item: int = 3) -> list[dict]:
+        self._wait()
+        out = []
+        for itm in itmrefs:
+            rows = self._eta.get(itm, ())
+            for r in rows[:max_per_item]:
+                out.append({**r, "CNT_0": len(rows)})
+        return out
+
+    def get_fams_cached(self) -> list[dict]:
+        return [{"COD_FAM_0": f, "DES_FAM_0": f"Familia {f}"} for f in self._fams]
+
+    def get_subfams_map_cached(self) -> dict[str, list[dict]]:
+        return self._subfams
+
+    def get_subfams_cached(self, cod_fam: str) -> list[dict]:
+        return self._subfams.get(str(cod_fam).strip(), [])
+
+    def get_subfams_batch_cached(self, cod_fams: list[str]) -> dict[str, list[dict]]:
+        return {f: self._subfams.get(f, []) for f in cod_fams}
+
+    def get_buyers_cached(self) -> tuple[list[dict], str]:
+        return self._buyers, self._buyers_etag
+
+    def search_suppliers(self, q: str, limit: int = 60) -> list[dict]:
+        self._wait()
+        q = (q or "").strip().upper()
+        seen: dict[str, dict] = {}
+        for p in self.products:
+            if q in p["BPSNUM_0"] or q in p["BPSNAM_0"].upper():
+                seen.setdefault(p["BPSNUM_0"], {"BPSNUM_0": p["BPSNUM_0"], "BPSNAM_0": p["BPSNAM_0"]})
+                if len(seen) >= limit:
+                    break
+        return list(seen.values())
+
+
+def load_backend(spec: str, n_products: int, **kwargs):
+    """`paquete.modulo:Clase` -> instancia (Clase(n_products, **kwargs))."""
+    mod_name, _, cls_name = spec.partition(":")
+    cls = getattr(importlib.import_module(mod_name), cls_name or "FakeBackend")
+    return cls(n_products, **kwargs)
+
+
+@contextmanager
+def install(backend, modules: tuple[str, ...] = ("app.db.sqlserver", "app.main")):
+    """
+    Sustituye las funciones de BD por las del backend en los módulos ya
+    importados (main.py las importa por nombre, hay que parchear ambos).
+    """
+    saved: list[tuple[object, str, object]] = []
+    try:
+        for mod_name in modules:
+            mod = sys.modules.get(mod_name)
+            if mod is None:
+                continue
+            for name in BACKEND_FUNCTIONS:
+                if hasattr(mod, name) and hasattr(backend, name):
+                    saved.append((mod, name, getattr(mod, name)))
+                    setattr(mod, name, getattr(backend, name))
+        yield backend
+    finally:
+        for mod, name, fn in reversed(saved):
+            setattr(mod, name, fn)
@@ -0,0 +1,327 @@
+"""
+Prueba de carga de extremo a extremo (HTTP real) con sustitutos locales de
+SQL Server (bench.loadtest_app) y del servidor de fotos 192.168.1.82.
+
+    python -m bench.loadtest --workers 2 --concurrency 32 --duration 60
+    python -m bench.loadtest --mix page=60,foto=30,suppliers=5,submit=5 --out load.json
+    python -m bench.loadtest --url http://127.0.0.1:8000   # app ya arrancada
+
+Rutas: page (/zproveart paginando), foto (/foto), suppliers
+(/api/lookup/suppliers), submit (/zproveart/submit) y pdf (/zproveart/pdf,
+una subfamilia; necesita Chromium de Playwright).
+
+Informa por ruta: peticiones, errores, tasa de error, rps, p50/p95/p99/max.
+
+Con la app local (sin --url) no hay SQL Server: ver las limitaciones en
+bench.loadtest_app; el informe las repite en meta.limitations.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import httpx
+
+from bench.fake_backend import LIMITATIONS
+
+ROOT = Path(__file__).resolve().parent.parent
+DEFAULT_MIX = "page=50,foto=30,suppliers=10,submit=9,pdf=1"
+PAGE_SIZE = 3  # igual que la galería
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+# =========================
+# Servidor de fotos local
+# =========================
+def start_image_server(latency_ms: float, size_kb: int) -> tuple[ThreadingHTTPServer, int]:
+    """Devuelve bytes deterministas por ruta (como una foto real) tras `latency_ms`."""
+    size = max(1, size_kb) * 1024
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if latency_ms:
+                time.sleep(latency_ms / 1000.0)
+            if not self.path.startswith("/img/"):
+                self.send_error(404)
+                return
+            seed = hashlib.sha1(self.path.encode("utf-8")).digest()
+            body = b"\xff\xd8\xff\xe0" + (seed * (size // len(seed) + 1))[: size - 6] + b"\xff\xd9"
+            self.send_response(200)
+            self.send_header("Content-Type", "image/jpeg")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", _free_port()), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="fake-images", daemon=True).start()
+    return server, server.server_address[1]
+
+
+# =========================
+# App bajo prueba
+# =========================
+def start_app(args, workdir: Path) -> tuple[subprocess.Popen, str]:
+    port = _free_port()
+    env = {
+        **os.environ,
+        "ZPROVEART_FAKE_PRODUCTS": str(args.products),
+        "ZPROVEART_FAKE_LATENCY_MS": str(args.db_latency_ms),
+        "ZPROVEART_IMAGE_HOST": "127.0.0.1",
+        "ZPROVEART_EXPORT_DIR": str(workdir / "exports"),
+        "ZPROVEART_METRICS_DIR": str(workdir / "metrics"),
+        "ZPROVEART_LOAD_USERS": str(args.concurrency),
+    }
+    proc = subprocess.Popen(
+        [
+            sys.executable, "-m", "uvicorn", "bench.loadtest_app:app",
+            "--host", "127.0.0.1", "--port", str(port),
+            "--workers", str(args.workers), "--log-level", "warning",
+        ],
+        cwd=ROOT,
+        env=env,
+    )
+    url = f"http://127.0.0.1:{port}"
+
+    deadline = time.time() + 120
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise SystemExit(f"uvicorn terminó al arrancar (código {proc.returncode})")
+        try:
+            if httpx.get(f"{url}/readyz", timeout=2).status_code == 200:
+                return proc, url
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    proc.terminate()
+    raise SystemExit("uvicorn no respondió a tiempo")
+
+
+# =========================
+# Carga
+# =========================
+def parse_mix(spec: str) -> dict[str, int]:
+    mix = {}
+    for part in spec.split(","):
+        if not part.strip():
+            continue
+        name, _, weight = part.partition("=")
+        mix[name.strip()] = int(weight or 1)
+    unknown = set(mix) - set(ROUTES)
+    if unknown:
+        raise SystemExit(f"Rutas desconocidas en --mix: {', '.join(sorted(unknown))}")
+    return {k: v for k, v in mix.items() if v > 0}
+
+
+def _itmref(rnd: random.Random, n_products: int) -> str:
+    return f"A{rnd.randrange(n_products):07d}"
+
+
+async def r_page(client, rnd, ctx):
+    fam = f"{rnd.randrange(40):02d}" if rnd.random() < 0.5 else None
+    n = ctx["products"] // 40 if fam else ctx["products"]
+    params = {"page": str(rnd.randint(1, max(1, math.ceil(n / PAGE_SIZE))))}
+    if fam:
+        params["family"] = fam
+    return await client.get("/zproveart", params=params)
+
+
+async def r_foto(client, rnd, ctx):
+    u = f"http://127.0.0.1:{ctx['image_port']}/img/{_itmref(rnd, ctx['products'])}.jpg"
+    return await client.get("/foto", params={"u": u})
+
+
+async def r_suppliers(client, rnd, ctx):
+    q = f"P{rnd.randrange(ctx['products'] // 25 + 1):05d}"[: rnd.randint(2, 6)]
+    return await client.get("/api/lookup/suppliers", params={"q": q})
+
+
+async def r_submit(client, rnd, ctx):
+    itm = _itmref(rnd, ctx["products"])
+    return await client.post("/zproveart/submit", data={
+        "itmref": itm,
+        "bpsnum": f"P{int(itm[1:]) // 25:05d}",
+        "selected": "1" if rnd.random() < 0.7 else "0",
+        "comment": "carga",
+    })
+
+
+async def r_pdf(client, rnd, ctx):
+    fam = f"{rnd.randrange(40):02d}"
+    sub = f"{fam}{rnd.randrange(9):02d}"
+    return await client.get("/zproveart/pdf", params={"family": fam, f"subfam_{fam}": sub})
+
+
+ROUTES = {
+    "page": r_page,
+    "foto": r_foto,
+    "suppliers": r_suppliers,
+    "submit": r_submit,
+    "pdf": r_pdf,
+}
+
+
+async def virtual_user(uid: int, url: str, ctx: dict, stop_at: float, warm_until: float, samples: dict):
+    rnd = random.Random(uid)
+    names = list(ctx["mix"])
+    weights = [ctx["mix"][n] for n in names]
+
+    async with httpx.AsyncClient(base_url=url, timeout=ctx["timeout"], follow_redirects=False) as client:
+        await client.post("/login", data={"username": f"load{uid}", "password": "x"})
+        while time.perf_counter() < stop_at:
+            name = rnd.choices(names, weights)[0]
+            t0 = time.perf_counter()
+            try:
+                r = await ROUTES[name](client, rnd, ctx)
+                await r.aread()
+                status = r.status_code
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            t1 = time.perf_counter()
+            if t0 >= warm_until:
+                samples[name].append((t1 - t0, status))
+
+
+def _pct(sorted_vals: list[float], p: float) -> float | None:
+    if not sorted_vals:
+        return None
+    k = max(0, min(len(sorted_vals) - 1, math.ceil(p / 100.0 * len(sorted_vals)) - 1))
+    return sorted_vals[k]
+
+
+def summarize(samples: dict[str, list], elapsed: float) -> dict:
+    def stats(items: list) -> dict:
+        lat = sorted(t for t, _ in items)
+        by_status: dict[str, int] = {}
+        for _, st in items:
+            by_status[str(st)] = by_status.get(str(st), 0) + 1
+        errors = sum(1 for _, st in items if not isinstance(st, int) or st >= 400)
+        ms = lambda v: None if v is None else round(v * 1000.0, 1)
+        return {
+            "requests": len(items),
+            "errors": errors,
+            "error_rate": round(errors / len(items), 4) if items else 0.0,
+            "rps": round(len(items) / elapsed, 2) if elapsed else 0.0,
+            "p50_ms": ms(_pct(lat, 50)),
+            "p95_ms": ms(_pct(lat, 95)),
+            "p99_ms": ms(_pct(lat, 99)),
+            "max_ms": ms(lat[-1] if lat else None),
+            "status": dict(sorted(by_status.items())),
+        }
+
+    routes = {name: stats(items) for name, items in samples.items()}
+    routes["ALL"] = stats([s for items in samples.values() for s in items])
+    return routes
+
+
+async def run_load(url: str, ctx: dict, concurrency: int, duration: float, warmup: float) -> dict:
+    samples: dict[str, list] = {name: [] for name in ctx["mix"]}
+    start = time.perf_counter()
+    warm_until = start + warmup
+    stop_at = warm_until + duration
+    await asyncio.gather(*(
+        virtual_user(i, url, ctx, stop_at, warm_until, samples)
+        for i in range(concurrency)
+    ))
+    elapsed = time.perf_counter() - max(warm_until, start)
+    return summarize(samples, elapsed)
+
+
+def print_table(routes: dict) -> None:
+    cols = ("requests", "errors", "error_rate", "rps", "p50_ms", "p95_ms", "p99_ms", "max_ms")
+    print(f"{'ruta':<10}" + "".join(f"{c:>12}" for c in cols), file=sys.stderr)
+    for name, st in routes.items():
+        print(f"{name:<10}" + "".join(f"{st[c]!s:>12}" for c in cols), file=sys.stderr)
+
+
+def main(argv: list[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--url", default=None, help="app ya arrancada (no se lanza uvicorn)")
+    ap.add_argument("--workers", type=int, default=1, help="workers de uvicorn")
+    ap.add_argument("--concurrency", type=int, default=16, help="usuarios virtuales")
+    ap.add_argument("--duration", type=float, default=30.0, help="segundos medidos")
+    ap.add_argument("--warmup", type=float, default=5.0, help="segundos sin medir al principio")
+    ap.add_argument("--mix", default=DEFAULT_MIX)
+    ap.add_argument("--products", type=int, default=20000, help="productos sembrados en la BD sintética")
+    ap.add_argument("--db-latency-ms", type=float, default=15.0, help="latencia por consulta de la BD sintética")
+    ap.add_argument("--image-latency-ms", type=float, default=40.0, help="latencia del servidor de fotos")
+    ap.add_argument("--image-kb", type=int, default=80, help="tamaño de cada foto")
+    ap.add_argument("--timeout", type=float, default=120.0)
+    ap.add_argument("--out", default=None, help="fichero JSON de resultados")
+    args = ap.parse_args(argv)
+
+    mix = parse_mix(args.mix)
+    image_server, image_port = start_image_server(args.image_latency_ms, args.image_kb)
+
+    proc = None
+    workdir = Path(tempfile.mkdtemp(prefix="zproveart_load_"))
+    try:
+        if args.url:
+            url = args.url.rstrip("/")
+        else:
+            proc, url = start_app(args, workdir)
+
+        ctx = {"mix": mix, "products": args.products, "image_port": image_port, "timeout": args.timeout}
+        routes = asyncio.run(run_load(url, ctx, args.concurrency, args.duration, args.warmup))
+    finally:
+        if proc is not None:
+            proc.terminate()
+            try:
+                proc.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+        image_server.shutdown()
+
+    print_table(routes)
+    limitations = [] if args.url else list(LIMITATIONS)
+    for text in limitations:
+        print(f"ojo: {text}", file=sys.stderr)
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "url": args.url or "local",
+            "workers": None if args.url else args.workers,
+            "concurrency": args.concurrency,
+            "duration_s": args.duration,
+            "warmup_s": args.warmup,
+            "mix": mix,
+            "products": args.products,
+            "db_latency_ms": args.db_latency_ms,
+            "image_latency_ms": args.image_latency_ms,
+            "image_kb": args.image_kb,
+            "limitations": limitations,
+        },
+        "routes": routes,
+    }
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.out:
+        Path(args.out).write_text(text + "\n", encoding="utf-8")
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,50 @@
+"""
+La app real con el backend sintético en lugar de SQL Server, para la prueba
+de carga (se arranca con uvicorn, uno o varios workers):
+
+    uvicorn bench.loadtest_app:app --workers 4
+
+Variables:
+    ZPROVEART_FAKE_PRODUCTS      nº de productos sembrados (por defecto 20000)
+    ZPROVEART_FAKE_LATENCY_MS    latencia simulada por consulta (por defecto 15)
+    ZPROVEART_IMAGE_HOST         host del servidor de fotos local (127.0.0.1)
+    ZPROVEART_LOAD_USERS         usuarios load0..loadN-1, contraseña "x" (por defecto 256)
+
+Limitaciones (también van en el informe de bench.loadtest, "limitations"):
+las funciones de app.db.sqlserver se sustituyen por FakeBackend, así que no
+se miden SQL Server, las consultas SQL, pyodbc, el pool de conexiones ni
+_cursor/TracedCursor; las fotos salen de un servidor local. El login sí es
+el real (verify_user + pbkdf2) contra un users.json temporal.
+"""
+from __future__ import annotations
+
+import json
+import os
+import tempfile
+from pathlib import Path
+
+import app.main as main
+from app.routes import fotos
+from bench.fake_backend import FakeBackend, install
+
+backend = FakeBackend(
+    int(os.getenv("ZPROVEART_FAKE_PRODUCTS", "20000")),
+    latency_ms=float(os.getenv("ZPROVEART_FAKE_LATENCY_MS", "15")),
+)
+# Se queda instalado durante toda la vida del proceso (hay que guardar la
+# referencia: si el generador se recolecta, su finally deshace el parche)
+_installed = install(backend)
+_installed.__enter__()
+
+fotos.ALLOWED_HOSTS.add(os.getenv("ZPROVEART_IMAGE_HOST", "127.0.0.1"))
+
+# users.json propio: el login pasa por verify_user y pbkdf2 como en producción
+_users_file = Path(tempfile.mkdtemp(prefix="zproveart_load_users_")) / "users.json"
+_hash = main._pwd_context().hash("x")
+_users_file.write_text(json.dumps({"users": [
+    {"username": f"load{i}", "password_hash": _hash, "active": True}
+    for i in range(int(os.getenv("ZPROVEART_LOAD_USERS", "256")))
+]}), encoding="utf-8")
+main.USERS_FILE = _users_file
+
+app = main.app
@@ -0,0 +1,191 @@
+"""
+Comparativa de los motores de PDF (app/services/pdf_engines.py) sobre el
+mismo lote de tarjetas del backend sintético:
+
+    python -m bench.pdf_engines                         # 1000 y 10000 tarjetas
+    python -m bench.pdf_engines --sizes 200,1000 --engines weasyprint
+    python -m bench.pdf_engines --out pdf_engines.json
+
+Cada caso (motor, n) corre en un proceso aparte, con caché de secciones y
+ajuste de trozos vacíos, y mide _render_products_pdf completo (secciones +
+unión + cabeceras) dos veces: "cold" (arranca navegador / pool) y "warm"
+(segunda exportación en el mismo proceso, sin caché de secciones).
+RSS = pico del proceso y pico del mayor hijo (Chromium / procesos del pool).
+Las fotos las sirve un servidor local (siempre la misma imagen).
+
+Necesita Chromium de Playwright y/o WeasyPrint con Pango; si un motor no
+arranca, su caso queda con "error".
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+DEFAULT_SIZES = (1000, 10000)
+IMAGE = ROOT / "app" / "static" / "images" / "Gerimport.jpg"
+
+
+def start_image_server() -> tuple[ThreadingHTTPServer, int]:
+    body = IMAGE.read_bytes()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header("Content-Type", "image/jpeg")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="fake-images", daemon=True).start()
+    return server, server.server_address[1]
+
+
+def _peak_rss_mb() -> tuple[float | None, float | None]:
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None, None
+    unit = 1024 * 1024 if sys.platform == "darwin" else 1024  # bytes en macOS, KB en Linux
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * unit
+    kids = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * unit
+    return round(own / 2**20, 1), round(kids / 2**20, 1)
+
+
+# =========================
+# Un caso (proceso hijo)
+# =========================
+def run_case(engine: str, n: int, image_port: int) -> dict:
+    import types
+
+    from pypdf import PdfReader
+
+    import app.main as main
+    from app.services import pdf_cache, pdf_engines
+    from app.services.product_formatter import format_products
+    from bench.fake_backend import FakeBackend
+
+    fb = FakeBackend(n)
+    rows = fb.get_products_all(max_rows=n)
+    itmrefs = [r["ITMREF_0"] for r in rows]
+    products = format_products(rows, sales_rows=fb.get_sales_12m(itmrefs), eta_rows=fb.get_eta_rows(itmrefs))
+
+    request = types.SimpleNamespace(base_url=f"http://127.0.0.1:{image_port}/")
+    cards_css, pdf_css = main._read_pdf_css()
+    header_html = main.templates.get_template("partials/pdf_header_playwright.html").render({
+        "request": request, "total": n, "family_list": [],
+    })
+
+    out: dict = {"engine": engine, "n": n}
+    base_cache = pdf_cache.PDF_CACHE_DIR
+    for phase in ("cold", "warm"):
+        pdf_cache.PDF_CACHE_DIR = base_cache / phase  # sin secciones de la fase anterior
+        t0 = time.perf_counter()
+        pdf, used = main._render_products_pdf(
+            request, products,
+            total=n, header_html=header_html, cards_css=cards_css, pdf_css=pdf_css, engine=engine,
+        )
+        out[f"{phase}_s"] = round(time.perf_counter() - t0, 3)
+        if engine != "auto" and used != engine:
+            # la app cae a Chromium; aquí no: los números serían de otro motor
+            raise RuntimeError(f"{engine} no disponible (se usó {used})")
+        out["engine_used"] = used
+    out["pages"] = len(PdfReader(BytesIO(pdf)).pages)
+    out["bytes"] = len(pdf)
+
+    pdf_engines.shutdown_weasyprint(wait=True)  # recoge los hijos para su RSS
+    out["rss_mb"], out["rss_children_mb"] = _peak_rss_mb()
+    return out
+
+
+def _spawn_case(engine: str, n: int, image_port: int, timeout: float) -> dict:
+    workdir = Path(tempfile.mkdtemp(prefix="zproveart_pdfbench_"))
+    env = {
+        **os.environ,
+        "ZPROVEART_EXPORT_DIR": str(workdir / "exports"),
+        "ZPROVEART_PDF_CACHE_DIR": str(workdir / "pdf_cache"),
+        "ZPROVEART_PDF_CHUNK_STATE": str(workdir / "pdf_chunk_tuning.json"),
+        "ZPROVEART_METRICS_DIR": str(workdir / "metrics"),
+    }
+    cmd = [sys.executable, "-m", "bench.pdf_engines", "--case", engine, str(n), str(image_port)]
+    try:
+        p = subprocess.run(cmd, cwd=ROOT, env=env, capture_output=True, text=True, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        return {"engine": engine, "n": n, "error": f"timeout ({timeout:.0f} s)"}
+    if p.returncode != 0:
+        # la última línea "Tipo: mensaje" (Playwright añade recuadros detrás)
+        lines = p.stderr.strip().splitlines() or ["?"]
+        errors = [ln for ln in lines if re.match(r"^[A-Za-z_][\w.]*: ", ln)]
+        return {"engine": engine, "n": n, "error": (errors or lines)[-1][:300]}
+    return json.loads(p.stdout.strip().splitlines()[-1])
+
+
+def print_table(results: list[dict]) -> None:
+    cols = ("cold_s", "warm_s", "pages", "bytes", "rss_mb", "rss_children_mb")
+    print(f"{'motor':<12}{'n':>8}" + "".join(f"{c:>17}" for c in cols), file=sys.stderr)
+    for r in results:
+        if "error" in r:
+            print(f"{r['engine']:<12}{r['n']:>8}  error: {r['error']}", file=sys.stderr)
+            continue
+        print(f"{r['engine']:<12}{r['n']:>8}" + "".join(f"{r[c]!s:>17}" for c in cols), file=sys.stderr)
+
+
+def main(argv: list[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)))
+    ap.add_argument("--engines", default="chromium,weasyprint")
+    ap.add_argument("--timeout", type=float, default=3600.0, help="segundos por caso")
+    ap.add_argument("--out", default=None, help="fichero JSON de resultados")
+    ap.add_argument("--case", nargs=3, metavar=("ENGINE", "N", "PORT"), help=argparse.SUPPRESS)
+    args = ap.parse_args(argv)
+
+    if args.case:
+        engine, n, port = args.case
+        print(json.dumps(run_case(engine, int(n), int(port))))
+        return 0
+
+    server, port = start_image_server()
+    results = []
+    try:
+        for n in (int(s) for s in args.sizes.split(",") if s.strip()):
+            for engine in (e.strip() for e in args.engines.split(",") if e.strip()):
+                print(f"{engine} n={n} ...", file=sys.stderr)
+                results.append(_spawn_case(engine, n, port, args.timeout))
+    finally:
+        server.shutdown()
+
+    print_table(results)
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": sys.version.split()[0],
+            "cpus": os.cpu_count(),
+        },
+        "results": results,
+    }
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.out:
+        Path(args.out).write_text(text + "\n", encoding="utf-8")
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
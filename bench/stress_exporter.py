@@ -0,0 +1,106 @@
+"""
+Estrés multiproceso del exportador: varios procesos anexan al mismo diario
+(como varios workers de uvicorn) y otro materializa el .xlsx a la vez.
+Al final comprueba que no se ha perdido ni corrompido ninguna fila.
+
+    python -m bench.stress_exporter [procesos] [filas_por_proceso] [tam_lote]
+"""
+from __future__ import annotations
+
+import json
+import multiprocessing as mp
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from openpyxl import load_workbook
+
+from app.services.excel_exporter import (
+    ExcelExporter,
+    append_rows_daily,
+    make_row,
+    materialize_daily_xlsx,
+    read_journal,
+)
+
+
+def _writer(export_dir: str, wid: int, n_rows: int, batch: int) -> None:
+    exporter = ExcelExporter(Path(export_dir))
+    pending = []
+    for i in range(n_rows):
+        pending.append(make_row(f"W{wid:02d}-{i:06d}", i % 2 == 0, "stress, \"x\"", "P0001", f"w{wid}"))
+        if len(pending) >= batch:
+            append_rows_daily(exporter, pending)
+            pending = []
+    if pending:
+        append_rows_daily(exporter, pending)
+
+
+def _materializer(export_dir: str, stop) -> None:
+    exporter = ExcelExporter(Path(export_dir))
+    while not stop.is_set():
+        materialize_daily_xlsx(exporter)
+        time.sleep(0.05)
+
+
+def main(processes: int = 4, rows_per_process: int = 2000, batch: int = 1) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        stop = mp.Event()
+        mat = mp.Process(target=_materializer, args=(tmp, stop))
+        mat.start()
+
+        t0 = time.perf_counter()
+        writers = [
+            mp.Process(target=_writer, args=(tmp, w, rows_per_process, batch))
+            for w in range(processes)
+        ]
+        for p in writers:
+            p.start()
+        for p in writers:
+            p.join()
+        elapsed = time.perf_counter() - t0
+
+        stop.set()
+        mat.join()
+
+        exporter = ExcelExporter(Path(tmp))
+        expected = processes * rows_per_process
+
+        raw_lines = exporter.journal_path().read_text("utf-8").splitlines()
+        bad = 0
+        for line in raw_lines:
+            try:
+                json.loads(line)
+            except ValueError:
+                bad += 1
+
+        rows = read_journal(exporter)
+        keys = {r[1] for r in rows}
+
+        xlsx = materialize_daily_xlsx(exporter)
+        ws = load_workbook(xlsx, read_only=True).active
+        xlsx_rows = sum(1 for _ in ws.iter_rows(values_only=True)) - 1
+
+        result = {
+            "processes": processes,
+            "rows_per_process": rows_per_process,
+            "batch": batch,
+            "expected": expected,
+            "journal_lines": len(raw_lines),
+            "corrupt_lines": bad,
+            "unique_rows": len(keys),
+            "xlsx_rows": xlsx_rows,
+            "seconds": round(elapsed, 3),
+            "rows_per_s": round(expected / elapsed, 1) if elapsed else None,
+            "ok": bad == 0 and len(keys) == expected and xlsx_rows == expected,
+        }
+
+    print(json.dumps(result))
+    if not result["ok"]:
+        raise SystemExit(1)
+    return result
+
+
+if __name__ == "__main__":
+    main(*[int(a) for a in sys.argv[1:4]])
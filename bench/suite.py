@@ -0,0 +1,303 @@
+"""
+Suite de benchmarks offline del camino caliente de la galería (sin SQL Server).
+
+    python -m bench.suite                          # 3, 100, 5000 y 50000 productos
+    python -m bench.suite --sizes 3,100 --out bench_results.json
+    python -m bench.suite --compare old.json       # avisa de regresiones
+    python -m bench.suite --backend bench.fake_backend:FakeBackend
+
+Mide format_products (sin y con caché), _attach_sales_12m, _attach_eta, los
+constructores de SQL, el render Jinja de pages/zproveart.html, _merge_pdfs y
+la página /zproveart completa contra el backend sintético. Los resultados
+(JSON) son comparables entre versiones: mismo nombre + mismo n.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import math
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import date, datetime
+from io import BytesIO
+from pathlib import Path
+
+from bench.fake_backend import install, load_backend
+
+DEFAULT_SIZES = (3, 100, 5000, 50000)
+# Presupuesto de tiempo por caso: se repite hasta `repeats` o hasta agotarlo
+CASE_BUDGET_S = 10.0
+# Regresión = más lento que la referencia en este factor (sobre el mejor tiempo)
+REGRESSION_FACTOR = 1.15
+
+# Igual que zproveart_pdf: 100 tarjetas por trozo, ~1 tarjeta por página
+CARDS_PER_PDF_CHUNK = 100
+
+
+def _measure(fn, repeats: int, budget_s: float = CASE_BUDGET_S) -> dict:
+    times: list[float] = []
+    t_start = time.perf_counter()
+    for _ in range(max(1, repeats)):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+        if time.perf_counter() - t_start > budget_s:
+            break
+    return {
+        "best_s": round(min(times), 6),
+        "median_s": round(statistics.median(times), 6),
+        "runs": len(times),
+    }
+
+
+def _bench_request(app):
+    """Request mínima para el render (url_for necesita app/router)."""
+    from starlette.requests import Request
+
+    return Request({
+        "type": "http",
+        "method": "GET",
+        "scheme": "http",
+        "server": ("bench", 80),
+        "path": "/zproveart",
+        "root_path": "",
+        "query_string": b"",
+        "headers": [],
+        "app": app,
+        "router": app.router,
+        "session": {"user": {"username": "bench"}},
+    })
+
+
+def _fake_pdf(pages: int) -> bytes:
+    from pypdf import PdfWriter
+
+    w = PdfWriter()
+    for _ in range(pages):
+        w.add_blank_page(width=842, height=595)
+    out = BytesIO()
+    w.write(out)
+    return out.getvalue()
+
+
+def _git_rev() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, timeout=5,
+        ).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def run_size(backend, n: int, repeats: int) -> list[dict]:
+    import app.main as main
+    from app.services import product_formatter as pf
+
+    results: list[dict] = []
+
+    def add(name: str, fn, reps: int = repeats) -> None:
+        r = {"name": name, "n": n, **_measure(fn, reps)}
+        results.append(r)
+        print(f"  {name:<28} n={n:<6} best={r['best_s']:.4f}s median={r['median_s']:.4f}s runs={r['runs']}", file=sys.stderr)
+
+    products = backend.get_products_all(max_rows=n)
+    itmrefs = [p["ITMREF_0"] for p in products]
+    sales_rows = backend.get_sales_12m(itmrefs)
+    eta_rows = backend.get_eta_rows(itmrefs)
+
+    # formateo
+    add("format_products.uncached",
+        lambda: pf.format_products(products, sales_rows=sales_rows, eta_rows=eta_rows, use_cache=False))
+    pf._PRODUCTS_CACHE.invalidate()
+    pf.format_products(products, sales_rows=sales_rows, eta_rows=eta_rows)
+    add("format_products.warm_cache",
+        lambda: pf.format_products(products, sales_rows=sales_rows, eta_rows=eta_rows))
+    pf._PRODUCTS_CACHE.invalidate()
+
+    add("attach_sales_12m",
+        lambda: pf._attach_sales_12m([{"ITMREF_0": i} for i in itmrefs], sales_rows))
+    add("attach_eta",
+        lambda: pf._attach_eta([{"ITMREF_0": i} for i in itmrefs], eta_rows))
+
+    # render Jinja (la galería pinta 3 por página; con n se mide el coste por tarjeta)
+    formatted = pf.format_products(products, sales_rows=sales_rows, eta_rows=eta_rows, use_cache=False)
+    template = main.templates.get_template("pages/zproveart.html")
+    ctx = {
+        "request": _bench_request(main.app),
+        "products": formatted,
+        "page": 1,
+        "page_size": n,
+        "total_pages": 1,
+        "families": backend.get_fams_cached(),
+        "family_list": [],
+        "subfams_by_fam": {},
+        "subfam_params": [],
+        "date_from": "",
+        "date_to": "",
+        "supp_from": None,
+        "supp_to": None,
+        "comp_from": None,
+        "comp_to": None,
+        "art_from": None,
+        "art_to": None,
+        "user": {"username": "bench"},
+    }
+    add("render.zproveart_html", lambda: template.render(ctx))
+
+    # mismas tarjetas a través de la caché de fragmentos
+    from app.services import card_cache
+
+    def cards_cold():
+        card_cache._CARDS_CACHE.invalidate()
+        template.render({**ctx, "cards": card_cache.render_cards(main.templates.env, "components/product_card.html", formatted)})
+
+    def cards_warm():
+        template.render({**ctx, "cards": card_cache.render_cards(main.templates.env, "components/product_card.html", formatted)})
+
+    add("render.cards_cold", cards_cold)
+    add("render.cards_warm", cards_warm)
+    card_cache._CARDS_CACHE.invalidate()
+
+    # unión de los trozos del PDF
+    n_chunks = math.ceil(n / CARDS_PER_PDF_CHUNK)
+    last = n - (n_chunks - 1) * CARDS_PER_PDF_CHUNK
+    parts = [_fake_pdf(CARDS_PER_PDF_CHUNK)] * (n_chunks - 1) + [_fake_pdf(last)]
+    add("merge_pdfs", lambda: main._merge_pdfs(parts), reps=max(1, repeats // 2))
+
+    # página completa contra el backend sintético (3 productos por página)
+    from fastapi.testclient import TestClient
+
+    with TestClient(main.app) as client:
+        client.post("/login", data={"username": "bench", "password": "bench"}, follow_redirects=False)
+
+        def page():
+            r = client.get("/zproveart", params={"page": "2"}, follow_redirects=False)
+            if r.status_code != 200:
+                raise RuntimeError(f"/zproveart -> {r.status_code}")
+
+        add("page.zproveart", page)
+
+    return results
+
+
+def run_sql_builders(repeats: int) -> list[dict]:
+    from app.db import query_log
+    from app.db import sqlserver as sq
+
+    fams = [f"{i:02d}" for i in range(12)]
+    subfams = {f: [f"{f}{j:02d}" for j in range(4)] for f in fams[:6]}
+    kwargs = dict(
+        families=fams,
+        subfams_by_fam=subfams,
+        date_from=date(2024, 1, 1),
+        date_to=date(2025, 12, 31),
+        supp_from="P00001",
+        supp_to="P09999",
+        comp_from="G001",
+        comp_to="G011",
+        art_from="A0000000",
+        art_to="A9999999",
+        years=[2025, 2024],
+        max_rows=50000,
+    )
+    sql, _ = sq._build_products_all_sql(**kwargs)
+
+    def builders():
+        for _ in range(100):
+            sq._build_products_all_sql(**kwargs)
+
+    def fingerprints():
+        for _ in range(100):
+            query_log.fingerprint(sql)
+
+    out = []
+    for name, fn in (("sql.build_products_all_x100", builders), ("sql.fingerprint_x100", fingerprints)):
+        r = {"name": name, "n": None, **_measure(fn, repeats)}
+        out.append(r)
+        print(f"  {name:<28} best={r['best_s']:.4f}s", file=sys.stderr)
+    return out
+
+
+def compare(current: dict, baseline: dict, factor: float = REGRESSION_FACTOR) -> list[str]:
+    """Lista de regresiones (best_s actual > referencia * factor)."""
+    base = {(r["name"], r["n"]): r for r in baseline.get("results", [])}
+    regressions = []
+    for r in current["results"]:
+        b = base.get((r["name"], r["n"]))
+        if not b or not b["best_s"]:
+            continue
+        ratio = r["best_s"] / b["best_s"]
+        line = f"{r['name']:<28} n={r['n']!s:<6} {b['best_s']:.4f}s -> {r['best_s']:.4f}s  x{ratio:.2f}"
+        print(line, file=sys.stderr)
+        if ratio > factor:
+            regressions.append(line)
+    return regressions
+
+
+def main(argv: list[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)))
+    ap.add_argument("--repeats", type=int, default=5)
+    ap.add_argument("--backend", default="bench.fake_backend:FakeBackend")
+    ap.add_argument("--latency-ms", type=float, default=0.0, help="latencia simulada por consulta")
+    ap.add_argument("--out", default=None, help="fichero JSON de resultados (por defecto, stdout)")
+    ap.add_argument("--compare", default=None, help="JSON de referencia para detectar regresiones")
+    args = ap.parse_args(argv)
+
+    # la app usa rutas relativas (app/static, app/templates)
+    os.chdir(Path(__file__).resolve().parent.parent)
+    import app.main as main
+
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    results: list[dict] = []
+
+    print("sql builders", file=sys.stderr)
+    results += run_sql_builders(args.repeats)
+
+    for n in sizes:
+        print(f"n={n}", file=sys.stderr)
+        backend = load_backend(args.backend, n, latency_ms=args.latency_ms)
+        with install(backend):
+            # el login de bench no existe en users.json: se acepta cualquiera
+            saved_verify = main.verify_user
+            main.verify_user = lambda u, p: True
+            try:
+                results += run_size(backend, n, args.repeats)
+            finally:
+                main.verify_user = saved_verify
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "git_rev": _git_rev(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "backend": args.backend,
+            "latency_ms": args.latency_ms,
+            "repeats": args.repeats,
+        },
+        "results": results,
+    }
+
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.out:
+        Path(args.out).write_text(text + "\n", encoding="utf-8")
+    else:
+        print(text)
+
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text(encoding="utf-8"))
+        regressions = compare(report, baseline)
+        if regressions:
+            print(f"{len(regressions)} regresiones (> x{REGRESSION_FACTOR})", file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
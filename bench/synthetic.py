@@ -0,0 +1,103 @@
+"""
+Datos sintéticos con la misma forma que devuelve app.db.sqlserver
+(columnas de get_products / get_sales_12m / get_eta_rows).
+"""
+from __future__ import annotations
+
+import random
+from datetime import date, timedelta
+from decimal import Decimal
+
+
+def make_products(n: int, seed: int = 1) -> list[dict]:
+    rnd = random.Random(seed)
+    out = []
+    for i in range(n):
+        bps = f"P{(i // 25):05d}"
+        out.append({
+            "ITMREF_0": f"A{i:07d}",
+            "ITMDES_0": f"Artículo sintético {i}",
+            "BPSNUM_0": bps,
+            "URL_0": f"http://192.168.1.82/img/A{i:07d}.jpg" if i % 7 else None,
+            "FUC_0": date(2024, 1, 1) + timedelta(days=i % 600) if i % 11 else None,
+            "UQTY_0": Decimal(rnd.randint(0, 50000)),
+            "FOB_0": Decimal(f"{rnd.uniform(0, 900):.4f}"),
+            "PUE_0": Decimal(f"{rnd.uniform(0, 1200):.4f}"),
+            "PVPT4_0": Decimal(f"{rnd.uniform(0, 2500):.2f}"),
+            "DTO_0": Decimal(f"{rnd.uniform(0, 40):.2f}"),
+            "DIF_0": Decimal(f"{rnd.uniform(-20, 20):.2f}") if i % 5 else None,
+            "ARANCEL_0": Decimal(f"{rnd.uniform(0, 12):.2f}"),
+            "EX_ACT_0": Decimal(rnd.randint(0, 100000)),
+            "EX_DISP_0": Decimal(rnd.randint(-500, 90000)),
+            "EX_PREV_0": Decimal(0) if i % 3 else Decimal(rnd.randint(1, 5000)),
+            "COD_ART_PRO_0": f"PRV-{i}" if i % 4 else "",
+            "MED_PZ_0": "10x20x30" if i % 2 else None,
+            "MED_CJ_0": "40x50x60" if i % 3 else "",
+            "CUBIC_0": Decimal(f"{rnd.uniform(0, 2):.6f}") if i % 6 else Decimal(0),
+            "COD_COM_0": f"G{(i % 12):03d} " if i % 9 else None,
+            "COD_FAM_ZTP": f"{(i % 40):02d}",
+            "COD_SUBFAM_ZTP": f"{(i % 40):02d}{(i % 9):02d}",
+            "BPSNAM_0": f"Proveedor {bps}",
+            "ZFRECUPED_0": Decimal(rnd.choice([0, 15, 30, 60])),
+            "ZNUMPALMIN_0": Decimal(rnd.choice([0, 1, 2, 4])),
+            "ZPLAZOENTRE_0": Decimal(rnd.choice([0, 30, 45, 90])),
+            "ZIMPMINPED_0": Decimal(rnd.choice(["0", "1500.50", "25000"])),
+            "ZVOLMINCOM_0": Decimal(rnd.choice(["0", "12.5", "68"])),
+            "COD_FAM_0": f"{(i % 40):02d}",
+            "DES_FAM_0": f"Familia {(i % 40):02d}",
+            "QTY_PEND_SC_0": Decimal(rnd.randint(0, 3000)),
+            "UNXCAJ_0": Decimal(rnd.choice([1, 6, 12, 24])),
+            "UNXPAL_0": Decimal(rnd.choice([0, 240, 960])),
+            "UNXPAQ_0": None if i % 8 == 0 else Decimal(rnd.choice([1, 2, 3])),
+            "ZPUERTO_0": "VALENCIA" if i % 2 else "",
+            "ZSLIM_0": "S" if i % 3 else None,
+            "CMC_0": Decimal(f"{rnd.uniform(0, 900):.3f}"),
+            "ZVERNTV_0": rnd.choice([0, 1, "1", None]),
+            "ZVTASINSTOCK_0": rnd.choice([0, 1]),
+            "ESTADO_0": "OK" if i % 13 else "BLOQ ",
+            "NUM_CLIENTES_0": rnd.randint(0, 500) if i % 10 else None,
+            "NUM_ENTRADAS_0": rnd.randint(0, 50),
+            "NUM_VENTAS_0": rnd.randint(0, 20000),
+            "NUM_OCU_0": float(rnd.randint(0, 900)),
+        })
+    return out
+
+
+def make_sales_rows(products: list[dict], end: date | None = None, seed: int = 2) -> list[dict]:
+    """~9 de cada 12 meses con movimiento, ordenado como get_sales_12m."""
+    rnd = random.Random(seed)
+    end = end or date.today()
+    out = []
+    for p in products:
+        y, m = end.year, end.month
+        for _ in range(12):
+            if rnd.random() < 0.75:
+                out.append({
+                    "ITMREF_0": p["ITMREF_0"],
+                    "ANNO_0": y,
+                    "MES_0": m,
+                    "COMPRAS_0": Decimal(rnd.randint(0, 9000)) if rnd.random() < 0.8 else None,
+                    "VENTAS_0": Decimal(rnd.randint(0, 12000)),
+                })
+            m -= 1
+            if m == 0:
+                m, y = 12, y - 1
+    out.sort(key=lambda r: (r["ITMREF_0"], -r["ANNO_0"], -r["MES_0"]))
+    return out
+
+
+def make_eta_rows(products: list[dict], seed: int = 3) -> list[dict]:
+    """0..8 fechas previstas por artículo, ordenado como get_eta_rows."""
+    rnd = random.Random(seed)
+    out = []
+    for p in products:
+        d = date(2026, 1, 1)
+        for k in range(rnd.choice([0, 0, 1, 2, 3, 5, 8])):
+            d = d + timedelta(days=rnd.randint(3, 40))
+            out.append({
+                "ITMREF_0": p["ITMREF_0"],
+                "FECHA_0": d,
+                "QTY_0": Decimal(rnd.randint(1, 5000)),
+                "VCR_0": f"SC{rnd.randint(10000, 99999)}" if k % 2 == 0 else None,
+            })
+    return out
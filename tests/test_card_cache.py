@@ -0,0 +1,22 @@
+import os
+
+from jinja2 import Environment, FileSystemLoader
+
+from app.services import card_cache
+
+
+def test_changed_template_is_not_served_from_cache(tmp_path):
+    tpl = tmp_path / "card.html"
+    tpl.write_text("A{{ p.x }}", encoding="utf-8")
+    env = Environment(loader=FileSystemLoader(str(tmp_path)), auto_reload=True)
+
+    assert card_cache.render_cards(env, "card.html", [{"x": 1}]) == ["A1"]
+
+    tpl.write_text("B{{ p.x }}", encoding="utf-8")
+    st = tpl.stat()
+    os.utime(tpl, (st.st_atime, st.st_mtime + 5))  # que auto_reload la vea cambiada
+
+    hits = card_cache.card_cache_stats()["hits"]
+    assert card_cache.render_cards(env, "card.html", [{"x": 1}]) == ["B1"]
+    assert card_cache.render_cards(env, "card.html", [{"x": 1}]) == ["B1"]
+    assert card_cache.card_cache_stats()["hits"] == hits + 1
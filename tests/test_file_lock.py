@@ -0,0 +1,31 @@
+import threading
+import time
+
+from app.services.file_lock import file_lock
+
+
+def test_timeout_gives_up_without_lock(tmp_path):
+    path = tmp_path / "x.lock"
+    held = threading.Event()
+    release = threading.Event()
+
+    def holder():
+        with file_lock(path) as locked:
+            assert locked
+            held.set()
+            release.wait(5)
+
+    t = threading.Thread(target=holder)
+    t.start()
+    held.wait(5)
+    try:
+        t0 = time.monotonic()
+        with file_lock(path, timeout=0.2) as locked:
+            assert not locked
+        assert time.monotonic() - t0 < 2
+    finally:
+        release.set()
+        t.join()
+
+    with file_lock(path, timeout=0.2) as locked:
+        assert locked
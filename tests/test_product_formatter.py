@@ -0,0 +1,90 @@
+import tracemalloc
+from datetime import date
+from decimal import Decimal
+
+import pytest
+
+from app.services import product_formatter as pf
+from bench.synthetic import make_eta_rows, make_products, make_sales_rows
+
+
+def _odd_rows() -> list[dict]:
+    """Filas sintéticas más casos raros: None, cero, texto, float, negativos."""
+    rows = make_products(300)
+    rows[0].update(FOB_0=None, DTO_0="x", UQTY_0=None, CUBIC_0=0, ESTADO_0=None)
+    rows[1].update(ZPLAZOENTRE_0=0, ZFRECUPED_0=None, ZIMPMINPED_0="12,5", EX_ACT_0=-0.0000001)
+    rows[2].update(PVPT4_0=1234567.891, DIF_0=-3, ZVERNTV_0="1", ZVTASINSTOCK_0=True)
+    rows[3].update(COD_COM_0="  ", ESTADO_0=" OK ", MED_PZ_0="", FUC_0=date(2025, 2, 28))
+    rows[4].update(ZNUMPALMIN_0=Decimal("0.00"), ZVOLMINCOM_0=Decimal("-1.5"), CMC_0=None)
+    return rows
+
+
+def test_rows_and_columnar_match():
+    rows = _odd_rows()
+    by_row = pf._format_products_rows(rows)
+    by_col = pf._format_products_columnar(rows)
+
+    assert len(by_row) == len(by_col) == len(rows)
+    for r, c in zip(by_row, by_col):
+        assert r == c, r["ITMREF_0"]
+
+
+def test_columnar_does_not_touch_input():
+    rows = _odd_rows()
+    before = [dict(r) for r in rows]
+    pf._format_products_columnar(rows)
+    assert rows == before
+
+
+@pytest.mark.parametrize("use_cache", [False, True])
+def test_format_products_with_sales_and_eta(use_cache):
+    rows = make_products(120)
+    sales = make_sales_rows(rows)
+    eta = make_eta_rows(rows)
+
+    expected = pf._format_products_rows(rows)
+    pf._attach_sales_12m(expected, sales)
+    pf._attach_eta(expected, eta, max_rows=3)
+
+    got = pf.format_products(rows, sales_rows=sales, eta_rows=eta, use_cache=use_cache)
+    assert got == expected
+
+
+def test_columnar_allocations_20k():
+    """
+    Una copia por producto y cada columna escrita al momento: lo que se
+    reserva de más durante el formateo (pico - lo que queda) es poco frente
+    al resultado. Con las ~45 columnas acumuladas hasta el final era ~13%.
+    """
+    rows = make_products(20000)
+    pf._format_products_columnar(rows[:50])  # cachés internas de Python fuera de la medida
+
+    tracemalloc.start()
+    try:
+        out = pf._format_products_columnar(rows)
+        kept, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    assert len(out) == len(rows)
+    assert all(o is not r for o, r in zip(out, rows))
+    assert peak - kept < 0.06 * kept, (kept, peak)
+
+
+def test_cache_hit_does_not_share_mutable_state():
+    rows = make_products(20)
+    sales = make_sales_rows(rows)
+    eta = make_eta_rows(rows)
+    pf._PRODUCTS_CACHE.invalidate()
+
+    first = pf.format_products(rows, sales_rows=sales, eta_rows=eta)
+    first[0]["ITMDES_0"] = "tocado"
+    second = pf.format_products(rows, sales_rows=sales, eta_rows=eta)
+
+    assert second[0]["ITMDES_0"] == rows[0]["ITMDES_0"]
+    assert pf.product_cache_stats()["hits"] >= len(rows)
+    for p in second:
+        assert isinstance(p["m12"], tuple) and len(p["m12"]) == 12
+        assert isinstance(p["eta"], tuple)
+    with pytest.raises(AttributeError):
+        second[0]["m12"][0].ventas = "1"
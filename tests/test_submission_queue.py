@@ -0,0 +1,55 @@
+import asyncio
+
+import pytest
+
+from app.services.excel_exporter import ExcelExporter, make_row, read_journal, replay_spilled, spill_rows
+from app.services.submission_queue import SubmissionQueue
+
+
+def _run(write, *, spill=None, retries=2):
+    async def go():
+        q = SubmissionQueue(write, max_delay_ms=5, retries=retries, retry_base_ms=1, spill=spill)
+        fut = q.submit(make_row("A0000001", True, "c", "P00001", "u"))
+        try:
+            await fut
+        finally:
+            await q.stop()
+        return q
+
+    return asyncio.run(go())
+
+
+def _failing(times: int, sink: list):
+    calls = {"n": 0}
+
+    def write(rows):
+        calls["n"] += 1
+        if calls["n"] <= times:
+            raise OSError("disco")
+        sink.extend(rows)
+
+    return write
+
+
+def test_retries_until_written():
+    written: list = []
+    q = _run(_failing(2, written))
+    assert len(written) == 1
+    assert q.stats()["retried_batches"] == 1
+    assert q.stats()["failed_batches"] == 0
+
+
+def test_fails_without_spill():
+    with pytest.raises(OSError):
+        _run(_failing(10, []))
+
+
+def test_spills_and_replays(tmp_path):
+    exporter = ExcelExporter(tmp_path)
+    q = _run(_failing(10, []), spill=lambda rows: spill_rows(exporter, rows))
+    assert q.stats()["spilled_rows"] == 1
+    assert read_journal(exporter) == []
+
+    assert replay_spilled(exporter) == 1
+    assert [r[1] for r in read_journal(exporter)] == ["A0000001"]
+    assert replay_spilled(exporter) == 0  # el fichero aparcado ya no está
@@ -0,0 +1,35 @@
+import io
+from datetime import date
+
+from openpyxl import load_workbook
+
+from app.services.xlsx_export import ETA_SLOTS, PRODUCT_COLUMNS, iter_products_xlsx
+from bench.fake_backend import FakeBackend
+
+
+def test_streamed_xlsx_opens_with_openpyxl():
+    fb = FakeBackend(2000)
+    chunks = list(iter_products_xlsx(
+        fb.iter_products_all(max_rows=2000, batch_size=200),
+        sales_fn=fb.get_sales_12m,
+        eta_fn=fb.get_eta_rows,
+    ))
+    assert len(chunks) > 3  # sale a medida que se comprime, no el libro de una vez
+
+    ws = load_workbook(io.BytesIO(b"".join(chunks)), read_only=True).active
+    rows = list(ws.iter_rows(values_only=True))
+    assert len(rows) == 2001
+    assert len(rows[0]) == len(PRODUCT_COLUMNS) + 24 + 3 * ETA_SLOTS + 1
+
+    p = fb.products[1]
+    first = dict(zip(rows[0], rows[2]))
+    assert first["Artículo"] == p["ITMREF_0"]
+    assert first["FOB neto"] == float(p["FOB_0"])
+    assert first["F. ult. compra"].date() == p["FUC_0"]
+
+
+def test_cells_are_escaped():
+    batch = [{"ITMREF_0": "A1", "ITMDES_0": "<a & b>\x01", "FUC_0": date(2025, 1, 31), "UQTY_0": 3}]
+    data = b"".join(iter_products_xlsx([batch], sales_fn=lambda _: [], eta_fn=lambda _: []))
+    row = list(load_workbook(io.BytesIO(data), read_only=True).active.iter_rows(values_only=True))[1]
+    assert row[:2] == ("A1", "<a & b>")